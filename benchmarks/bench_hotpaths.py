@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""Microbenchmarks of the hot paths of the COLLECT, CLUSTER and COMBINE steps on synthetic inputs.
+
+Every benchmark is run at several scales (the number of reads, signatures or clusters grows by a factor
+of 10 from one scale to the next) and reports the median and minimum wall-clock time of several repeats.
+Inputs are generated from a fixed random seed so that results of different runs are comparable.
+
+Usage: python3 benchmarks/bench_hotpaths.py [--scales small,medium] [--benchmarks form_partitions,...]
+                                            [--repeats N] [--output results.json]
+                                            [--compare baseline.json [--threshold 0.1]]
+
+With --compare, the results are compared to those of an earlier run (written with --output) and the script
+exits with status 1 if any benchmark got slower by more than the threshold (default: 10%).
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from collections import OrderedDict
+from statistics import median
+from time import perf_counter
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(HERE, "..", "src")))
+
+from svim.SVIM_input_parsing import parse_arguments
+from svim.SVIM_COLLECT import bam_iterator
+from svim.SVIM_intra import analyze_cigar_indel
+from svim.SVIM_inter import analyze_read_segments
+from svim.SVIM_clustering import form_partitions, clusters_from_partitions, consolidate_clusters_unilocal, consolidate_clusters_bilocal
+from svim.SVIM_merging import flag_cutpaste_candidates, merge_translocations_at_insertions
+from svim.SVIM_translocations import CompletedTranslocations, TranslocationBreakpointIndex
+from svim.SVSignature import SignatureDeletion, SignatureInsertion, SignatureInsertionFrom, SignatureTranslocation
+
+
+SCALES = OrderedDict([("small", 1), ("medium", 10), ("large", 100)])
+CONTIGS = [("chr1", 20000000), ("chr2", 15000000), ("chr3", 10000000)]
+SEED = 42
+
+
+def get_options(working_dir):
+    """Return the default options of the alignment mode."""
+    return parse_arguments("benchmark", ["alignment", working_dir, "input.bam"])
+
+
+# Synthetic inputs
+
+def random_cigar_tuples(rng, read_length, large_indel_rate=0.002):
+    """Generate CIGAR tuples of an aligned read with small indels and occasional indels of 40 to 2000bp."""
+    tuples = [(4, rng.randint(0, 500))]
+    consumed = 0
+    while consumed < read_length:
+        match_length = min(rng.randint(5, 60), read_length - consumed)
+        tuples.append((0, match_length))
+        consumed += match_length
+        if rng.random() < large_indel_rate * match_length:
+            tuples.append((rng.choice([1, 2]), rng.randint(40, 2000)))
+        else:
+            tuples.append((rng.choice([1, 2]), rng.randint(1, 10)))
+    tuples.append((4, rng.randint(0, 500)))
+    return tuples
+
+
+def random_locus(rng):
+    contig, length = rng.choice(CONTIGS)
+    return contig, rng.randint(10000, length - 10000)
+
+
+def clustered_signatures(rng, number, create, support=10):
+    """Generate signatures around number // support random loci with jittered positions and sizes."""
+    signatures = []
+    for locus in range(max(1, number // support)):
+        contig, position = random_locus(rng)
+        size = rng.randint(50, 5000)
+        for read in range(support):
+            start = position + rng.randint(-50, 50)
+            signatures.append(create(contig, start, start + size + rng.randint(-20, 20), "cigar" if rng.random() < 0.7 else "suppl", "read{0}_{1}".format(locus, read)))
+    return signatures
+
+
+def insertion_from_signature(contig, start, end, signature, read):
+    # All signatures of a locus (see clustered_signatures) share the same destination
+    dest_contig, dest_position = random_locus(random.Random(read.split("_")[0]))
+    return SignatureInsertionFrom(contig, start, end, dest_contig, dest_position + start % 100, signature, read)
+
+
+def write_split_read_bam(path, rng, reads, read_length=15000):
+    """Write a queryname-sorted BAM file with reads that are split into 1-3 alignments (primary and supplementary)."""
+    import pysam
+
+    header = {"HD": {"VN": "1.6", "SO": "queryname"}, "SQ": [{"SN": contig, "LN": length} for contig, length in CONTIGS]}
+    with pysam.AlignmentFile(path, "wb", header=header) as bam:
+        for read_index in range(reads):
+            segments = rng.randint(1, 3)
+            breakpoints = sorted(rng.sample(range(1000, read_length - 1000), segments - 1))
+            query_starts = [0] + breakpoints
+            query_ends = breakpoints + [read_length]
+            contig_index = rng.randrange(len(CONTIGS))
+            reference_position = rng.randint(10000, CONTIGS[contig_index][1] - 50000)
+            for segment, (query_start, query_end) in enumerate(zip(query_starts, query_ends)):
+                # Later segments jump forward or backward on the same contig, switch strand or go to another contig
+                if segment > 0:
+                    event = rng.random()
+                    if event < 0.1:
+                        contig_index = rng.randrange(len(CONTIGS))
+                        reference_position = rng.randint(10000, CONTIGS[contig_index][1] - 50000)
+                    else:
+                        reference_position += rng.randint(-3000, 3000)
+                is_reverse = segment > 0 and rng.random() < 0.2
+                left_clip, right_clip = (read_length - query_end, query_start) if is_reverse else (query_start, read_length - query_end)
+                alignment = pysam.AlignedSegment(bam.header)
+                alignment.query_name = "read{0:07d}".format(read_index)
+                alignment.flag = (0 if segment == 0 else 2048) | (16 if is_reverse else 0)
+                alignment.reference_id = contig_index
+                alignment.reference_start = reference_position
+                alignment.mapping_quality = 60
+                alignment.cigartuples = ([(4, left_clip)] if left_clip > 0 else []) + [(0, query_end - query_start)] + ([(4, right_clip)] if right_clip > 0 else [])
+                bam.write(alignment)
+                reference_position += query_end - query_start
+
+
+def get_split_read_bam(scale, working_dir):
+    """Return the path of a BAM file with 1000 * scale split reads, which is shared by the benchmarks."""
+    path = os.path.join(working_dir, "split_reads_{0}.bam".format(scale))
+    if not os.path.exists(path):
+        write_split_read_bam(path, random.Random("{0}/bam/{1}".format(SEED, scale)), 1000 * scale)
+    return path
+
+
+# Benchmarks: each returns a function running the benchmarked code once and the number of processed items
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(function):
+    BENCHMARKS[function.__name__.replace("setup_", "")] = function
+    return function
+
+
+@benchmark
+def setup_analyze_cigar_indel(rng, scale, working_dir):
+    reads = [random_cigar_tuples(rng, rng.randint(1000, 30000)) for read in range(100 * scale)]
+    return lambda: [analyze_cigar_indel(tuples, 40) for tuples in reads], len(reads)
+
+
+@benchmark
+def setup_bam_iterator(rng, scale, working_dir):
+    import pysam
+
+    path = get_split_read_bam(scale, working_dir)
+    def run():
+        with pysam.AlignmentFile(path) as bam:
+            return sum(1 for alignments in bam_iterator(bam))
+    return run, 1000 * scale
+
+
+@benchmark
+def setup_analyze_read_segments(rng, scale, working_dir):
+    import pysam
+
+    path = get_split_read_bam(scale, working_dir)
+    options = get_options(working_dir)
+    bam = pysam.AlignmentFile(path)
+    reads = [(primary[0], supplementary) for primary, supplementary, secondary in bam_iterator(bam) if len(supplementary) > 0]
+    return lambda: [analyze_read_segments(primary, supplementary, bam, options) for primary, supplementary in reads], len(reads)
+
+
+@benchmark
+def setup_form_partitions(rng, scale, working_dir):
+    options = get_options(working_dir)
+    signatures = clustered_signatures(rng, 10000 * scale, SignatureDeletion)
+    return lambda: form_partitions(signatures, options.partition_max_distance), len(signatures)
+
+
+@benchmark
+def setup_clusters_from_partitions(rng, scale, working_dir):
+    options = get_options(working_dir)
+    options.progress_interval = 0
+    partitions = form_partitions(clustered_signatures(rng, 2000 * scale, SignatureDeletion, support=20), options.partition_max_distance)
+    def run():
+        # Partitions with more than 100 signatures are sampled
+        random.seed(SEED)
+        return clusters_from_partitions(partitions, options)
+    return run, len(partitions)
+
+
+@benchmark
+def setup_consolidate_clusters_unilocal(rng, scale, working_dir):
+    options = get_options(working_dir)
+    options.progress_interval = 0
+    random.seed(SEED)
+    clusters = clusters_from_partitions(form_partitions(clustered_signatures(rng, 10000 * scale, SignatureDeletion), options.partition_max_distance), options)
+    return lambda: consolidate_clusters_unilocal(clusters, options), len(clusters)
+
+
+@benchmark
+def setup_consolidate_clusters_bilocal(rng, scale, working_dir):
+    options = get_options(working_dir)
+    options.progress_interval = 0
+    random.seed(SEED)
+    clusters = clusters_from_partitions(form_partitions(clustered_signatures(rng, 10000 * scale, insertion_from_signature), options.partition_max_distance), options)
+    return lambda: consolidate_clusters_bilocal(clusters), len(clusters)
+
+
+def make_signature_clusters(rng, scale, options, create):
+    random.seed(SEED)
+    signatures = clustered_signatures(rng, 5000 * scale, create)
+    clusters = clusters_from_partitions(form_partitions(signatures, options.partition_max_distance), options)
+    if create == insertion_from_signature:
+        return consolidate_clusters_bilocal(clusters)
+    return consolidate_clusters_unilocal(clusters, options)
+
+
+@benchmark
+def setup_flag_cutpaste_candidates(rng, scale, working_dir):
+    options = get_options(working_dir)
+    options.progress_interval = 0
+    deletion_clusters = make_signature_clusters(rng, scale, options, SignatureDeletion)
+    insertion_from_clusters = make_signature_clusters(rng, scale, options, insertion_from_signature)
+    return lambda: flag_cutpaste_candidates(insertion_from_clusters, deletion_clusters, options), len(insertion_from_clusters)
+
+
+@benchmark
+def setup_merge_translocations_at_insertions(rng, scale, working_dir):
+    options = get_options(working_dir)
+    options.progress_interval = 0
+    insertion_clusters = make_signature_clusters(rng, scale, options, SignatureInsertion)
+    # Translocation breakpoints flank half of the inserted regions and are scattered randomly otherwise
+    translocations = []
+    for index, cluster in enumerate(insertion_clusters):
+        dest_contig, dest_position = random_locus(rng)
+        if index % 2 == 0:
+            for read in range(5):
+                translocations.append(SignatureTranslocation(cluster.contig, cluster.start + rng.randint(-20, 20), "fwd", dest_contig, dest_position, "fwd", "suppl", "tra{0}_{1}".format(index, read)))
+                translocations.append(SignatureTranslocation(cluster.contig, cluster.start + rng.randint(-20, 20), "rev", dest_contig, dest_position + cluster.end - cluster.start, "rev", "suppl", "tra{0}_{1}".format(index, read)))
+        contig, position = random_locus(rng)
+        translocations.append(SignatureTranslocation(contig, position, rng.choice(["fwd", "rev"]), dest_contig, dest_position, rng.choice(["fwd", "rev"]), "suppl", "random{0}".format(index)))
+    completed_translocations = CompletedTranslocations(translocations)
+    index_fwdfwd = TranslocationBreakpointIndex(completed_translocations, "fwd", options.trans_partition_max_distance, options.trans_destination_partition_max_distance)
+    index_revrev = TranslocationBreakpointIndex(completed_translocations, "rev", options.trans_partition_max_distance, options.trans_destination_partition_max_distance)
+    return lambda: merge_translocations_at_insertions(index_fwdfwd, index_revrev, insertion_clusters, options), len(insertion_clusters)
+
+
+# Running and comparing
+
+def run_benchmark(name, scale_name, repeats, working_dir):
+    rng = random.Random("{0}/{1}/{2}".format(SEED, name, scale_name))
+    run, items = BENCHMARKS[name](rng, SCALES[scale_name], working_dir)
+    timings = []
+    for repeat in range(repeats):
+        start = perf_counter()
+        run()
+        timings.append(perf_counter() - start)
+    return OrderedDict([("items", items), ("median_s", median(timings)), ("min_s", min(timings)), ("max_s", max(timings)),
+                        ("items_per_s", items / median(timings) if median(timings) > 0 else None)])
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, baseline, threshold):
+    """Print the change of every benchmark relative to the baseline and return the list of regressions."""
+    regressions = []
+    print("\n{0:<38}{1:<8}{2:>12}{3:>12}{4:>9}".format("benchmark", "scale", "baseline", "current", "change"))
+    for name, scales in results["benchmarks"].items():
+        for scale_name, result in scales.items():
+            try:
+                baseline_time = baseline["benchmarks"][name][scale_name]["median_s"]
+            except KeyError:
+                continue
+            change = result["median_s"] / baseline_time - 1 if baseline_time > 0 else 0.0
+            flag = ""
+            if change > threshold:
+                regressions.append((name, scale_name, change))
+                flag = "  REGRESSION"
+            print("{0:<38}{1:<8}{2:>12.4f}{3:>12.4f}{4:>+8.1f}%{5}".format(name, scale_name, baseline_time, result["median_s"], 100 * change, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of SVIM on synthetic inputs")
+    parser.add_argument("--scales", type=str, default="small,medium", help="Comma-separated scales to run from {0} (default: small,medium)".format(",".join(SCALES.keys())))
+    parser.add_argument("--benchmarks", type=str, default=",".join(BENCHMARKS.keys()), help="Comma-separated benchmarks to run (default: all)")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of runs per benchmark and scale (default: 5)")
+    parser.add_argument("--output", type=str, help="Write results as JSON to this file")
+    parser.add_argument("--compare", type=str, help="Compare results to a JSON file written by an earlier run with --output")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown reported as regression with --compare (default: 0.1)")
+    options = parser.parse_args()
+
+    scale_names = options.scales.split(",")
+    names = options.benchmarks.split(",")
+    for scale_name in scale_names:
+        if scale_name not in SCALES:
+            parser.error("Unknown scale {0}".format(scale_name))
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error("Unknown benchmark {0}. Available benchmarks: {1}".format(name, ", ".join(BENCHMARKS.keys())))
+
+    results = OrderedDict([("python", sys.version.split()[0]), ("platform", platform.platform()), ("commit", get_git_commit()),
+                           ("repeats", options.repeats), ("benchmarks", OrderedDict())])
+    print("{0:<38}{1:<8}{2:>10}{3:>12}{4:>14}".format("benchmark", "scale", "items", "median (s)", "items/s"))
+    with tempfile.TemporaryDirectory() as working_dir:
+        for name in names:
+            results["benchmarks"][name] = OrderedDict()
+            for scale_name in scale_names:
+                result = run_benchmark(name, scale_name, options.repeats, working_dir)
+                results["benchmarks"][name][scale_name] = result
+                print("{0:<38}{1:<8}{2:>10}{3:>12.4f}{4:>14.1f}".format(name, scale_name, result["items"], result["median_s"], result["items_per_s"] or 0.0))
+
+    if options.output:
+        with open(options.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_results(results, baseline, options.threshold)
+        if len(regressions) > 0:
+            print("\n{0} benchmark(s) slower than the baseline by more than {1:.0f}%".format(len(regressions), 100 * options.threshold))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
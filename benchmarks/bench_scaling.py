@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""End-to-end scaling benchmark of svim on simulated data with a known truth set.
+
+For every configuration of the grid (coverage x mean read length x SV density), the script simulates
+alignments with planted SVs (see simulate.py), runs 'svim alignment' on them in a fresh interpreter and
+reports the wall-clock time, the peak resident memory (from run_report.json) and the recall and precision
+of the calls in final_results.vcf. Calls match a planted SV of the same family if their breakpoints lie
+within the tolerance: deletions, inversions and tandem duplications are compared by start and end,
+insertions and interspersed duplications (which svim may report as insertions) by their position only.
+Planted translocations are counted but excluded from recall and precision because svim reports them
+as breakends only in the signature files.
+
+Usage: python3 benchmarks/bench_scaling.py [--coverages 5,15,30,60] [--read_lengths 8000]
+                                           [--sv_densities 20] [--contigs 3] [--contig_length 300000]
+                                           [--tolerance 500] [--min_score 0] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from collections import defaultdict
+from itertools import product
+from time import perf_counter
+
+from simulate import simulate
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(HERE, "..", "src")
+SCRIPT = os.path.join(SOURCE_DIR, "svim", "svim")
+# Truth and call types that are compared with each other
+FAMILIES = {"DEL": "deletion",
+            "INV": "inversion",
+            "DUP:TANDEM": "tandem",
+            "INS": "insertion",
+            "INS:NOVEL": "insertion",
+            "DUP:INT": "insertion"}
+POSITION_ONLY_FAMILIES = set(["insertion"])
+
+
+def get_environment():
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.path.abspath(SOURCE_DIR) + os.pathsep + environment.get("PYTHONPATH", "")
+    return environment
+
+
+def parse_list(text, value_type):
+    return [value_type(value) for value in text.split(",") if value != ""]
+
+
+def read_truth(path):
+    truth = []
+    with open(path) as truth_file:
+        for line in truth_file:
+            sv_type, contig, start, end = line.rstrip("\n").split("\t")
+            truth.append((sv_type, contig, int(start), int(end)))
+    return truth
+
+
+def read_calls(path, min_score):
+    """Return the calls in a VCF file as (type, contig, start, end) tuples with 0-based starts."""
+    calls = []
+    with open(path) as vcf_file:
+        for line in vcf_file:
+            if line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if int(fields[5]) < min_score:
+                continue
+            info = dict(entry.split("=", 1) for entry in fields[7].split(";") if "=" in entry)
+            sv_type = info["SVTYPE"]
+            position = int(fields[1]) - 1
+            if sv_type == "DUP:TANDEM":
+                # Tandem duplications are reported at their end
+                calls.append((sv_type, fields[0], position - abs(int(info["SVLEN"])), position))
+            else:
+                calls.append((sv_type, fields[0], position, int(info.get("END", fields[1]))))
+    return calls
+
+
+def evaluate(truth, calls, tolerance):
+    """Match calls to planted SVs one-to-one and return a dictionary with recall and precision overall and per type."""
+    unmatched_truth = defaultdict(list)
+    for entry in truth:
+        if entry[0] in FAMILIES:
+            unmatched_truth[(FAMILIES[entry[0]], entry[1])].append(entry)
+    true_positives = 0
+    compared_calls = [call for call in calls if call[0] in FAMILIES]
+    for sv_type, contig, start, end in compared_calls:
+        family = FAMILIES[sv_type]
+        candidates = unmatched_truth[(family, contig)]
+        best = None
+        for entry in candidates:
+            distance = abs(entry[2] - start) if family in POSITION_ONLY_FAMILIES else max(abs(entry[2] - start), abs(entry[3] - end))
+            if distance <= tolerance and (best == None or distance < best[0]):
+                best = (distance, entry)
+        if best != None:
+            candidates.remove(best[1])
+            true_positives += 1
+    compared_truth = [entry for entry in truth if entry[0] in FAMILIES]
+    missed = defaultdict(int)
+    for entries in unmatched_truth.values():
+        for entry in entries:
+            missed[entry[0]] += 1
+    per_type = {}
+    for sv_type in sorted(set(entry[0] for entry in compared_truth)):
+        planted = sum(1 for entry in compared_truth if entry[0] == sv_type)
+        per_type[sv_type] = {"planted": planted, "recall": (planted - missed[sv_type]) / planted}
+    return {"planted": len(compared_truth),
+            "planted_translocations": sum(1 for entry in truth if entry[0] == "BND"),
+            "calls": len(compared_calls),
+            "true_positives": true_positives,
+            "recall": (len(compared_truth) - sum(missed.values())) / len(compared_truth) if compared_truth else None,
+            "precision": true_positives / len(compared_calls) if compared_calls else None,
+            "recall_by_type": per_type}
+
+
+def run_configuration(directory, configuration, options):
+    bam_path = os.path.join(directory, "reads.bam")
+    working_dir = os.path.join(directory, "svim")
+    start = perf_counter()
+    truth = simulate(bam_path, options.seed, options.contigs, options.contig_length, configuration["sv_density"],
+                     configuration["coverage"], configuration["read_length"])
+    simulation_time = perf_counter() - start
+    start = perf_counter()
+    subprocess.run([sys.executable, SCRIPT, "alignment", working_dir, bam_path] + options.svim_arguments,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=get_environment(), check=True)
+    wall_time = perf_counter() - start
+    with open(os.path.join(working_dir, "run_report.json")) as report_file:
+        report = json.load(report_file)
+    result = dict(configuration)
+    result["simulation_s"] = simulation_time
+    result["wall_time_s"] = wall_time
+    result["peak_rss_bytes"] = report["peak_rss_bytes"]
+    result["stage_times_s"] = dict((stage["name"], stage["wall_time_s"]) for stage in report["stages"])
+    result.update(evaluate(truth, read_calls(os.path.join(working_dir, "final_results.vcf"), options.min_score), options.tolerance))
+    return result
+
+
+def format_ratio(value):
+    return "-" if value == None else "{0:.3f}".format(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark svim end-to-end on simulated data at several scales")
+    parser.add_argument("--coverages", type=str, default="5,15,30,60", help="Comma-separated coverages (default: 5,15,30,60)")
+    parser.add_argument("--read_lengths", type=str, default="8000", help="Comma-separated mean read lengths (default: 8000)")
+    parser.add_argument("--sv_densities", type=str, default="20", help="Comma-separated numbers of planted SVs per megabase (default: 20)")
+    parser.add_argument("--contigs", type=int, default=3, help="Number of simulated contigs (default: 3)")
+    parser.add_argument("--contig_length", type=int, default=300000, help="Length of each simulated contig (default: 300000)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed of the simulation (default: 1)")
+    parser.add_argument("--tolerance", type=int, default=500, help="Maximum breakpoint distance of a matching call (default: 500)")
+    parser.add_argument("--min_score", type=int, default=0, help="Minimum score of calls to evaluate (default: 0)")
+    parser.add_argument("--output", type=str, help="Write results as JSON to this file")
+    parser.add_argument("--keep", type=str, help="Keep the simulated data and svim outputs in this directory")
+    parser.add_argument("svim_arguments", nargs=argparse.REMAINDER, help="Additional arguments for svim (after --)")
+    options = parser.parse_args()
+    if options.svim_arguments[:1] == ["--"]:
+        options.svim_arguments = options.svim_arguments[1:]
+
+    grid = [{"coverage": coverage, "read_length": read_length, "sv_density": sv_density}
+            for coverage, read_length, sv_density in product(parse_list(options.coverages, int), parse_list(options.read_lengths, int), parse_list(options.sv_densities, float))]
+    results = {"python": sys.version.split()[0], "contigs": options.contigs, "contig_length": options.contig_length,
+               "seed": options.seed, "tolerance": options.tolerance, "min_score": options.min_score,
+               "svim_arguments": options.svim_arguments, "configurations": []}
+    print("{0:>8}{1:>10}{2:>10}{3:>12}{4:>14}{5:>9}{6:>8}{7:>8}{8:>11}".format("coverage", "read_len", "density", "wall (s)", "peak RSS (MB)", "planted", "calls", "recall", "precision"))
+    base_directory = options.keep or tempfile.mkdtemp(prefix="svim_scaling_")
+    try:
+        for configuration in grid:
+            directory = os.path.join(base_directory, "cov{coverage}_len{read_length}_density{sv_density:g}".format(**configuration))
+            if os.path.exists(directory):
+                shutil.rmtree(directory)
+            os.makedirs(directory)
+            result = run_configuration(directory, configuration, options)
+            results["configurations"].append(result)
+            print("{0:>8}{1:>10}{2:>10g}{3:>12.2f}{4:>14.1f}{5:>9}{6:>8}{7:>8}{8:>11}".format(
+                result["coverage"], result["read_length"], result["sv_density"], result["wall_time_s"],
+                (result["peak_rss_bytes"] or 0) / 1024 ** 2, result["planted"], result["calls"],
+                format_ratio(result["recall"]), format_ratio(result["precision"])))
+    finally:
+        if not options.keep:
+            shutil.rmtree(base_directory, ignore_errors=True)
+
+    if options.output:
+        with open(options.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Measure the startup time of the svim command line interface.
+
+For each subcommand, the script runs 'svim <subcommand> --help' (and 'svim --version') in fresh interpreters
+and reports the median wall-clock time. With --importtime, it also reports the modules with the highest
+cumulative import time (from python -X importtime) for each subcommand.
+
+Usage: python3 benchmarks/bench_startup.py [--repeats N] [--importtime] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+from statistics import median
+from time import perf_counter
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(HERE, "..", "src")
+SCRIPT = os.path.join(SOURCE_DIR, "svim", "svim")
+COMMANDS = [("version", ["--version"]),
+            ("reads", ["reads", "--help"]),
+            ("alignment", ["alignment", "--help"]),
+            ("report", ["report", "--help"])]
+
+
+def get_environment():
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.path.abspath(SOURCE_DIR) + os.pathsep + environment.get("PYTHONPATH", "")
+    return environment
+
+
+def time_command(arguments, repeats):
+    timings = []
+    for repeat in range(repeats):
+        start = perf_counter()
+        subprocess.run([sys.executable, SCRIPT] + arguments, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=get_environment(), check=True)
+        timings.append(perf_counter() - start)
+    return timings
+
+
+def top_imports(arguments, number):
+    """Return the number modules with the highest cumulative import time in microseconds."""
+    process = subprocess.run([sys.executable, "-X", "importtime", SCRIPT] + arguments, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=get_environment(), universal_newlines=True)
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_time, cumulative_time, module = line[len("import time:"):].split("|")
+        imports.append((int(cumulative_time), module.strip()))
+    imports.sort(reverse=True)
+    return [{"module": module, "cumulative_us": cumulative_time} for cumulative_time, module in imports[:number]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of svim subcommands")
+    parser.add_argument("--repeats", type=int, default=10, help="Number of runs per subcommand (default: 10)")
+    parser.add_argument("--importtime", action="store_true", help="Report the slowest imports of each subcommand")
+    parser.add_argument("--top", type=int, default=10, help="Number of imports to report with --importtime (default: 10)")
+    parser.add_argument("--output", type=str, help="Write results as JSON to this file")
+    options = parser.parse_args()
+
+    # Baseline: startup time of a bare interpreter
+    interpreter_timings = []
+    for repeat in range(options.repeats):
+        start = perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        interpreter_timings.append(perf_counter() - start)
+    results = {"python": sys.version.split()[0], "interpreter_median_s": median(interpreter_timings), "commands": {}}
+    print("{0:<12}{1:>12}{2:>14}".format("command", "median (s)", "over python"))
+    print("{0:<12}{1:>12.4f}{2:>14}".format("python", results["interpreter_median_s"], "-"))
+
+    for name, arguments in COMMANDS:
+        timings = time_command(arguments, options.repeats)
+        result = {"arguments": arguments, "median_s": median(timings), "min_s": min(timings), "max_s": max(timings)}
+        if options.importtime:
+            result["top_imports"] = top_imports(arguments, options.top)
+        results["commands"][name] = result
+        print("{0:<12}{1:>12.4f}{2:>14.4f}".format(name, result["median_s"], result["median_s"] - results["interpreter_median_s"]))
+        if options.importtime:
+            for entry in result["top_imports"]:
+                print("    {0:>10} us  {1}".format(entry["cumulative_us"], entry["module"]))
+
+    if options.output:
+        with open(options.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""Simulate long-read alignments of a random genome with planted structural variants.
+
+The genome consists of random contigs (only their lengths matter because no sequence is aligned). Deletions,
+novel insertions, inversions, tandem duplications and interspersed duplications are planted at roughly even
+distances on each contig and most contigs receive a translocated segment from another contig. Reads are
+sampled from the rearranged contigs and written directly as alignments (primary and supplementary, with SA
+tags) to a BAM file, so no aligner is needed. The planted variants are written to <bam>.truth.tsv with the
+columns type, contig, start and end.
+
+Usage: python3 benchmarks/simulate.py output.bam [--coverage 10] [--read_length 8000] [--sv_density 20]
+                                                 [--contigs 3] [--contig_length 300000] [--sort_order queryname]
+"""
+
+import os
+import random
+import argparse
+
+
+SV_TYPES = ["DEL", "INS", "INV", "DUP:TANDEM", "DUP:INT"]
+
+
+def plant_svs(rng, contigs, svs_per_contig):
+    """Plant SVs into the given contigs ({name: length}). Returns the rearranged contigs as lists of segments
+    and the list of planted variants (type, contig, start, end). Segments are either ('ref', contig, start, end,
+    strand) or ('novel', length). Interspersed duplications with strand '+?' are shown as insertions by half of
+    the reads."""
+    truth = []
+    haplotypes = {}
+    names = list(contigs)
+    for name in names:
+        length = contigs[name]
+        step = length // (svs_per_contig + 1)
+        segments = []
+        last = 0
+        for sv_index in range(svs_per_contig):
+            position = step * (sv_index + 1) + rng.randint(-step // 4, step // 4)
+            if position <= last + 2000:
+                continue
+            sv_type = rng.choice(SV_TYPES)
+            size = rng.randint(100, 3000)
+            if sv_type == "DEL":
+                segments.append(("ref", name, last, position, "+"))
+                last = position + size
+            elif sv_type == "INS":
+                segments.append(("ref", name, last, position, "+"))
+                segments.append(("novel", size))
+                last = position
+            elif sv_type == "INV":
+                segments.append(("ref", name, last, position, "+"))
+                segments.append(("ref", name, position, position + size, "-"))
+                last = position + size
+            elif sv_type == "DUP:TANDEM":
+                segments.append(("ref", name, last, position + size, "+"))
+                last = position
+            else:
+                source_contig = rng.choice(names)
+                source_start = rng.randint(1000, contigs[source_contig] - size - 1000)
+                segments.append(("ref", name, last, position, "+"))
+                segments.append(("ref", source_contig, source_start, source_start + size, rng.choice(["+", "+?"])))
+                last = position
+            truth.append((sv_type, name, position, position + size))
+        if len(names) > 1 and rng.random() < 0.7:
+            other = rng.choice([other_name for other_name in names if other_name != name])
+            translocation_start = rng.randint(1000, contigs[other] - 60000)
+            position = (last + length) // 2
+            segments.append(("ref", name, last, position, "+"))
+            segments.append(("ref", other, translocation_start, translocation_start + 50000, "+"))
+            truth.append(("BND", name, position, position + 1))
+            last = position
+        segments.append(("ref", name, last, length, "+"))
+        haplotypes[name] = segments
+    return haplotypes, truth
+
+
+def get_segment_length(segment):
+    return segment[1] if segment[0] == "novel" else segment[3] - segment[2]
+
+
+def read_pieces(segments, window_start, window_end, rng):
+    """Return the pieces of a read sampled from window_start to window_end of a rearranged contig as
+    ('novel', query start, query end) or ('ref', query start, query end, contig, start, end, strand) tuples."""
+    pieces = []
+    as_insertion = rng.random() < 0.5
+    offset = 0
+    for segment in segments:
+        segment_length = get_segment_length(segment)
+        start, end = max(window_start, offset), min(window_end, offset + segment_length)
+        if start < end:
+            query_start, query_end = start - window_start, end - window_start
+            if segment[0] == "novel" or (segment[4] == "+?" and as_insertion):
+                pieces.append(("novel", query_start, query_end))
+            else:
+                _, contig, segment_start, segment_end, strand = segment
+                if strand in ("+", "+?"):
+                    pieces.append(("ref", query_start, query_end, contig, segment_start + start - offset, segment_start + end - offset, "+"))
+                else:
+                    pieces.append(("ref", query_start, query_end, contig, segment_end - (end - offset), segment_end - (start - offset), "-"))
+        offset += segment_length
+    return pieces
+
+
+def build_alignments(pieces, read_length):
+    """Merge adjacent pieces into alignments with deletions and insertions in their CIGAR strings like an aligner
+    would do for small SVs. Returns a list of (contig, start, strand, cigar tuples, aligned length) tuples."""
+    alignments = []
+    current = None
+    pending_insertion = 0
+    for piece in pieces:
+        if piece[0] == "novel":
+            if current is not None:
+                pending_insertion += piece[2] - piece[1]
+            continue
+        _, query_start, query_end, contig, start, end, strand = piece
+        if current is not None and current["contig"] == contig and current["strand"] == strand and pending_insertion < 2000:
+            if strand == "+" and 0 <= start - current["end"] < 5000:
+                if pending_insertion:
+                    current["operations"].append((1, pending_insertion))
+                if start > current["end"]:
+                    current["operations"].append((2, start - current["end"]))
+                current["operations"].append((0, end - start))
+                current["end"] = end
+                current["query_end"] = query_end
+                pending_insertion = 0
+                continue
+        if current is not None:
+            alignments.append(current)
+        current = {"contig": contig, "strand": strand, "query_start": query_start, "query_end": query_end, "start": start, "end": end, "operations": [(0, end - start)]}
+        pending_insertion = 0
+    if current is not None:
+        alignments.append(current)
+    result = []
+    for alignment in alignments:
+        operations = alignment["operations"]
+        left_clip, right_clip = alignment["query_start"], read_length - alignment["query_end"]
+        if alignment["strand"] == "-":
+            operations = list(reversed(operations))
+            left_clip, right_clip = right_clip, left_clip
+        cigar = ([(4, left_clip)] if left_clip else []) + operations + ([(4, right_clip)] if right_clip else [])
+        result.append((alignment["contig"], alignment["start"], alignment["strand"], cigar, alignment["query_end"] - alignment["query_start"]))
+    return result
+
+
+def cigar_string(cigar):
+    return "".join("{0}{1}".format(length, "MIDNSHP=X"[operation]) for operation, length in cigar)
+
+
+def simulate(path, seed=1, num_contigs=3, contig_length=300000, sv_density=20, coverage=10, read_length=8000, sort_order="queryname"):
+    """Simulate reads with the given coverage and mean length from a genome with sv_density SVs per megabase
+    and write their alignments to path. Returns the list of planted variants."""
+    import pysam
+
+    rng = random.Random(seed)
+    contigs = dict(("chr{0}".format(index + 1), contig_length) for index in range(num_contigs))
+    haplotypes, truth = plant_svs(rng, contigs, max(1, int(sv_density * contig_length / 1000000)))
+    header = {"HD": {"VN": "1.0", "SO": "unsorted"}, "SQ": [{"SN": name, "LN": length} for name, length in contigs.items()]}
+    contig_ids = dict((name, index) for index, name in enumerate(contigs))
+    # Read sequences are slices of a random pool because only their lengths matter
+    sequence_pool = "".join(rng.choice("ACGT") for base in range(4 * read_length))
+    unsorted_path = path + ".unsorted.bam"
+    read_index = 0
+    with pysam.AlignmentFile(unsorted_path, "wb", header=header) as output:
+        for name, segments in haplotypes.items():
+            haplotype_length = sum(get_segment_length(segment) for segment in segments)
+            for read in range(haplotype_length * coverage // read_length):
+                length = min(2 * read_length, max(1000, int(rng.gauss(read_length, read_length / 4))))
+                window_start = rng.randint(0, max(0, haplotype_length - length))
+                window_end = min(haplotype_length, window_start + length)
+                alignments = build_alignments(read_pieces(segments, window_start, window_end, rng), window_end - window_start)
+                if not alignments:
+                    continue
+                read_index += 1
+                pool_offset = rng.randint(0, len(sequence_pool) - (window_end - window_start))
+                sequence = sequence_pool[pool_offset:pool_offset + window_end - window_start]
+                primary_index = max(range(len(alignments)), key=lambda index: alignments[index][4])
+                sa_entries = ["{0},{1},{2},{3},60,0".format(contig, start + 1, strand, cigar_string(cigar)) for contig, start, strand, cigar, aligned_length in alignments]
+                for index, (contig, start, strand, cigar, aligned_length) in enumerate(alignments):
+                    alignment = pysam.AlignedSegment()
+                    alignment.query_name = "read{0}".format(read_index)
+                    alignment.flag = (16 if strand == "-" else 0) | (0 if index == primary_index else 2048)
+                    alignment.reference_id = contig_ids[contig]
+                    alignment.reference_start = start
+                    alignment.mapping_quality = 60
+                    alignment.cigartuples = cigar
+                    if index == primary_index:
+                        alignment.query_sequence = sequence
+                        alignment.query_qualities = pysam.qualitystring_to_array("I" * len(sequence))
+                    # By convention, the SA tag of a supplementary alignment lists the primary alignment first
+                    other_indices = sorted((other_index for other_index in range(len(alignments)) if other_index != index), key=lambda other_index: other_index != primary_index)
+                    other_entries = [sa_entries[other_index] for other_index in other_indices]
+                    if other_entries:
+                        alignment.set_tag("SA", ";".join(other_entries) + ";")
+                    output.write(alignment)
+    if sort_order == "queryname":
+        pysam.sort("-n", "-o", path, unsorted_path)
+    else:
+        pysam.sort("-o", path, unsorted_path)
+        pysam.index(path)
+    os.remove(unsorted_path)
+    with open(path + ".truth.tsv", "w") as truth_file:
+        for entry in truth:
+            print("\t".join(str(value) for value in entry), file=truth_file)
+    return truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate long-read alignments with planted structural variants")
+    parser.add_argument("output", type=str, help="Output BAM file")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    parser.add_argument("--contigs", type=int, default=3, help="Number of contigs (default: 3)")
+    parser.add_argument("--contig_length", type=int, default=300000, help="Length of each contig (default: 300000)")
+    parser.add_argument("--sv_density", type=float, default=20, help="Planted SVs per megabase (default: 20)")
+    parser.add_argument("--coverage", type=int, default=10, help="Sequencing coverage (default: 10)")
+    parser.add_argument("--read_length", type=int, default=8000, help="Mean read length (default: 8000)")
+    parser.add_argument("--sort_order", type=str, default="queryname", choices=["queryname", "coordinate"], help="Sort order of the BAM file (default: queryname)")
+    options = parser.parse_args()
+    truth = simulate(options.output, options.seed, options.contigs, options.contig_length, options.sv_density, options.coverage, options.read_length, options.sort_order)
+    print("Planted {0} variants".format(len(truth)))
+
+
+if __name__ == "__main__":
+    main()
@@ -36,5 +36,6 @@ setup(name='svim',
       package_dir = {"": "src"},
       data_files = [("", ["LICENSE"])],
       zip_safe=False,
-      install_requires=['pysam', 'numpy', 'scipy', 'biopython', 'networkx', 'matplotlib'],
+      install_requires=['pysam', 'numpy', 'scipy', 'biopython', 'networkx'],
+      extras_require={'report': ['matplotlib']},
       scripts=['src/svim/svim'])
@@ -22,6 +22,10 @@ class Candidate:
         return (self.type, contig, (start + end) // 2)
 
 
+    def get_sort_key(self):
+        return self.get_key()
+
+
     def mean_distance_to(self, candidate2):
         """Return distance between means of two candidates."""
         this_contig, this_start, this_end = self.get_source()
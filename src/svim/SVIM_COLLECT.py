@@ -1,8 +1,11 @@
 import logging
-import pysam
 
 from svim.SVIM_intra import analyze_alignment_indel
 from svim.SVIM_inter import analyze_read_segments
+from svim.SVIM_stats import get_run_stats
+from svim.SVIM_hooks import hooks, emit, SequenceView
+from svim.SVIM_progress import get_file_progress, get_compressed_offset, get_alignment_progress
+from svim.SVIM_regions import load_genome_regions, ShardRegions, fetch_alignments
 
 
 def bam_iterator(bam):
@@ -43,6 +46,7 @@ def bam_iterator(bam):
 
 def retrieve_supplementary_alignments(primary_alignment, bam):
     """Reconstruct supplementary alignments for a given primary alignment from the SA tag"""
+    from pysam import AlignedSegment
     try:
         sa_tag = primary_alignment.get_tag("SA").split(";")           
     except KeyError:
@@ -63,7 +67,7 @@ def retrieve_supplementary_alignments(primary_alignment, bam):
         nm = int(fields[5])
 
         # Generate an aligned segment from the information
-        a = pysam.AlignedSegment()
+        a = AlignedSegment()
         a.query_name = primary_alignment.query_name
         a.query_sequence= primary_alignment.query_sequence
         if strand == "+":
@@ -87,62 +91,204 @@ def retrieve_supplementary_alignments(primary_alignment, bam):
     return supplementary_alignments
 
 
-def analyze_alignment_file_querysorted(bam, options):
-    alignment_it = bam_iterator(bam)
+def alignment_in_shard(alignment, bam, shard):
+    """Return whether a mapped alignment lies within the read margin of the view of a shard (see Shard) or of the
+    analyzed regions (see GenomeRegions)."""
+    return alignment.reference_id >= 0 and shard.overlaps(bam.getrname(alignment.reference_id), alignment.reference_start, alignment.reference_end)
+
+
+def retrieve_read_alignments_for_shard(supplementary_alignment, bam, shard, min_mapq):
+    """Reconstruct the primary and supplementary alignments of a read from the SA tag of a supplementary alignment
+    in a shard. By convention, the first SA entry is the primary alignment. Returns a tuple
+    (primary alignment, supplementary alignments) if the primary alignment passes the mapping quality threshold
+    but lies outside of the shard and if this is the first good alignment of the read in the shard (so that every read
+    is analyzed once per shard). Otherwise, returns None."""
+    if supplementary_alignment.is_unmapped or supplementary_alignment.mapping_quality < min_mapq:
+        return None
+    other_alignments = retrieve_supplementary_alignments(supplementary_alignment, bam)
+    if len(other_alignments) == 0:
+        return None
+    primary_alignment = other_alignments[0]
+    if primary_alignment.reference_id < 0 or alignment_in_shard(primary_alignment, bam, shard) or primary_alignment.mapping_quality < min_mapq:
+        return None
+    def alignment_order(alignment):
+        return (alignment.reference_id, alignment.reference_start, alignment.is_reverse, alignment.cigarstring)
+    for alignment in other_alignments[1:]:
+        if alignment_in_shard(alignment, bam, shard) and alignment.mapping_quality >= min_mapq and alignment_order(alignment) < alignment_order(supplementary_alignment):
+            return None
+    return primary_alignment, other_alignments[1:] + [supplementary_alignment]
+
+
+def record_read_counts(processed_reads, skipped, filtered_supplementary):
+    """Add the numbers of processed and skipped reads (by reason) to the run statistics."""
+    stats = get_run_stats()
+    stats.count("reads_processed", processed_reads)
+    for reason, number in skipped.items():
+        stats.count("skipped_" + reason, number)
+    stats.count("supplementary_alignments_filtered", filtered_supplementary)
+
+
+def emit_reads_processed(read_nr, sv_signatures, batch_start):
+    """Pass the signatures found since batch_start to the reads_processed hooks and return the start of the next batch."""
+    emit("reads_processed", read_nr, SequenceView(sv_signatures, batch_start))
+    return len(sv_signatures)
 
+
+def analyze_read(primary, supplementaries, bam, options):
+    """Return the signatures from within and between the alignments of a read."""
     sv_signatures = []
+    if not options.skip_indel:
+        sv_signatures.extend(analyze_alignment_indel(primary, bam, primary.query_name, options))
+        for alignment in supplementaries:
+            sv_signatures.extend(analyze_alignment_indel(alignment, bam, alignment.query_name, options))
+    if not options.skip_segment:
+        sv_signatures.extend(analyze_read_segments(primary, supplementaries, bam, options))
+    return sv_signatures
+
+
+def analyze_alignment_file_querysorted(bam, options, budget=None, shard=None):
+    alignment_it = bam_iterator(bam)
+    sv_signatures = []
+    progress = get_file_progress(bam, "COLLECT", options.progress_interval, sv_signatures)
     read_nr = 0
+    iteration_nr = 0
+    batch_start = 0
+    # Reads skipped by reason and filtered supplementary alignments
+    skipped_reads = {"no_single_primary": 0, "unmapped": 0, "low_mapq": 0}
+    if shard != None:
+        skipped_reads["outside_regions"] = 0
+    filtered_supplementary = 0
 
     while True:
         try:
             alignment_iterator_object = next(alignment_it)
+            iteration_nr += 1
+            if iteration_nr % 1000 == 0:
+                progress.update(read_nr, get_compressed_offset(bam))
+                if "reads_processed" in hooks:
+                    batch_start = emit_reads_processed(read_nr, sv_signatures, batch_start)
+                if budget != None:
+                    spilled = budget.check_collect(sv_signatures)
+                    if spilled > 0:
+                        progress.removed_results += spilled
+                        batch_start = 0
             primary_aln, suppl_aln, sec_aln = alignment_iterator_object
             if len(primary_aln) != 1 or primary_aln[0].is_unmapped or primary_aln[0].mapping_quality < options.min_mapq:
+                if len(primary_aln) != 1:
+                    skipped_reads["no_single_primary"] += 1
+                elif primary_aln[0].is_unmapped:
+                    skipped_reads["unmapped"] += 1
+                else:
+                    skipped_reads["low_mapq"] += 1
                 continue
-            read_nr += 1
-            if read_nr % 10000 == 0:
-                logging.info("Processed read {0}".format(read_nr))
             good_suppl_alns = [aln for aln in suppl_aln if not aln.is_unmapped and aln.mapping_quality >= options.min_mapq]
-            if not options.skip_indel:
-                sv_signatures.extend(analyze_alignment_indel(primary_aln[0], bam, primary_aln[0].query_name, options))
-                for alignment in good_suppl_alns:
-                    sv_signatures.extend(analyze_alignment_indel(alignment, bam, alignment.query_name, options))
-            if not options.skip_segment:
-                sv_signatures.extend(analyze_read_segments(primary_aln[0], good_suppl_alns, bam, options))
+            # Only analyze reads with an alignment in the shard or the analyzed regions
+            if shard != None and not any(alignment_in_shard(aln, bam, shard) for aln in primary_aln + good_suppl_alns):
+                skipped_reads["outside_regions"] += 1
+                continue
+            read_nr += 1
+            filtered_supplementary += len(suppl_aln) - len(good_suppl_alns)
+            read_signatures = analyze_read(primary_aln[0], good_suppl_alns, bam, options)
+            sv_signatures.extend(read_signatures if shard == None else shard.select_signatures(read_signatures))
         except StopIteration:
             break
         except KeyboardInterrupt:
             logging.warning('Execution interrupted by user. Stop detection and continue with next step..')
             break
+    progress.finish(read_nr)
+    if "reads_processed" in hooks:
+        emit_reads_processed(read_nr, sv_signatures, batch_start)
+    record_read_counts(read_nr, skipped_reads, filtered_supplementary)
     return sv_signatures
 
 
-def analyze_alignment_file_coordsorted(bam, options):
-    alignment_it = bam.fetch(until_eof=True, multiple_iterators=True)
-
+def analyze_alignment_file_coordsorted(bam, options, budget=None, shard=None):
+    if shard != None:
+        # Only the BGZF blocks of the read regions are decompressed
+        alignment_it = fetch_alignments(bam, shard.get_read_regions())
+    else:
+        alignment_it = bam.fetch(until_eof=True, multiple_iterators=True)
     sv_signatures = []
+    progress = get_alignment_progress(bam, "COLLECT", options.progress_interval, sv_signatures, shard.get_read_regions() if shard != None else None)
     read_nr = 0
+    alignment_nr = 0
+    batch_start = 0
+    # Alignments skipped by reason and filtered supplementary alignments
+    skipped_alignments = {"unmapped": 0, "supplementary": 0, "secondary": 0, "low_mapq": 0}
+    filtered_supplementary = 0
 
     while True:
         try:
             current_alignment = next(alignment_it)
-            if current_alignment.is_unmapped or current_alignment.is_supplementary or current_alignment.is_secondary or current_alignment.mapping_quality < options.min_mapq:
-                continue
+            alignment_nr += 1
+            if alignment_nr % 1000 == 0:
+                progress.update(read_nr, alignment_nr)
+                if "reads_processed" in hooks:
+                    batch_start = emit_reads_processed(read_nr, sv_signatures, batch_start)
+                if budget != None:
+                    spilled = budget.check_collect(sv_signatures)
+                    if spilled > 0:
+                        progress.removed_results += spilled
+                        batch_start = 0
+            if shard != None and current_alignment.is_supplementary:
+                # Reads with their primary alignment on another shard are analyzed from a supplementary alignment
+                read_alignments = retrieve_read_alignments_for_shard(current_alignment, bam, shard, options.min_mapq)
+            else:
+                read_alignments = None
+            if read_alignments == None:
+                if current_alignment.is_unmapped or current_alignment.is_supplementary or current_alignment.is_secondary or current_alignment.mapping_quality < options.min_mapq:
+                    if current_alignment.is_unmapped:
+                        skipped_alignments["unmapped"] += 1
+                    elif current_alignment.is_supplementary:
+                        skipped_alignments["supplementary"] += 1
+                    elif current_alignment.is_secondary:
+                        skipped_alignments["secondary"] += 1
+                    else:
+                        skipped_alignments["low_mapq"] += 1
+                    continue
+                read_alignments = (current_alignment, retrieve_supplementary_alignments(current_alignment, bam))
+            primary_alignment, supplementary_alignments = read_alignments
             read_nr += 1
-            if read_nr % 10000 == 0:
-                logging.info("Processed read {0}".format(read_nr))
-            supplementary_alignments = retrieve_supplementary_alignments(current_alignment, bam)
             good_suppl_alns = [aln for aln in supplementary_alignments if not aln.is_unmapped and aln.mapping_quality >= options.min_mapq]
-
-            if not options.skip_indel:
-                sv_signatures.extend(analyze_alignment_indel(current_alignment, bam, current_alignment.query_name, options))
-                for alignment in good_suppl_alns:
-                    sv_signatures.extend(analyze_alignment_indel(alignment, bam, alignment.query_name, options))
-            if not options.skip_segment:
-                sv_signatures.extend(analyze_read_segments(current_alignment, good_suppl_alns, bam, options))
+            filtered_supplementary += len(supplementary_alignments) - len(good_suppl_alns)
+            read_signatures = analyze_read(primary_alignment, good_suppl_alns, bam, options)
+            sv_signatures.extend(read_signatures if shard == None else shard.select_signatures(read_signatures))
         except StopIteration:
             break
         except KeyboardInterrupt:
             logging.warning('Execution interrupted by user. Stop detection and continue with next step..')
             break
-    return sv_signatures
\ No newline at end of file
+    progress.finish(read_nr)
+    if "reads_processed" in hooks:
+        emit_reads_processed(read_nr, sv_signatures, batch_start)
+    record_read_counts(read_nr, skipped_alignments, filtered_supplementary)
+    return sv_signatures
+
+
+def analyze_alignment_file(bam, options, budget=None, shard=None):
+    """Collect signatures from a queryname-sorted or coordinate-sorted alignment file (alignment files created
+    in 'reads' mode are always queryname-sorted). If a shard is given, only the signatures in its view are
+    collected (see Shard). If regions are given with --regions or --exclude, only the signatures in these regions
+    are collected (see GenomeRegions). Returns None if the file cannot be processed."""
+    regions = load_genome_regions(options, bam.references, bam.lengths)
+    if regions != None:
+        logging.info("Restricting the analysis to {0} bp in {1} contigs.".format(regions.get_length(), len(regions.intervals)))
+        shard = regions if shard == None else ShardRegions(shard, regions)
+    if options.sub == 'reads':
+        return analyze_alignment_file_querysorted(bam, options, budget, shard)
+    try:
+        sort_order = bam.header["HD"]["SO"]
+    except KeyError:
+        logging.error("Is the given input BAM file sorted? It does not contain a sorting order in its header line.")
+        return None
+    if sort_order == "coordinate":
+        logging.warning("Input BAM file is coordinate-sorted. SVIM can process it but will be less accurate than for queryname-sorted input. It is highly recommended to sort the BAM file by queryname using samtools sort -n.")
+        if shard != None and not bam.has_index():
+            logging.error("Sharded or region-restricted analysis of a coordinate-sorted BAM file requires an index. Please index the file using samtools index.")
+            return None
+        return analyze_alignment_file_coordsorted(bam, options, budget, shard)
+    elif sort_order == "queryname":
+        return analyze_alignment_file_querysorted(bam, options, budget, shard)
+    else:
+        logging.error("Input BAM file needs to be queryname-sorted (highly recommended) or coordinate-sorted. The given file, however, is unsorted according to its header line.")
+        return None
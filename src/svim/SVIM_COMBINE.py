@@ -1,12 +1,18 @@
 import os
 import logging
 
-from collections import defaultdict
-from math import pow, sqrt
+from collections import OrderedDict
 
-from svim.SVIM_clustering import form_partitions, partition_and_cluster_candidates
+from svim.SVIM_clustering import partition_and_cluster_candidates
 from svim.SVCandidate import CandidateInversion, CandidateDuplicationTandem, CandidateDeletion, CandidateNovelInsertion
 from svim.SVIM_merging import flag_cutpaste_candidates, merge_translocations_at_insertions
+from svim.SVIM_intervals import SortedIntervals, join_overlapping, compact
+from svim.SVIM_translocations import TranslocationBreakpointIndex
+from svim.SVIM_output import open_vcf_output, write_vcf_records, write_bed_file
+from svim.SVIM_export import export_candidates
+from svim.SVIM_stats import get_run_stats
+from svim.SVIM_progress import ProgressReporter
+from svim.SVIM_hooks import hooks, emit, ReadOnlyView
 
 
 def cluster_sv_candidates(int_duplication_candidates, options):
@@ -17,90 +23,82 @@ def cluster_sv_candidates(int_duplication_candidates, options):
     return final_int_duplication_candidates
 
 
-def write_candidates(working_dir, candidates):
+def write_candidates(working_dir, candidates, contig_names, contig_lengths, index=False, threads=1, progress_interval=0):
     int_duplication_candidates, inversion_candidates, tan_duplication_candidates, deletion_candidates, novel_insertion_candidates = candidates
 
     if not os.path.exists(working_dir + '/candidates'):
         os.mkdir(working_dir + '/candidates')
-    deletion_candidate_output = open(working_dir + '/candidates/candidates_deletions.bed', 'w')
-    inversion_candidate_output = open(working_dir + '/candidates/candidates_inversions.bed', 'w')
-    tandem_duplication_candidate_source_output = open(working_dir + '/candidates/candidates_tan_duplications_source.bed', 'w')
-    tandem_duplication_candidate_dest_output = open(working_dir + '/candidates/candidates_tan_duplications_dest.bed', 'w')
-    interspersed_duplication_candidate_source_output = open(working_dir + '/candidates/candidates_int_duplications_source.bed', 'w')
-    interspersed_duplication_candidate_dest_output = open(working_dir + '/candidates/candidates_int_duplications_dest.bed', 'w')
-    novel_insertion_candidate_output = open(working_dir + '/candidates/candidates_novel_insertions.bed', 'w')
-
-    for candidate in deletion_candidates:
-        print(candidate.get_bed_entry(), file=deletion_candidate_output)
-    for candidate in int_duplication_candidates:
-        bed_entries = candidate.get_bed_entries()
-        print(bed_entries[0], file=interspersed_duplication_candidate_source_output)
-        print(bed_entries[1], file=interspersed_duplication_candidate_dest_output)
-    for candidate in inversion_candidates:
-        print(candidate.get_bed_entry(), file=inversion_candidate_output)
-    for candidate in tan_duplication_candidates:
-        bed_entries = candidate.get_bed_entries()
-        print(bed_entries[0], file=tandem_duplication_candidate_source_output)
-        print(bed_entries[1], file=tandem_duplication_candidate_dest_output)
-    for candidate in novel_insertion_candidates:
-        print(candidate.get_bed_entry(), file=novel_insertion_candidate_output)
-
-    deletion_candidate_output.close()
-    inversion_candidate_output.close()
-    interspersed_duplication_candidate_source_output.close()
-    interspersed_duplication_candidate_dest_output.close()
-    tandem_duplication_candidate_source_output.close()
-    tandem_duplication_candidate_dest_output.close()
-
-
-def write_final_vcf(working_dir, int_duplication_candidates, inversion_candidates, tandem_duplication_candidates, deletion_candidates, novel_insertion_candidates, version, contig_names, contig_lengths, sample):
-    vcf_output = open(working_dir + '/final_results.vcf', 'w')
+    max_contig_length = max(contig_lengths, default=0)
+    # Bilocal candidates are written into a source and a destination file
+    total = len(deletion_candidates) + 2 * len(int_duplication_candidates) + len(inversion_candidates) + 2 * len(tan_duplication_candidates) + len(novel_insertion_candidates)
+    progress = ProgressReporter(get_run_stats().get_current_stage() or "COMBINE", progress_interval, "records", total)
+    written = [0]
+
+    def count(lines):
+        for line in lines:
+            written[0] += 1
+            if written[0] % 1000 == 0:
+                progress.update(written[0])
+            yield line
+
+    def write(file_name, lines):
+        write_bed_file(working_dir + '/candidates/' + file_name, count(lines), contig_names, index, threads, max_contig_length)
+
+    write('candidates_deletions.bed', (candidate.get_bed_entry() for candidate in deletion_candidates))
+    bed_entries = [candidate.get_bed_entries() for candidate in int_duplication_candidates]
+    write('candidates_int_duplications_source.bed', (source_entry for source_entry, dest_entry in bed_entries))
+    write('candidates_int_duplications_dest.bed', (dest_entry for source_entry, dest_entry in bed_entries))
+    write('candidates_inversions.bed', (candidate.get_bed_entry() for candidate in inversion_candidates))
+    bed_entries = [candidate.get_bed_entries() for candidate in tan_duplication_candidates]
+    write('candidates_tan_duplications_source.bed', (source_entry for source_entry, dest_entry in bed_entries))
+    write('candidates_tan_duplications_dest.bed', (dest_entry for source_entry, dest_entry in bed_entries))
+    write('candidates_novel_insertions.bed', (candidate.get_bed_entry() for candidate in novel_insertion_candidates))
+    progress.finish(written[0])
+
+
+def write_final_vcf(working_dir, int_duplication_candidates, inversion_candidates, tandem_duplication_candidates, deletion_candidates, novel_insertion_candidates, version, contig_names, contig_lengths, sample, compress=False, threads=1, progress_interval=0):
+    vcf_output = open_vcf_output(working_dir + '/final_results.vcf', compress, threads, max(contig_lengths, default=0))
 
     # Write header lines
-    print("##fileformat=VCFv4.2", file=vcf_output)
-    print("##source=SVIMV{0}".format(version), file=vcf_output)
-    #print("##reference={0}".format(genome), file=vcf_output)
+    vcf_output.write_header("##fileformat=VCFv4.2")
+    vcf_output.write_header("##source=SVIMV{0}".format(version))
+    #vcf_output.write_header("##reference={0}".format(genome))
     for contig_name, contig_length in zip(contig_names, contig_lengths):
-        print("##contig=<ID={0},length={1}>".format(contig_name, contig_length), file=vcf_output)
-    print("##ALT=<ID=DEL,Description=\"Deletion\">", file=vcf_output)
-    print("##ALT=<ID=INV,Description=\"Inversion\">", file=vcf_output)
-    print("##ALT=<ID=DUP,Description=\"Duplication\">", file=vcf_output)
-    print("##ALT=<ID=DUP:TANDEM,Description=\"Tandem Duplication\">", file=vcf_output)
-    print("##ALT=<ID=DUP:INT,Description=\"Interspersed Duplication\">", file=vcf_output)
-    print("##ALT=<ID=INS,Description=\"Insertion\">", file=vcf_output)
-    print("##ALT=<ID=INS:NOVEL,Description=\"Novel Insertion\">", file=vcf_output)
-    print("##INFO=<ID=SVTYPE,Number=1,Type=String,Description=\"Type of structural variant\">", file=vcf_output)
-    print("##INFO=<ID=CUTPASTE,Number=0,Type=Flag,Description=\"Genomic origin of interspersed duplication seems to be deleted\">", file=vcf_output)
-    print("##INFO=<ID=END,Number=1,Type=Integer,Description=\"End position of the variant described in this record\">", file=vcf_output)
-    print("##INFO=<ID=SVLEN,Number=1,Type=Integer,Description=\"Difference in length between REF and ALT alleles\">", file=vcf_output)
-    print("##INFO=<ID=STD_SPAN,Number=1,Type=Float,Description=\"Standard deviation in span of merged SV signatures\">", file=vcf_output)
-    print("##INFO=<ID=STD_POS,Number=1,Type=Float,Description=\"Standard deviation in position of merged SV signatures\">", file=vcf_output)
-    print("##FILTER=<ID=q20,Description=\"Quality below 20\">", file=vcf_output)
-    print("##FILTER=<ID=q30,Description=\"Quality below 30\">", file=vcf_output)
-    print("##FORMAT=<ID=GT,Number=1,Type=String,Description=\"Genotype\">", file=vcf_output)
-    print("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t" + sample, file=vcf_output)
-
-    vcf_entries = []
-    for candidate in deletion_candidates:
-        vcf_entries.append((candidate.get_source(), candidate.get_vcf_entry()))
-    for candidate in inversion_candidates:
-        vcf_entries.append((candidate.get_source(), candidate.get_vcf_entry()))
-    for candidate in tandem_duplication_candidates:
-        vcf_entries.append((candidate.get_destination(), candidate.get_vcf_entry()))
-    for candidate in int_duplication_candidates:
-        vcf_entries.append((candidate.get_destination(), candidate.get_vcf_entry()))
-    for candidate in novel_insertion_candidates:
-        vcf_entries.append((candidate.get_destination(), candidate.get_vcf_entry()))
-
-    # Sort and write entries to VCF
-    for source, entry in sorted(vcf_entries, key=lambda pair: pair[0]):
-        print(entry, file=vcf_output)
+        vcf_output.write_header("##contig=<ID={0},length={1}>".format(contig_name, contig_length))
+    vcf_output.write_header("##ALT=<ID=DEL,Description=\"Deletion\">")
+    vcf_output.write_header("##ALT=<ID=INV,Description=\"Inversion\">")
+    vcf_output.write_header("##ALT=<ID=DUP,Description=\"Duplication\">")
+    vcf_output.write_header("##ALT=<ID=DUP:TANDEM,Description=\"Tandem Duplication\">")
+    vcf_output.write_header("##ALT=<ID=DUP:INT,Description=\"Interspersed Duplication\">")
+    vcf_output.write_header("##ALT=<ID=INS,Description=\"Insertion\">")
+    vcf_output.write_header("##ALT=<ID=INS:NOVEL,Description=\"Novel Insertion\">")
+    vcf_output.write_header("##INFO=<ID=SVTYPE,Number=1,Type=String,Description=\"Type of structural variant\">")
+    vcf_output.write_header("##INFO=<ID=CUTPASTE,Number=0,Type=Flag,Description=\"Genomic origin of interspersed duplication seems to be deleted\">")
+    vcf_output.write_header("##INFO=<ID=END,Number=1,Type=Integer,Description=\"End position of the variant described in this record\">")
+    vcf_output.write_header("##INFO=<ID=SVLEN,Number=1,Type=Integer,Description=\"Difference in length between REF and ALT alleles\">")
+    vcf_output.write_header("##INFO=<ID=STD_SPAN,Number=1,Type=Float,Description=\"Standard deviation in span of merged SV signatures\">")
+    vcf_output.write_header("##INFO=<ID=STD_POS,Number=1,Type=Float,Description=\"Standard deviation in position of merged SV signatures\">")
+    vcf_output.write_header("##FILTER=<ID=q20,Description=\"Quality below 20\">")
+    vcf_output.write_header("##FILTER=<ID=q30,Description=\"Quality below 30\">")
+    vcf_output.write_header("##FORMAT=<ID=GT,Number=1,Type=String,Description=\"Genotype\">")
+    vcf_output.write_header("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t" + sample)
+
+    # Write entries to VCF sorted by position, contig by contig in the order of the header
+    total = len(deletion_candidates) + len(inversion_candidates) + len(tandem_duplication_candidates) + len(int_duplication_candidates) + len(novel_insertion_candidates)
+    progress = ProgressReporter(get_run_stats().get_current_stage() or "COMBINE", progress_interval, "records", total)
+    write_vcf_records(vcf_output, contig_names, [(deletion_candidates, lambda candidate: candidate.get_source()[0]),
+                                                 (inversion_candidates, lambda candidate: candidate.get_source()[0]),
+                                                 (tandem_duplication_candidates, lambda candidate: candidate.get_destination()[0]),
+                                                 (int_duplication_candidates, lambda candidate: candidate.get_destination()[0]),
+                                                 (novel_insertion_candidates, lambda candidate: candidate.get_destination()[0])], progress)
+    progress.finish(total)
 
     vcf_output.close()
 
 
 def combine_clusters(signature_clusters, working_dir, options, version, contig_names, contig_lengths, sample):
     deletion_signature_clusters, insertion_signature_clusters, inversion_signature_clusters, tandem_duplication_signature_clusters, insertion_from_signature_clusters, completed_translocations = signature_clusters
+    stats = get_run_stats()
 
     ###############################
     # Create inversion candidates #
@@ -123,101 +121,51 @@ def combine_clusters(signature_clusters, working_dir, options, version, contig_n
     # Merge translocation breakpoints #
     ###################################
 
-    # Cluster translocations by contig and pos1
-    logging.info("Cluster translocation breakpoints..")
-    translocations_fwdfwd = [tra for tra in completed_translocations if tra.direction1 == "fwd" and tra.direction2 == "fwd"]
-    translocations_revrev = [tra for tra in completed_translocations if tra.direction1 == "rev" and tra.direction2 == "rev"]
-    translocation_partitions_fwdfwd = form_partitions(translocations_fwdfwd, options.trans_partition_max_distance)
-    translocation_partitions_revrev = form_partitions(translocations_revrev, options.trans_partition_max_distance)
-
-    translocation_partitions_fwdfwd_dict = defaultdict(list)
-    translocation_partitions_revrev_dict = defaultdict(list)
-    for partition in translocation_partitions_fwdfwd:
-        translocation_partitions_fwdfwd_dict[partition[0].contig1].append(partition)
-    for partition in translocation_partitions_revrev:
-        translocation_partitions_revrev_dict[partition[0].contig1].append(partition)
-
-    translocation_partition_means_fwdfwd_dict = {}
-    translocation_partition_stds_fwdfwd_dict = {}
-    for contig in translocation_partitions_fwdfwd_dict.keys():
-        translocation_partition_means_fwdfwd_dict[contig] = [int(round(sum([ev.pos1 for ev in partition]) / len(partition))) for partition in translocation_partitions_fwdfwd_dict[contig]]
-        translocation_partition_stds_fwdfwd_dict[contig] = [int(round(sqrt(sum([pow(abs(ev.pos1 - translocation_partition_means_fwdfwd_dict[contig][index]), 2) for ev in partition]) / len(partition)))) for index, partition in enumerate(translocation_partitions_fwdfwd_dict[contig])]
-    translocation_partition_means_revrev_dict = {}
-    translocation_partition_stds_revrev_dict = {}
-    for contig in translocation_partitions_revrev_dict.keys():
-        translocation_partition_means_revrev_dict[contig] = [int(round(sum([ev.pos1 for ev in partition]) / len(partition))) for partition in translocation_partitions_revrev_dict[contig]]
-        translocation_partition_stds_revrev_dict[contig] = [int(round(sqrt(sum([pow(abs(ev.pos1 - translocation_partition_means_revrev_dict[contig][index]), 2) for ev in partition]) / len(partition)))) for index, partition in enumerate(translocation_partitions_revrev_dict[contig])]
-
-
-    logging.info("Combine inserted regions with translocation breakpoints..")
-    new_insertion_from_clusters, inserted_regions_to_remove_1 = merge_translocations_at_insertions(translocation_partitions_fwdfwd_dict, translocation_partition_means_fwdfwd_dict, translocation_partition_stds_fwdfwd_dict, translocation_partitions_revrev_dict, translocation_partition_means_revrev_dict, translocation_partition_stds_revrev_dict, insertion_signature_clusters, options)
-    insertion_from_signature_clusters.extend(new_insertion_from_clusters)
+    with stats.stage("translocation_merge"):
+        # Index translocation breakpoints by contig and pos1
+        logging.info("Cluster translocation breakpoints..")
+        translocation_index_fwdfwd = TranslocationBreakpointIndex(completed_translocations, "fwd", options.trans_partition_max_distance, options.trans_destination_partition_max_distance)
+        translocation_index_revrev = TranslocationBreakpointIndex(completed_translocations, "rev", options.trans_partition_max_distance, options.trans_destination_partition_max_distance)
+
+        logging.info("Combine inserted regions with translocation breakpoints..")
+        new_insertion_from_clusters, inserted_regions_to_remove_1 = merge_translocations_at_insertions(translocation_index_fwdfwd, translocation_index_revrev, insertion_signature_clusters, options)
+        insertion_from_signature_clusters.extend(new_insertion_from_clusters)
+        stats.set("translocation_breakpoints", len(completed_translocations))
+        stats.set("merged_insertions", len(new_insertion_from_clusters))
 
     ############################################################################
     # Create interspersed duplication candidates and flag cut&paste insertions #
     ############################################################################
 
-    logging.info("Create interspersed duplication candidates and flag cut&paste insertions..")
-    int_duplication_candidates = flag_cutpaste_candidates(insertion_from_signature_clusters, deletion_signature_clusters, options)
+    with stats.stage("cutpaste_flagging"):
+        logging.info("Create interspersed duplication candidates and flag cut&paste insertions..")
+        int_duplication_candidates = flag_cutpaste_candidates(insertion_from_signature_clusters, deletion_signature_clusters, options)
+        stats.set("int_duplication_candidates", len(int_duplication_candidates))
+        stats.set("cutpaste_candidates", len([candidate for candidate in int_duplication_candidates if candidate.cutpaste]))
 
     ###################################
     # Remove inserted region clusters #
     ###################################
 
-    #find all inserted regions overlapping interspersed duplication or tandem duplication candidates
-    int_duplication_iterator = iter(sorted(int_duplication_candidates, key=lambda cand: cand.get_destination()))
-    tan_duplication_iterator = iter(sorted(tan_dup_candidates, key=lambda cand: cand.get_destination()))
-    int_duplications_end = False
-    tan_duplications_end = False
-    inserted_regions_to_remove_2 = []
-
-    try:
-        current_int_duplication = next(int_duplication_iterator)
-    except StopIteration:
-        int_duplications_end = True
-
-    try:
-        current_tan_duplication = next(tan_duplication_iterator)
-    except StopIteration:
-        tan_duplications_end = True
-
-    for inserted_region_index, inserted_region in enumerate(insertion_signature_clusters):
-        contig1, start1, end1 = inserted_region.get_source()
-        length1 = end1 - start1
-        if not int_duplications_end:
-            contig2, start2, end2 = current_int_duplication.get_destination()
-            while contig2 < contig1 or (contig2 == contig1 and end2 < start1):
-                try:
-                    current_int_duplication = next(int_duplication_iterator)
-                    contig2, start2, end2 = current_int_duplication.get_destination()
-                except StopIteration:
-                    int_duplications_end = True
-                    break
-        if not int_duplications_end:
+    with stats.stage("insertion_removal"):
+        #find all inserted regions overlapping interspersed duplication or tandem duplication candidates of similar length
+        inserted_regions = SortedIntervals([ins_cluster.get_source() for ins_cluster in insertion_signature_clusters])
+        duplication_candidates = int_duplication_candidates + tan_dup_candidates
+        duplicated_regions = SortedIntervals([dup_candidate.get_destination() for dup_candidate in duplication_candidates])
+
+        def similar_length(inserted_region_index, duplication_index):
+            contig1, start1, end1 = insertion_signature_clusters[inserted_region_index].get_source()
+            contig2, start2, end2 = duplication_candidates[duplication_index].get_destination()
+            length1 = end1 - start1
             length2 = end2 - start2
-            #if overlapping interspersed duplication of similar length
-            if contig2 == contig1 and start2 < end1 and (length1 - length2) / max(length1, length2) < 0.2:
-                inserted_regions_to_remove_2.append(inserted_region_index)
-        else:
-            if not tan_duplications_end:
-                contig2, start2, end2 = current_tan_duplication.get_destination()
-                while contig2 < contig1 or (contig2 == contig1 and end2 < start1):
-                    try:
-                        current_tan_duplication = next(tan_duplication_iterator)
-                        contig2, start2, end2 = current_tan_duplication.get_destination()
-                    except StopIteration:
-                        tan_duplications_end = True
-                        break
-            if not tan_duplications_end:
-                length2 = end2 - start2
-                #if overlapping tandem duplication of similar length
-                if contig2 == contig1 and start2 < end1 and (length1 - length2) / max(length1, length2) < 0.2:
-                    inserted_regions_to_remove_2.append(inserted_region_index)
-
-    # remove found inserted regions
-    all_inserted_regions_to_remove = sorted(list(set(inserted_regions_to_remove_1 + inserted_regions_to_remove_2)), reverse=True)
-    for ins_index in all_inserted_regions_to_remove:
-        del(insertion_signature_clusters[ins_index])
+            return (length1 - length2) / max(length1, length2) < 0.2
+
+        inserted_regions_to_remove_2 = [inserted_region_index for inserted_region_index, duplication_index in join_overlapping(inserted_regions, duplicated_regions, similar_length)]
+
+        # remove found inserted regions
+        number_of_inserted_regions = len(insertion_signature_clusters)
+        insertion_signature_clusters = compact(insertion_signature_clusters, inserted_regions_to_remove_1 + inserted_regions_to_remove_2)
+        stats.set("removed_inserted_regions", number_of_inserted_regions - len(insertion_signature_clusters))
 
     ##############################
     # Create deletion candidates #
@@ -238,8 +186,9 @@ def combine_clusters(signature_clusters, working_dir, options, version, contig_n
     ######################
     # Cluster candidates #
     ######################
-    logging.info("Cluster interspersed duplication candidates one more time..")
-    final_int_duplication_candidates = cluster_sv_candidates(int_duplication_candidates, options)
+    with stats.stage("candidate_clustering"):
+        logging.info("Cluster interspersed duplication candidates one more time..")
+        final_int_duplication_candidates = cluster_sv_candidates(int_duplication_candidates, options)
 
     ####################
     # Write candidates #
@@ -250,5 +199,20 @@ def combine_clusters(signature_clusters, working_dir, options, version, contig_n
     logging.info("Final interspersed duplication candidates: {0}".format(len(final_int_duplication_candidates)))
     logging.info("Final tandem duplication candidates: {0}".format(len(tan_dup_candidates)))
     logging.info("Final novel insertion candidates: {0}".format(len(novel_insertion_candidates)))
-    write_candidates(working_dir, (final_int_duplication_candidates, inversion_candidates, tan_dup_candidates, deletion_candidates, novel_insertion_candidates))
-    write_final_vcf(working_dir, final_int_duplication_candidates, inversion_candidates, tan_dup_candidates, deletion_candidates, novel_insertion_candidates, version, contig_names, contig_lengths, sample)
+    stats.set("candidates", OrderedDict([("del", len(deletion_candidates)),
+                                         ("inv", len(inversion_candidates)),
+                                         ("dup_int", len(final_int_duplication_candidates)),
+                                         ("dup_tan", len(tan_dup_candidates)),
+                                         ("nov_ins", len(novel_insertion_candidates))]))
+    if "candidate_emitted" in hooks:
+        for sv_type, candidates in [("del", deletion_candidates), ("inv", inversion_candidates), ("dup_int", final_int_duplication_candidates), ("dup_tan", tan_dup_candidates), ("nov_ins", novel_insertion_candidates)]:
+            for candidate in candidates:
+                emit("candidate_emitted", sv_type, ReadOnlyView(candidate))
+    candidates = (final_int_duplication_candidates, inversion_candidates, tan_dup_candidates, deletion_candidates, novel_insertion_candidates)
+    with stats.stage("write_candidates"):
+        write_candidates(working_dir, candidates, contig_names, contig_lengths, options.index_bed, options.compression_threads, options.progress_interval)
+        if options.export_columnar:
+            export_candidates(working_dir, candidates, contig_names)
+    with stats.stage("write_vcf"):
+        write_final_vcf(working_dir, final_int_duplication_candidates, inversion_candidates, tan_dup_candidates, deletion_candidates, novel_insertion_candidates, version, contig_names, contig_lengths, sample, options.compress_output, options.compression_threads, options.progress_interval)
+    return candidates
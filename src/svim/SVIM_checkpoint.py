@@ -0,0 +1,172 @@
+import os
+import json
+import pickle
+import hashlib
+import logging
+
+from svim.SVIM_input_parsing import guess_file_type, read_file_list
+
+
+CHECKPOINT_FORMAT_VERSION = 1
+# Options that the result of each stage depends on (in addition to those of the earlier stages)
+STAGE_OPTIONS = [("COLLECT", ["aligner", "nanopore", "min_mapq", "min_sv_size", "max_sv_size", "skip_indel", "skip_segment",
+                              "segment_gap_tolerance", "segment_overlap_tolerance", "regions", "exclude"]),
+                 ("CLUSTER", ["partition_max_distance", "distance_normalizer", "cluster_max_distance"])]
+# Number of signatures per pickled chunk of a COLLECT checkpoint
+CHECKPOINT_CHUNK_SIZE = 100000
+
+
+def get_input_files(options):
+    """Return the paths of the input files of a run: the alignment file or the reads (all files of a file list) and the genome
+    and the BED files of the regions."""
+    if options.sub == 'reads':
+        input_files = [options.reads, options.genome]
+        if guess_file_type(options.reads) == "list":
+            input_files.extend(read_file_list(options.reads))
+    else:
+        input_files = [options.bam_file]
+    for regions in [getattr(options, "regions", None), getattr(options, "exclude", None)]:
+        if regions != None and os.path.isfile(regions):
+            input_files.append(regions)
+    return input_files
+
+
+def describe_file(path):
+    try:
+        status = os.stat(path)
+    except OSError:
+        return {"path": os.path.abspath(path)}
+    return {"path": os.path.abspath(path), "size": status.st_size, "mtime_ns": status.st_mtime_ns}
+
+
+def get_fingerprint(options, version, stage, shard=None):
+    """Return a dictionary with everything that the result of a stage depends on: the SVIM version, the input files
+    (by size and modification time), the options of the stage and all earlier stages and the view of the shard."""
+    # Alignment files are analyzed in the same way in 'alignment' and 'sweep' mode
+    fingerprint = {"version": version, "mode": "reads" if options.sub == 'reads' else "alignment", "inputs": [describe_file(path) for path in get_input_files(options)]}
+    for stage_name, option_names in STAGE_OPTIONS:
+        for name in option_names:
+            fingerprint[name] = getattr(options, name, None)
+        if stage_name == stage:
+            break
+    if shard != None:
+        fingerprint["shard"] = {"regions": shard.regions, "views": sorted((contig, list(view)) for contig, view in shard.views.items()), "read_margin": shard.read_margin}
+    # Normalize tuples and infinite ends to their JSON representation
+    return json.loads(json.dumps(fingerprint))
+
+
+class HashingWriter:
+    """File-like object that computes the SHA-256 checksum of the data written to a file."""
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.checksum = hashlib.sha256()
+        self.size = 0
+
+
+    def write(self, data):
+        self.checksum.update(data)
+        self.size += len(data)
+        return self.output_file.write(data)
+
+
+def get_checkpoint_paths(directory, stage):
+    return os.path.join(directory, stage.lower() + ".pickle"), os.path.join(directory, stage.lower() + ".json")
+
+
+def write_checkpoint(directory, stage, fingerprint, chunks, metadata=None):
+    """Pickle the chunks (an iterable of objects) of the result of a stage into <stage>.pickle in directory and then
+    write its header with the format version, fingerprint, checksum and metadata into <stage>.json. Both files are
+    written under a temporary name first, so that a checkpoint is either complete or missing."""
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    data_path, header_path = get_checkpoint_paths(directory, stage)
+    for path in [header_path, data_path]:
+        if os.path.exists(path):
+            os.remove(path)
+    # Temporary files are private to the process
+    suffix = ".{0}.tmp".format(os.getpid())
+    with open(data_path + suffix, "wb") as data_file:
+        writer = HashingWriter(data_file)
+        number_of_chunks = 0
+        for chunk in chunks:
+            pickle.dump(chunk, writer, protocol=pickle.HIGHEST_PROTOCOL)
+            number_of_chunks += 1
+    os.rename(data_path + suffix, data_path)
+    header = {"format_version": CHECKPOINT_FORMAT_VERSION, "stage": stage, "fingerprint": fingerprint, "sha256": writer.checksum.hexdigest(),
+              "size": writer.size, "chunks": number_of_chunks, "metadata": metadata or {}}
+    with open(header_path + suffix, "w") as header_file:
+        json.dump(header, header_file, indent=2)
+    os.rename(header_path + suffix, header_path)
+
+
+def remove_checkpoint(directory, stage):
+    for path in get_checkpoint_paths(directory, stage):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_checkpoint_header(directory, stage, fingerprint):
+    """Return the header of the checkpoint of a stage if it is complete, intact and was written for the same
+    fingerprint, otherwise None (logging the reason)."""
+    data_path, header_path = get_checkpoint_paths(directory, stage)
+    if not os.path.exists(header_path):
+        return None
+    try:
+        with open(header_path, "r") as header_file:
+            header = json.load(header_file)
+    except ValueError as error:
+        logging.warning("Cannot resume from the {0} checkpoint: invalid header ({1}).".format(stage, error))
+        return None
+    if header.get("format_version") != CHECKPOINT_FORMAT_VERSION:
+        logging.warning("Cannot resume from the {0} checkpoint: unsupported format version {1}.".format(stage, header.get("format_version")))
+        return None
+    if header.get("fingerprint") != fingerprint:
+        changed = sorted(key for key in set(fingerprint.keys()) | set(header.get("fingerprint", {}).keys()) if fingerprint.get(key) != header.get("fingerprint", {}).get(key))
+        logging.info("Cannot resume from the {0} checkpoint: changed since it was written: {1}.".format(stage, ", ".join(changed)))
+        return None
+    checksum = hashlib.sha256()
+    size = 0
+    try:
+        with open(data_path, "rb") as data_file:
+            for block in iter(lambda: data_file.read(1 << 20), b""):
+                checksum.update(block)
+                size += len(block)
+    except OSError as error:
+        logging.warning("Cannot resume from the {0} checkpoint: {1}.".format(stage, error))
+        return None
+    if size != header["size"] or checksum.hexdigest() != header["sha256"]:
+        logging.warning("Cannot resume from the {0} checkpoint: the checksum of {1} does not match.".format(stage, data_path))
+        return None
+    return header
+
+
+def iterate_checkpoint(directory, stage):
+    """Yield the chunks of the checkpoint of a stage (which should be checked with load_checkpoint_header first)."""
+    data_path, header_path = get_checkpoint_paths(directory, stage)
+    with open(data_path, "rb") as data_file:
+        while True:
+            try:
+                yield pickle.load(data_file)
+            except EOFError:
+                break
+
+
+def get_signature_chunks(signatures, budget=None):
+    """Yield the collected signatures (from a list or spilled by a MemoryBudget) in chunks for write_checkpoint."""
+    if budget != None:
+        # Each spilled group fits into the memory budget (see MemoryBudget.check_chunks)
+        for key in sorted(budget.store.paths.keys()):
+            yield budget.store.load(key)
+    else:
+        for start in range(0, len(signatures), CHECKPOINT_CHUNK_SIZE):
+            yield signatures[start:start + CHECKPOINT_CHUNK_SIZE]
+
+
+def find_checkpoint(directory, fingerprints):
+    """Return a tuple (stage, header) with the last valid checkpoint of the given (stage, fingerprint) tuples
+    (in the order of the stages) or (None, None) if there is none."""
+    for stage, fingerprint in reversed(fingerprints):
+        header = load_checkpoint_header(directory, stage, fingerprint)
+        if header != None:
+            return stage, header
+    return None, None
@@ -3,17 +3,20 @@ from __future__ import print_function
 import sys
 import logging
 
-import networkx as nx
-from random import sample
+from random import Random
 from statistics import mean, stdev
+from time import perf_counter
 
 from svim.SVSignature import SignatureClusterUniLocal, SignatureClusterBiLocal
 from svim.SVCandidate import CandidateDuplicationInterspersed
+from svim.SVIM_stats import get_run_stats, summarize_sizes
+from svim.SVIM_progress import ProgressReporter
+from svim.SVIM_hooks import hooks, emit, SequenceView
 
 
 def form_partitions(sv_signatures, max_delta):
     """Form partitions of signatures using mean distance."""
-    sorted_signatures = sorted(sv_signatures, key=lambda evi: evi.get_key())
+    sorted_signatures = sorted(sv_signatures, key=lambda evi: evi.get_sort_key())
     partitions = []
     current_partition = []
     for signature in sorted_signatures:
@@ -26,13 +29,32 @@ def form_partitions(sv_signatures, max_delta):
     return partitions
 
 
-def clusters_from_partitions(partitions, options):
-    """Form clusters in partitions using span-log distance and clique finding in a distance graph."""
-    clusters_full = []
+def record_clustering_stats(partitions, clusters):
+    """Add the partition size distribution and the number of clusters (cliques) to the run statistics."""
+    stats = get_run_stats()
+    partition_sizes = [len(partition) for partition in partitions]
+    stats.set("partitions", len(partitions))
+    stats.set("partition_sizes", summarize_sizes(partition_sizes))
+    stats.set("sampled_partitions", len([size for size in partition_sizes if size > 100]))
+    stats.set("cliques", len(clusters))
+
+
+def cluster_partitions(partitions, options):
+    """Form clusters in partitions using span-log distance and clique finding in a distance graph.
+    Returns a list with the clusters of each partition."""
+    # networkx is slow to import and only needed here
+    import networkx as nx
+
+    clusters_by_partition = []
+    stage_name = get_run_stats().get_current_stage() or "CLUSTER"
+    progress = ProgressReporter(stage_name, options.progress_interval, "partitions", len(partitions))
     # Find clusters in each partition individually.
     for num, partition in enumerate(partitions):
+        progress.update(num)
+        start_time = perf_counter()
         if len(partition) > 100:
-            partition_sample = sample(partition, 100)
+            # Seed the sample with the partition so that it does not depend on the other partitions of the run
+            partition_sample = Random(str(partition[0].get_key())).sample(partition, 100)
         else:
             partition_sample = partition
         largest_signature = sorted(partition_sample, key=lambda evi: (evi.get_source()[2] - evi.get_source()[1]))[-1]
@@ -46,9 +68,22 @@ def clusters_from_partitions(partitions, options):
                         # Add edge in graph only if two indels are close to each other (distance <= max_delta)
                         connection_graph.add_edge(i1, i2)
         clusters_indices = nx.find_cliques(connection_graph)
-        for cluster in clusters_indices:
-            clusters_full.append([partition_sample[index] for index in cluster])
-    return clusters_full
+        partition_clusters = [[partition_sample[index] for index in cluster] for cluster in clusters_indices]
+        clusters_by_partition.append(partition_clusters)
+        if "partition_clustered" in hooks:
+            cost = {"signatures": len(partition),
+                    "sampled_signatures": len(partition_sample),
+                    "edges": connection_graph.number_of_edges(),
+                    "cliques": len(partition_clusters),
+                    "seconds": perf_counter() - start_time}
+            emit("partition_clustered", stage_name, SequenceView(partition), SequenceView(partition_clusters), cost)
+    progress.finish(len(partitions))
+    return clusters_by_partition
+
+
+def clusters_from_partitions(partitions, options):
+    """Form clusters in partitions (see cluster_partitions) and return the clusters of all partitions in one list."""
+    return [cluster for partition_clusters in cluster_partitions(partitions, options) for cluster in partition_clusters]
 
 
 def calculate_score(cigar_signatures, suppl_signatures, std_span, std_pos, span):
@@ -174,6 +209,7 @@ def partition_and_cluster_candidates(candidates, options, type):
     partitions = form_partitions(candidates, options.partition_max_distance)
     clusters = clusters_from_partitions(partitions, options)
     logging.info("Clustered {0}: {1} partitions and {2} clusters".format(type, len(partitions), len(clusters)))
+    record_clustering_stats(partitions, clusters)
 
     final_candidates = []
     for cluster in clusters:
@@ -212,6 +248,7 @@ def partition_and_cluster_unilocal(signatures, options, type):
     partitions = form_partitions(signatures, options.partition_max_distance)
     clusters = clusters_from_partitions(partitions, options)
     logging.info("Clustered {0}: {1} partitions and {2} clusters".format(type, len(partitions), len(clusters)))
+    record_clustering_stats(partitions, clusters)
     return sorted(consolidate_clusters_unilocal(clusters, options), key=lambda cluster: (cluster.contig, (cluster.end + cluster.start) / 2))
 
 
@@ -219,4 +256,5 @@ def partition_and_cluster_bilocal(signatures, options, type):
     partitions = form_partitions(signatures, options.partition_max_distance)
     clusters = clusters_from_partitions(partitions, options)
     logging.info("Clustered {0}: {1} partitions and {2} clusters".format(type, len(partitions), len(clusters)))
+    record_clustering_stats(partitions, clusters)
     return consolidate_clusters_bilocal(clusters)
@@ -0,0 +1,255 @@
+import os
+import struct
+import logging
+
+from collections import defaultdict, Counter
+
+from svim.SVIM_shards import get_signature_position
+
+
+DENSITY_FORMAT_VERSION = 1
+DENSITY_BIN_SIZE = 100000
+DENSITY_TYPES = ["del", "ins", "inv", "dup", "ins_dup", "tra"]
+# Signatures beyond which the clique search of a partition works on a sample (see cluster_partitions)
+CLUSTER_SAMPLE_SIZE = 100
+# Size of the windows of the linear index of a BAI file
+BAI_WINDOW_SIZE = 16384
+# Bin of a BAI file with the offsets of the first and last alignment of a contig
+BAI_PSEUDO_BIN = 37450
+
+
+class SignatureDensityIndex:
+    """Number of signatures of each type in bins of bin_size bp along every contig. Signatures are counted at the
+    position that decides which shard owns them (see get_signature_position). The index is written as a by-product
+    of COLLECT and used to split the genome into shards of similar expected cost (see get_bin_costs). If a shard
+    is given, only the signatures owned by the shard are counted."""
+    def __init__(self, bin_size=DENSITY_BIN_SIZE, shard=None):
+        self.bin_size = bin_size
+        self.shard = shard
+        # Counts of (type, bin) by contig
+        self.counts = defaultdict(Counter)
+
+
+    def add(self, signatures):
+        for signature in signatures:
+            if self.shard != None and not self.shard.owns_signature(signature):
+                continue
+            contig, position = get_signature_position(signature)
+            self.counts[contig][(signature.type, max(0, position) // self.bin_size)] += 1
+
+
+    def update(self, other):
+        for contig, contig_counts in other.counts.items():
+            self.counts[contig].update(contig_counts)
+
+
+    def get_total(self):
+        return sum(sum(contig_counts.values()) for contig_counts in self.counts.values())
+
+
+    def get_bin_counts(self, contig, contig_length, sv_type):
+        counts = [0] * (contig_length // self.bin_size + 1)
+        for (signature_type, bin_index), count in self.counts[contig].items():
+            if signature_type == sv_type:
+                counts[min(bin_index, len(counts) - 1)] += count
+        return counts
+
+
+    def get_bin_costs(self, contig, contig_length, base_cost=1.0):
+        """Return the expected cost of analyzing each bin of a contig: a base cost for reading its alignments plus
+        the cost of collecting each signature and of clustering it with up to CLUSTER_SAMPLE_SIZE other signatures
+        of the same type nearby."""
+        costs = [base_cost] * (contig_length // self.bin_size + 1)
+        for sv_type in DENSITY_TYPES:
+            for bin_index, count in enumerate(self.get_bin_counts(contig, contig_length, sv_type)):
+                costs[bin_index] += count * (1 + min(count, CLUSTER_SAMPLE_SIZE) / CLUSTER_SAMPLE_SIZE)
+        return costs
+
+
+    def get_base_cost(self, contig_names, contig_lengths):
+        """Return the mean cost of the signatures per bin over all contigs, the base cost of a bin."""
+        bins = sum(length // self.bin_size + 1 for length in contig_lengths)
+        signature_cost = sum(sum(self.get_bin_costs(contig, length, 0.0)) for contig, length in zip(contig_names, contig_lengths))
+        return max(1.0, signature_cost / max(1, bins))
+
+
+    def get_cost(self, contig, contig_length, start, end, base_cost=1.0):
+        """Return the expected cost of the region from start to end on a contig (partial bins in proportion to their overlap)."""
+        cost = 0.0
+        for bin_index, bin_cost in enumerate(self.get_bin_costs(contig, contig_length, base_cost)):
+            bin_start = bin_index * self.bin_size
+            overlap = min(end, bin_start + self.bin_size) - max(start, bin_start)
+            if overlap > 0:
+                cost += bin_cost * overlap / self.bin_size
+        return cost
+
+
+    def split_contig(self, contig, contig_length, number_of_windows, min_length, base_cost=1.0):
+        """Return the bounds of number_of_windows windows of a contig with equal expected cost that are at least
+        min_length long (number_of_windows * min_length must not exceed the length of the contig)."""
+        costs = self.get_bin_costs(contig, contig_length, base_cost)
+        total = sum(costs)
+        bounds = [0]
+        cumulative = 0.0
+        bin_index = 0
+        for window_index in range(1, number_of_windows):
+            target = total * window_index / number_of_windows
+            while bin_index < len(costs) - 1 and cumulative + costs[bin_index] < target:
+                cumulative += costs[bin_index]
+                bin_index += 1
+            # Interpolate within the bin in which the cumulative cost reaches the target
+            fraction = (target - cumulative) / costs[bin_index] if costs[bin_index] > 0 else 0
+            bounds.append(min(contig_length, int(bin_index * self.bin_size + fraction * self.bin_size)))
+        bounds.append(contig_length)
+        for index in range(1, number_of_windows):
+            bounds[index] = max(bounds[index], bounds[index - 1] + min_length)
+        for index in range(number_of_windows - 1, 0, -1):
+            bounds[index] = min(bounds[index], bounds[index + 1] - min_length)
+        return bounds
+
+
+    def write(self, path, contig_names, contig_lengths):
+        """Write the index as a compressed NumPy archive with one row of bin counts per signature type. The bins
+        of each contig start at contig_offsets[index] in the order of contigs."""
+        import numpy as np
+
+        offsets = [0]
+        for length in contig_lengths:
+            offsets.append(offsets[-1] + length // self.bin_size + 1)
+        counts = np.zeros((len(DENSITY_TYPES), offsets[-1]), dtype="int64")
+        for type_index, sv_type in enumerate(DENSITY_TYPES):
+            for contig_index, (contig, length) in enumerate(zip(contig_names, contig_lengths)):
+                counts[type_index, offsets[contig_index]:offsets[contig_index + 1]] = self.get_bin_counts(contig, length, sv_type)
+        np.savez_compressed(path, version=np.array(DENSITY_FORMAT_VERSION), bin_size=np.array(self.bin_size),
+                            contigs=np.array([contig.encode() for contig in contig_names], dtype="S"),
+                            contig_lengths=np.array(contig_lengths, dtype="int64"), contig_offsets=np.array(offsets, dtype="int64"),
+                            types=np.array([sv_type.encode() for sv_type in DENSITY_TYPES], dtype="S"), counts=counts)
+
+
+def read_density_index(path):
+    """Read a signature density index written by SignatureDensityIndex.write. Returns a tuple (index, contig names, contig lengths)."""
+    import numpy as np
+
+    with np.load(path) as archive:
+        if int(archive["version"]) != DENSITY_FORMAT_VERSION:
+            raise ValueError("Unsupported signature density index version {0}".format(int(archive["version"])))
+        index = SignatureDensityIndex(int(archive["bin_size"]))
+        contig_names = [contig.decode() for contig in archive["contigs"]]
+        contig_lengths = [int(length) for length in archive["contig_lengths"]]
+        offsets = archive["contig_offsets"]
+        types = [sv_type.decode() for sv_type in archive["types"]]
+        counts = archive["counts"]
+        for contig_index, contig in enumerate(contig_names):
+            for type_index, sv_type in enumerate(types):
+                for bin_index in np.nonzero(counts[type_index, offsets[contig_index]:offsets[contig_index + 1]])[0]:
+                    index.counts[contig][(sv_type, int(bin_index))] = int(counts[type_index, offsets[contig_index] + bin_index])
+    return index, contig_names, contig_lengths
+
+
+class AlignmentDensityIndex(SignatureDensityIndex):
+    """Estimate of the cost of analyzing each bin of the genome from the amount of compressed alignment data in the
+    bin, read from the linear index of BAI files (see read_bai_window_sizes). It is used to split the genome into
+    shards before a signature density index exists (e.g. in the first run of a sample). Dense and deep regions,
+    where most signatures are found, contain the most data, but the clustering cost of their signatures is
+    underestimated."""
+    def __init__(self, bin_size=DENSITY_BIN_SIZE):
+        super().__init__(bin_size)
+        # Compressed bytes of the alignments starting in each bin by contig
+        self.sizes = {}
+
+
+    def add_window_sizes(self, contig, window_sizes):
+        contig_sizes = self.sizes.setdefault(contig, [])
+        for window_index, size in enumerate(window_sizes):
+            bin_index = window_index * BAI_WINDOW_SIZE // self.bin_size
+            if bin_index >= len(contig_sizes):
+                contig_sizes.extend([0] * (bin_index + 1 - len(contig_sizes)))
+            contig_sizes[bin_index] += size
+
+
+    def get_total(self):
+        return sum(sum(contig_sizes) for contig_sizes in self.sizes.values())
+
+
+    def get_bin_costs(self, contig, contig_length, base_cost=1.0):
+        """Return the expected cost of analyzing each bin of a contig: a base cost plus the compressed bytes of the
+        alignments in the bin (see get_base_cost)."""
+        costs = [base_cost] * (contig_length // self.bin_size + 1)
+        for bin_index, size in enumerate(self.sizes.get(contig, [])):
+            costs[min(bin_index, len(costs) - 1)] += size
+        return costs
+
+
+def read_bai_window_sizes(path):
+    """Read the linear index of a BAI file. Returns a list with one list per contig of the compressed bytes of
+    the alignments starting in each window of BAI_WINDOW_SIZE bp (the differences between the file offsets of
+    the first alignments of consecutive windows)."""
+    with open(path, "rb") as bai_file:
+        data = bai_file.read()
+    if data[:4] != b"BAI\1":
+        raise ValueError("{0} is not a BAI file".format(path))
+    offset = 4
+    number_of_contigs, = struct.unpack_from("<i", data, offset)
+    offset += 4
+    window_sizes = []
+    for contig_index in range(number_of_contigs):
+        number_of_bins, = struct.unpack_from("<i", data, offset)
+        offset += 4
+        contig_end = None
+        for bin_index in range(number_of_bins):
+            bin_number, number_of_chunks = struct.unpack_from("<Ii", data, offset)
+            offset += 8
+            if bin_number == BAI_PSEUDO_BIN and number_of_chunks >= 1:
+                contig_start, contig_end = struct.unpack_from("<QQ", data, offset)
+            offset += 16 * number_of_chunks
+        number_of_windows, = struct.unpack_from("<i", data, offset)
+        offset += 4
+        window_offsets = struct.unpack_from("<{0}Q".format(number_of_windows), data, offset)
+        offset += 8 * number_of_windows
+        # Windows without alignments may have no offset; compressed offsets are the upper 48 bits of virtual offsets
+        block_offsets = []
+        for window_offset in window_offsets:
+            block_offsets.append(max(window_offset >> 16, block_offsets[-1] if len(block_offsets) > 0 else 0))
+        if contig_end != None and len(block_offsets) > 0:
+            block_offsets.append(max(contig_end >> 16, block_offsets[-1]))
+        window_sizes.append([end - start for start, end in zip(block_offsets, block_offsets[1:])])
+    return window_sizes
+
+
+def estimate_density_from_bam_index(alignment_files, contig_names, bin_size=DENSITY_BIN_SIZE):
+    """Return an AlignmentDensityIndex for coordinate-sorted BAM files with BAI indices or None if a file has no
+    such index (e.g. CSI indices have no linear index)."""
+    index = AlignmentDensityIndex(bin_size)
+    for path in alignment_files:
+        for bai_path in [path + ".bai", os.path.splitext(path)[0] + ".bai"]:
+            if os.path.exists(bai_path):
+                break
+        else:
+            return None
+        try:
+            window_sizes = read_bai_window_sizes(bai_path)
+        except (OSError, ValueError, struct.error) as error:
+            logging.warning("Cannot read the linear index of {0}: {1}".format(bai_path, error))
+            return None
+        if len(window_sizes) != len(contig_names):
+            return None
+        for contig, contig_window_sizes in zip(contig_names, window_sizes):
+            index.add_window_sizes(contig, contig_window_sizes)
+    if index.get_total() == 0:
+        return None
+    return index
+
+
+def load_density_index(path, contig_names, contig_lengths):
+    """Return the signature density index from path if it exists and was built for the given contigs, otherwise None."""
+    if path == None or not os.path.exists(path):
+        return None
+    try:
+        index, index_contig_names, index_contig_lengths = read_density_index(path)
+    except (OSError, ValueError, KeyError) as error:
+        logging.warning("Ignoring signature density index {0}: {1}".format(path, error))
+        return None
+    if list(index_contig_names) != list(contig_names) or list(index_contig_lengths) != list(contig_lengths):
+        logging.warning("Ignoring signature density index {0} because it was built for other contigs.".format(path))
+        return None
+    return index
@@ -0,0 +1,141 @@
+import os
+import json
+
+
+COLUMNAR_FORMAT_VERSION = 1
+
+# Columns of each kind of table: (name, NumPy dtype, attribute). Contig columns hold indices into the
+# contig table and missing standard deviations are stored as NaN.
+UNILOCAL_CLUSTER_COLUMNS = [("contig", "int32", "contig"), ("start", "int64", "start"), ("end", "int64", "end"),
+                            ("score", "float64", "score"), ("size", "int64", "size"),
+                            ("std_span", "float64", "std_span"), ("std_pos", "float64", "std_pos")]
+BILOCAL_CLUSTER_COLUMNS = [("source_contig", "int32", "source_contig"), ("source_start", "int64", "source_start"), ("source_end", "int64", "source_end"),
+                           ("dest_contig", "int32", "dest_contig"), ("dest_start", "int64", "dest_start"), ("dest_end", "int64", "dest_end"),
+                           ("score", "float64", "score"), ("size", "int64", "size"),
+                           ("std_span", "float64", "std_span"), ("std_pos", "float64", "std_pos")]
+SOURCE_CANDIDATE_COLUMNS = [("source_contig", "int32", "source_contig"), ("source_start", "int64", "source_start"), ("source_end", "int64", "source_end"),
+                            ("score", "float64", "score"), ("std_span", "float64", "std_span"), ("std_pos", "float64", "std_pos")]
+TANDEM_DUPLICATION_CANDIDATE_COLUMNS = SOURCE_CANDIDATE_COLUMNS + [("copies", "int64", "copies")]
+INTERSPERSED_DUPLICATION_CANDIDATE_COLUMNS = [("source_contig", "int32", "source_contig"), ("source_start", "int64", "source_start"), ("source_end", "int64", "source_end"),
+                                              ("dest_contig", "int32", "dest_contig"), ("dest_start", "int64", "dest_start"), ("dest_end", "int64", "dest_end"),
+                                              ("score", "float64", "score"), ("std_span", "float64", "std_span"), ("std_pos", "float64", "std_pos"),
+                                              ("cutpaste", "bool", "cutpaste")]
+NOVEL_INSERTION_CANDIDATE_COLUMNS = [("dest_contig", "int32", "dest_contig"), ("dest_start", "int64", "dest_start"), ("dest_end", "int64", "dest_end"),
+                                     ("score", "float64", "score"), ("std_span", "float64", "std_span"), ("std_pos", "float64", "std_pos")]
+
+
+class ColumnarExport:
+    """Export of signature clusters or candidates into a directory of NumPy .npy files that can be memory-mapped.
+    Every table is stored as one file per column (<table>.<column>.npy). Contigs and read names are stored
+    once in the tables contigs.npy and reads.npy and referenced by index. The members of the i-th record of a
+    table are the reads reads[<table>.member_reads[<table>.member_offsets[i]:<table>.member_offsets[i + 1]]].
+    """
+    def __init__(self, directory, contig_names):
+        self.directory = directory
+        self.contig_indices = dict((contig, index) for index, contig in enumerate(contig_names))
+        self.contigs = list(contig_names)
+        self.read_indices = {}
+        self.reads = []
+        self.tables = {}
+
+
+    def get_contig_index(self, contig):
+        try:
+            return self.contig_indices[contig]
+        except KeyError:
+            self.contig_indices[contig] = len(self.contigs)
+            self.contigs.append(contig)
+            return self.contig_indices[contig]
+
+
+    def get_read_index(self, read):
+        try:
+            return self.read_indices[read]
+        except KeyError:
+            self.read_indices[read] = len(self.reads)
+            self.reads.append(read)
+            return self.read_indices[read]
+
+
+    def add_table(self, name, items, columns):
+        """Add a table with one row per item and the given (name, dtype, attribute) columns."""
+        import numpy as np
+
+        values = dict((column, []) for column, dtype, attribute in columns)
+        member_offsets = [0]
+        member_reads = []
+        for item in items:
+            for column, dtype, attribute in columns:
+                value = getattr(item, attribute)
+                if column.endswith("contig"):
+                    value = self.get_contig_index(value)
+                elif value == None:
+                    value = float("nan")
+                values[column].append(value)
+            member_reads.extend([self.get_read_index(member.read) for member in item.members])
+            member_offsets.append(len(member_reads))
+
+        table = dict((column, np.array(values[column], dtype=dtype)) for column, dtype, attribute in columns)
+        table["member_offsets"] = np.array(member_offsets, dtype="int64")
+        table["member_reads"] = np.array(member_reads, dtype="int64")
+        self.tables[name] = table
+
+
+    def write(self):
+        import numpy as np
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        np.save(os.path.join(self.directory, "contigs.npy"), np.array([contig.encode() for contig in self.contigs], dtype="S"))
+        np.save(os.path.join(self.directory, "reads.npy"), np.array([read.encode() for read in self.reads], dtype="S"))
+        manifest = {"version": COLUMNAR_FORMAT_VERSION, "tables": {}}
+        for name, table in self.tables.items():
+            manifest["tables"][name] = {"rows": len(table["member_offsets"]) - 1, "columns": {}}
+            for column, values in table.items():
+                np.save(os.path.join(self.directory, "{0}.{1}.npy".format(name, column)), values)
+                manifest["tables"][name]["columns"][column] = values.dtype.str
+        with open(os.path.join(self.directory, "manifest.json"), "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+
+
+def load_columnar(directory, mmap_mode="r"):
+    """Load a columnar export. Returns a (contigs, reads, tables) tuple where tables maps each table name
+    to a dictionary of column arrays. By default, the arrays are memory-mapped read-only."""
+    import numpy as np
+
+    with open(os.path.join(directory, "manifest.json")) as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest["version"] != COLUMNAR_FORMAT_VERSION:
+        raise ValueError("Unsupported columnar export version {0}".format(manifest["version"]))
+    contigs = np.load(os.path.join(directory, "contigs.npy"), mmap_mode=mmap_mode)
+    reads = np.load(os.path.join(directory, "reads.npy"), mmap_mode=mmap_mode)
+    tables = {}
+    for name, table in manifest["tables"].items():
+        tables[name] = dict((column, np.load(os.path.join(directory, "{0}.{1}.npy".format(name, column)), mmap_mode=mmap_mode)) for column in table["columns"])
+    return contigs, reads, tables
+
+
+def export_signature_clusters(working_dir, clusters, contig_names):
+    """Export signature clusters into the directory signatures/columnar in the working directory."""
+    deletion_signature_clusters, insertion_signature_clusters, inversion_signature_clusters, tandem_duplication_signature_clusters, insertion_from_signature_clusters, completed_translocations = clusters
+
+    export = ColumnarExport(working_dir + '/signatures/columnar', contig_names)
+    export.add_table("del", deletion_signature_clusters, UNILOCAL_CLUSTER_COLUMNS)
+    export.add_table("ins", insertion_signature_clusters, UNILOCAL_CLUSTER_COLUMNS)
+    export.add_table("inv", inversion_signature_clusters, UNILOCAL_CLUSTER_COLUMNS)
+    export.add_table("dup_tan", tandem_duplication_signature_clusters, BILOCAL_CLUSTER_COLUMNS)
+    export.add_table("ins_dup", insertion_from_signature_clusters, BILOCAL_CLUSTER_COLUMNS)
+    export.write()
+
+
+def export_candidates(working_dir, candidates, contig_names):
+    """Export SV candidates into the directory candidates/columnar in the working directory."""
+    int_duplication_candidates, inversion_candidates, tan_duplication_candidates, deletion_candidates, novel_insertion_candidates = candidates
+
+    export = ColumnarExport(working_dir + '/candidates/columnar', contig_names)
+    export.add_table("deletions", deletion_candidates, SOURCE_CANDIDATE_COLUMNS)
+    export.add_table("inversions", inversion_candidates, SOURCE_CANDIDATE_COLUMNS)
+    export.add_table("tan_duplications", tan_duplication_candidates, TANDEM_DUPLICATION_CANDIDATE_COLUMNS)
+    export.add_table("int_duplications", int_duplication_candidates, INTERSPERSED_DUPLICATION_CANDIDATE_COLUMNS)
+    export.add_table("novel_insertions", novel_insertion_candidates, NOVEL_INSERTION_CANDIDATE_COLUMNS)
+    export.write()
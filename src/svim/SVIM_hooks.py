@@ -0,0 +1,116 @@
+from collections.abc import Sequence
+from types import MappingProxyType, MethodType
+
+
+EVENTS = ("stage_started", "stage_finished", "reads_processed", "partition_clustered", "candidate_emitted")
+
+# Registered callbacks by event. Events without callbacks are not contained so that
+# 'if hooks' is a cheap test whether any callbacks are registered at all.
+hooks = {}
+
+
+class AbortPipeline(Exception):
+    """Raised by a callback to stop the pipeline."""
+    pass
+
+
+def register_hook(event, callback):
+    """Register a callback for an event of the pipeline. Callbacks are called in the order of registration with:
+
+    - stage_started(name) and stage_finished(name): a pipeline stage (e.g. COLLECT or CLUSTER/del) starts or ends.
+    - reads_processed(reads, signatures): a batch of alignment records has been analyzed in COLLECT. reads is the
+      number of reads analyzed so far and signatures a view of the SV signatures found in the batch.
+    - partition_clustered(stage, partition, clusters, cost): a partition of signatures (or candidates) has been
+      clustered. cost is a dictionary with the number of signatures, sampled signatures, graph edges and cliques
+      and the seconds spent on the partition.
+    - candidate_emitted(sv_type, candidate): a final SV candidate has been produced in COMBINE.
+
+    Objects are passed as read-only views that are created without copying. A callback can stop the run by
+    raising AbortPipeline.
+    """
+    if event not in EVENTS:
+        raise ValueError("Unknown event {0}. Known events are: {1}".format(event, ", ".join(EVENTS)))
+    hooks.setdefault(event, []).append(callback)
+
+
+def unregister_hook(event, callback):
+    callbacks = hooks.get(event, [])
+    callbacks.remove(callback)
+    if len(callbacks) == 0:
+        del hooks[event]
+
+
+def clear_hooks():
+    hooks.clear()
+
+
+def emit(event, *args):
+    """Call all callbacks registered for an event with the given arguments."""
+    for callback in hooks.get(event, ()):
+        callback(*args)
+
+
+class ReadOnlyView:
+    """Read-only proxy of an object: attributes and methods can be accessed but not assigned. List and dictionary
+    attributes are returned as read-only views as well and methods are called with the view as self, so that they
+    cannot modify the object either. Special attributes such as __dict__ cannot be accessed."""
+    __slots__ = ("_object",)
+
+    def __init__(self, wrapped_object):
+        object.__setattr__(self, "_object", wrapped_object)
+
+
+    def __getattribute__(self, name):
+        if name == "_object" or (name.startswith("__") and name.endswith("__") and name != "__class__"):
+            raise AttributeError("Read-only view does not give access to {0}".format(name))
+        wrapped_object = object.__getattribute__(self, "_object")
+        value = getattr(wrapped_object, name)
+        if isinstance(value, list):
+            return SequenceView(value)
+        if isinstance(value, dict):
+            return MappingProxyType(value)
+        if isinstance(value, MethodType) and value.__self__ is wrapped_object:
+            return MethodType(value.__func__, self)
+        return value
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Read-only view of {0} cannot be modified".format(type(object.__getattribute__(self, "_object")).__name__))
+
+
+    def __delattr__(self, name):
+        self.__setattr__(name, None)
+
+
+    def __repr__(self):
+        return "ReadOnlyView({0!r})".format(object.__getattribute__(self, "_object"))
+
+
+class SequenceView(Sequence):
+    """Read-only view of the items[start:stop] of a list. Items are returned as read-only views as well."""
+    __slots__ = ("_items", "_start", "_stop")
+
+    def __init__(self, items, start=0, stop=None):
+        self._items = items
+        self._start = start
+        self._stop = len(items) if stop == None else stop
+
+
+    def __len__(self):
+        return self._stop - self._start
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("Slices of sequence views do not support steps")
+            return SequenceView(self._items, self._start + start, self._start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("Sequence view index out of range")
+        item = self._items[self._start + index]
+        if isinstance(item, list):
+            return SequenceView(item)
+        return ReadOnlyView(item)
@@ -0,0 +1,79 @@
+import logging
+
+from collections import defaultdict
+
+
+COST_COLUMNS = ["seconds", "partitions", "signatures", "sampled_signatures", "edges", "cliques"]
+
+
+class HotRegionProfiler:
+    """Record the clustering cost of every partition (signatures, graph edges, cliques and time) and the
+    genomic region it spans. Partitions are reported on the source region of their members. It is used as
+    callback of the partition_clustered hook (see SVIM_hooks).
+    """
+    def __init__(self):
+        # (contig, start, end, stage, seconds, signatures, sampled signatures, edges, cliques) per partition
+        self.partitions = []
+
+
+    def partition_clustered(self, stage, partition, clusters, cost):
+        sources = [member.get_source() for member in partition]
+        contig = sources[0][0]
+        start = min(source[1] for source in sources)
+        end = max(source[2] for source in sources)
+        self.partitions.append((contig, start, end, stage, cost["seconds"], cost["signatures"], cost["sampled_signatures"], cost["edges"], cost["cliques"]))
+
+
+    def get_regions(self):
+        """Merge the overlapping partitions of all stages into regions and sum their costs.
+        Returns a list of (contig, start, end, stages, costs) tuples where costs is a dictionary of COST_COLUMNS."""
+        partitions_by_contig = defaultdict(list)
+        for partition in self.partitions:
+            partitions_by_contig[partition[0]].append(partition)
+        regions = []
+        for contig in sorted(partitions_by_contig.keys()):
+            current = None
+            for contig, start, end, stage, seconds, signatures, sampled, edges, cliques in sorted(partitions_by_contig[contig], key=lambda partition: partition[1]):
+                if current == None or start >= current[2]:
+                    current = [contig, start, end, set(), dict((column, 0) for column in COST_COLUMNS)]
+                    regions.append(current)
+                current[2] = max(current[2], end)
+                current[3].add(stage)
+                costs = current[4]
+                costs["seconds"] += seconds
+                costs["partitions"] += 1
+                costs["signatures"] += signatures
+                costs["sampled_signatures"] += sampled
+                costs["edges"] += edges
+                costs["cliques"] += cliques
+        return [(contig, start, end, ",".join(sorted(stages)), costs) for contig, start, end, stages, costs in regions]
+
+
+    def get_top_partitions(self, top):
+        partitions = sorted(self.partitions, key=lambda partition: partition[4], reverse=True)[:top]
+        return [(contig, start, end, stage, dict(zip(COST_COLUMNS, (seconds, 1, signatures, sampled, edges, cliques))))
+                for contig, start, end, stage, seconds, signatures, sampled, edges, cliques in partitions]
+
+
+    def get_top_regions(self, top):
+        return sorted(self.get_regions(), key=lambda region: region[4]["seconds"], reverse=True)[:top]
+
+
+    def write(self, working_dir, top):
+        """Write the top partitions and regions by clustering time into hot_partitions.bed and hot_regions.bed."""
+        write_cost_bed(working_dir + "/hot_partitions.bed", self.get_top_partitions(top))
+        top_regions = self.get_top_regions(top)
+        write_cost_bed(working_dir + "/hot_regions.bed", top_regions)
+        total_seconds = sum(partition[4] for partition in self.partitions)
+        logging.info("Clustered {0} partitions in {1:.1f}s. Wrote the {2} most expensive regions to {3}/hot_regions.bed".format(len(self.partitions), total_seconds, len(top_regions), working_dir))
+        for contig, start, end, stages, costs in top_regions[:5]:
+            logging.info("Hot region {0}:{1}-{2} ({3}): {4:.2f}s, {5} partitions, {6} signatures, {7} edges, {8} cliques".format(contig, start, end, stages, costs["seconds"], costs["partitions"], costs["signatures"], costs["edges"], costs["cliques"]))
+
+
+def write_cost_bed(path, entries):
+    """Write (contig, start, end, name, costs) entries as BED with the costs as additional columns."""
+    with open(path, "w") as bed_file:
+        print("#contig\tstart\tend\tstages\t" + "\t".join(COST_COLUMNS), file=bed_file)
+        for contig, start, end, name, costs in entries:
+            values = ["{0:.6f}".format(costs["seconds"])] + [str(costs[column]) for column in COST_COLUMNS[1:]]
+            print("\t".join([contig, str(start), str(end), name] + values), file=bed_file)
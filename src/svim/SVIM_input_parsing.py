@@ -3,6 +3,8 @@ import os
 import logging
 import argparse
 
+from svim.SVIM_memory import parse_memory_size
+
 
 def parse_arguments(program_version, arguments = sys.argv[1:]):
     parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -18,6 +20,8 @@ SVIM consists of three major steps:
 
 SVIM can process two types of input. Firstly, it can detect SVs from raw reads by aligning them to a given reference genome first ("SVIM.py reads [options] working_dir reads genome").
 Alternatively, it can detect SVs from existing reads alignments in SAM/BAM format ("SVIM.py alignment [options] working_dir bam_file").
+After a run, histograms of the signature clusters can be plotted with "SVIM.py report working_dir" (requires matplotlib).
+To tune the CLUSTER and COMBINE parameters, "SVIM.py sweep [options] working_dir bam_file" runs COLLECT once and calls SVs with every combination of the given parameter values.
 """)
     subparsers = parser.add_subparsers(help='modes', dest='sub')
     parser.add_argument('--version', '-v', action='version', version='%(prog)s {version}'.format(version=program_version))
@@ -37,6 +41,8 @@ Alternatively, it can detect SVs from existing reads alignments in SAM/BAM forma
     group_fasta_collect.add_argument('--nanopore', action='store_true', help='use Nanopore settings for read alignment (default: off)')
     group_fasta_collect.add_argument('--segment_gap_tolerance', type=int, default=10, help='Maximum tolerated gap between adjacent alignment segments')
     group_fasta_collect.add_argument('--segment_overlap_tolerance', type=int, default=5, help='Maximum tolerated overlap between adjacent alignment segments')
+    group_fasta_collect.add_argument('--regions', type=str, metavar='REGIONS', help='only detect SVs in these regions: a BED file or a comma-separated list of regions (e.g. chr1,chr2:1000000-2000000). Coordinate-sorted BAM files need an index and only the alignments in these regions are read.')
+    group_fasta_collect.add_argument('--exclude', type=str, metavar='REGIONS', help='do not detect SVs in these regions (e.g. centromeres, gaps or problematic loci): a BED file or a comma-separated list of regions')
     group_fasta_cluster = parser_fasta.add_argument_group('CLUSTER')
     group_fasta_cluster.add_argument('--partition_max_distance', type=int, default=5000, help='Maximum distance in bp between SVs in a partition')
     group_fasta_cluster.add_argument('--distance_normalizer', type=int, default=900, help='Distance normalizer used for span-position distance')
@@ -47,6 +53,28 @@ Alternatively, it can detect SVs from existing reads alignments in SAM/BAM forma
     group_fasta_combine.add_argument('--trans_partition_max_distance', type=int, default=200, help='Maximum distance in bp between translocation breakpoints in a partition')
     group_fasta_combine.add_argument('--trans_sv_max_distance', type=int, default=500, help='Maximum distance in bp between a translocation breakpoint and an SV signature to be combined')
     group_fasta_combine.add_argument('--sample', type=str, default="Sample", help='Sample ID to include in output vcf (default: Sample)')
+    group_fasta_output = parser_fasta.add_argument_group('OUTPUT')
+    group_fasta_output.add_argument('--compress_output', action='store_true', help='write VCF files compressed with bgzip and indexed with tabix (.tbi, or .csi for contigs longer than 2^29 bp)')
+    group_fasta_output.add_argument('--index_bed', action='store_true', help='write BED files with signature clusters and candidates sorted by position, compressed with bgzip and indexed with tabix')
+    group_fasta_output.add_argument('--export_columnar', action='store_true', help='export signature clusters and candidates with their numeric fields and member reads as NumPy arrays (.npy files that can be memory-mapped) into signatures/columnar and candidates/columnar')
+    group_fasta_output.add_argument('--compression_threads', type=int, default=1, help='Number of threads to use for compressing output files (default: 1)')
+    group_fasta_resources = parser_fasta.add_argument_group('RESOURCES')
+    group_fasta_resources.add_argument('--max_memory', type=parse_memory_size, default=None, metavar='SIZE', help='Approximate memory budget for COLLECT and CLUSTER (e.g. 16G). SVIM spills SV signatures to the working directory when they approach the budget and clusters them one contig at a time. The run stops early if the signature clusters, which stay in memory until COMBINE, are not expected to fit into the budget. The SV candidates created in COMBINE are not included (default: no limit)')
+    group_fasta_resources.add_argument('--shard_workers', type=int, default=0, metavar='N', help='Analyze windows of large contigs, contigs and groups of small contigs separately from COLLECT to COMBINE in N worker processes and merge the results in the end. The results of each shard are written to the directory shards in the working directory as soon as it is finished. Queryname-sorted input is read completely by every shard, coordinate-sorted input needs to be indexed. The memory budget applies to each worker process. 0 disables sharding unless --work_queue is given (default: 0)')
+    group_fasta_resources.add_argument('--shard_min_length', type=int, default=10000000, help='Contigs shorter than this are grouped into shards of at least this total length (default: 10000000)')
+    group_fasta_resources.add_argument('--shard_window_size', type=int, default=20000000, help='Split contigs longer than this into windows of equal length (or of equal expected cost, see --density_index) that are analyzed in separate shards. Clusters at the edges of windows are reconciled when the results are merged so that they are the same as without windows. 0 disables windows (default: 20000000)')
+    group_fasta_resources.add_argument('--density_index', type=str, metavar='FILE', help='Signature density index (signature_density.npz written into the working directory by a previous run on the same reference) used to split the genome into shards of equal expected cost instead of equal length. By default, the index in the working directory is used if it exists. Without an index, the cost is estimated from the amount of alignment data per window in the BAI index of coordinate-sorted input (which underestimates the clustering cost of dense regions) or the genome is split by length, so balancing is best with an index from an earlier run on a comparable sample. The reconciliation of the windows and COMBINE run after all shards when the results are merged and are not balanced')
+    group_fasta_resources.add_argument('--work_queue', action='store_true', help='Distribute the shards through a work queue in the directory queue in the working directory instead of a pool of worker processes. Besides the --shard_workers local worker processes (which may be 0), any number of workers started with \'svim worker WORKING_DIR\' on nodes that share the working directory and input files claim tasks from the queue. The results are merged by this process when all tasks are finished')
+    group_fasta_resources.add_argument('--task_timeout', type=float, default=600.0, help='Retry a task of the work queue if its worker has not shown signs of life for this many seconds (e.g. because it crashed). The clocks of all nodes must agree to within a fraction of this (default: 600.0)')
+    group_fasta_resources.add_argument('--task_attempts', type=int, default=3, help='Abort the run when a task of the work queue has failed this many times (default: 3)')
+    group_fasta_resources.add_argument('--resume', action='store_true', help='Continue after the last stage (COLLECT or CLUSTER) whose results were saved in the directory checkpoints in the working directory by a previous run with the same input files (same size and modification time), SVIM version and options of this and earlier stages. Checkpoints that are incomplete or do not match their checksum are ignored. In sharded runs, every shard resumes on its own')
+    group_fasta_diagnostics = parser_fasta.add_argument_group('DIAGNOSTICS')
+    group_fasta_diagnostics.add_argument('--progress_interval', type=float, default=30.0, help='Interval in seconds between progress reports with processing rate, percentage done and estimated remaining time. 0 disables progress reports (default: 30.0)')
+    group_fasta_diagnostics.add_argument('--hot_regions', type=int, default=0, metavar='K', help='Record the clustering cost (signatures, graph edges, cliques and time) of every partition and write the K most expensive partitions and genomic regions to hot_partitions.bed and hot_regions.bed in the working directory. 0 disables the hot region profiler (default: 0)')
+    group_fasta_diagnostics.add_argument('--metrics_interval', type=float, default=0, help='Periodically rewrite the file metrics.prom in the working directory with metrics of the running process in Prometheus text format (current stage, processed reads, signatures, remaining partitions, memory usage and throughput). Interval in seconds between updates (the file is also rewritten during long steps without progress), 0 disables the metrics file (default: 0)')
+    group_fasta_diagnostics.add_argument('--profile', nargs='?', const='sampling', choices=['sampling', 'deterministic'], help='profile each stage of the pipeline separately and write the profiles in pstats format to the directory profiles in the working directory. Sampling profiling (the default) has a low overhead, deterministic profiling with cProfile records every function call.')
+    group_fasta_diagnostics.add_argument('--profile_interval', type=float, default=5.0, help='Sampling interval of the sampling profiler in ms of CPU time (default: 5.0)')
+    group_fasta_diagnostics.add_argument('--profile_top', type=int, default=20, help='Number of functions from each stage profile to summarize in the log (default: 20)')
 
     parser_bam = subparsers.add_parser('alignment', help='Detect SVs from an existing alignment')
     parser_bam.add_argument('working_dir', type=os.path.abspath, help='working directory')
@@ -59,6 +87,8 @@ Alternatively, it can detect SVs from existing reads alignments in SAM/BAM forma
     group_bam_collect.add_argument('--skip_segment', action='store_true', help='disable signature collection from between read alignments')
     group_bam_collect.add_argument('--segment_gap_tolerance', type=int, default=10, help='Maximum tolerated gap between adjacent alignment segments')
     group_bam_collect.add_argument('--segment_overlap_tolerance', type=int, default=5, help='Maximum tolerated overlap between adjacent alignment segments')
+    group_bam_collect.add_argument('--regions', type=str, metavar='REGIONS', help='only detect SVs in these regions: a BED file or a comma-separated list of regions (e.g. chr1,chr2:1000000-2000000). Coordinate-sorted BAM files need an index and only the alignments in these regions are read.')
+    group_bam_collect.add_argument('--exclude', type=str, metavar='REGIONS', help='do not detect SVs in these regions (e.g. centromeres, gaps or problematic loci): a BED file or a comma-separated list of regions')
     group_bam_cluster = parser_bam.add_argument_group('CLUSTER')
     group_bam_cluster.add_argument('--partition_max_distance', type=int, default=5000, help='Maximum distance in bp between SVs in a partition')
     group_bam_cluster.add_argument('--distance_normalizer', type=int, default=900, help='Distance normalizer used for span-position distance')
@@ -69,10 +99,81 @@ Alternatively, it can detect SVs from existing reads alignments in SAM/BAM forma
     group_bam_combine.add_argument('--trans_partition_max_distance', type=int, default=200, help='Maximum distance in bp between translocation breakpoints in a partition')
     group_bam_combine.add_argument('--trans_sv_max_distance', type=int, default=500, help='Maximum distance in bp between a translocation breakpoint and an SV signature to be combined')
     group_bam_combine.add_argument('--sample', type=str, default="Sample", help='Sample ID to include in output vcf (default: Sample)')
+    group_bam_output = parser_bam.add_argument_group('OUTPUT')
+    group_bam_output.add_argument('--compress_output', action='store_true', help='write VCF files compressed with bgzip and indexed with tabix (.tbi, or .csi for contigs longer than 2^29 bp)')
+    group_bam_output.add_argument('--index_bed', action='store_true', help='write BED files with signature clusters and candidates sorted by position, compressed with bgzip and indexed with tabix')
+    group_bam_output.add_argument('--export_columnar', action='store_true', help='export signature clusters and candidates with their numeric fields and member reads as NumPy arrays (.npy files that can be memory-mapped) into signatures/columnar and candidates/columnar')
+    group_bam_output.add_argument('--compression_threads', type=int, default=1, help='Number of threads to use for compressing output files (default: 1)')
+    group_bam_resources = parser_bam.add_argument_group('RESOURCES')
+    group_bam_resources.add_argument('--max_memory', type=parse_memory_size, default=None, metavar='SIZE', help='Approximate memory budget for COLLECT and CLUSTER (e.g. 16G). SVIM spills SV signatures to the working directory when they approach the budget and clusters them one contig at a time. The run stops early if the signature clusters, which stay in memory until COMBINE, are not expected to fit into the budget. The SV candidates created in COMBINE are not included (default: no limit)')
+    group_bam_resources.add_argument('--shard_workers', type=int, default=0, metavar='N', help='Analyze windows of large contigs, contigs and groups of small contigs separately from COLLECT to COMBINE in N worker processes and merge the results in the end. The results of each shard are written to the directory shards in the working directory as soon as it is finished. Queryname-sorted input is read completely by every shard, coordinate-sorted input needs to be indexed. The memory budget applies to each worker process. 0 disables sharding unless --work_queue is given (default: 0)')
+    group_bam_resources.add_argument('--shard_min_length', type=int, default=10000000, help='Contigs shorter than this are grouped into shards of at least this total length (default: 10000000)')
+    group_bam_resources.add_argument('--shard_window_size', type=int, default=20000000, help='Split contigs longer than this into windows of equal length (or of equal expected cost, see --density_index) that are analyzed in separate shards. Clusters at the edges of windows are reconciled when the results are merged so that they are the same as without windows. 0 disables windows (default: 20000000)')
+    group_bam_resources.add_argument('--density_index', type=str, metavar='FILE', help='Signature density index (signature_density.npz written into the working directory by a previous run on the same reference) used to split the genome into shards of equal expected cost instead of equal length. By default, the index in the working directory is used if it exists. Without an index, the cost is estimated from the amount of alignment data per window in the BAI index of coordinate-sorted input (which underestimates the clustering cost of dense regions) or the genome is split by length, so balancing is best with an index from an earlier run on a comparable sample. The reconciliation of the windows and COMBINE run after all shards when the results are merged and are not balanced')
+    group_bam_resources.add_argument('--work_queue', action='store_true', help='Distribute the shards through a work queue in the directory queue in the working directory instead of a pool of worker processes. Besides the --shard_workers local worker processes (which may be 0), any number of workers started with \'svim worker WORKING_DIR\' on nodes that share the working directory and input files claim tasks from the queue. The results are merged by this process when all tasks are finished')
+    group_bam_resources.add_argument('--task_timeout', type=float, default=600.0, help='Retry a task of the work queue if its worker has not shown signs of life for this many seconds (e.g. because it crashed). The clocks of all nodes must agree to within a fraction of this (default: 600.0)')
+    group_bam_resources.add_argument('--task_attempts', type=int, default=3, help='Abort the run when a task of the work queue has failed this many times (default: 3)')
+    group_bam_resources.add_argument('--resume', action='store_true', help='Continue after the last stage (COLLECT or CLUSTER) whose results were saved in the directory checkpoints in the working directory by a previous run with the same input files (same size and modification time), SVIM version and options of this and earlier stages. Checkpoints that are incomplete or do not match their checksum are ignored. In sharded runs, every shard resumes on its own')
+    group_bam_diagnostics = parser_bam.add_argument_group('DIAGNOSTICS')
+    group_bam_diagnostics.add_argument('--progress_interval', type=float, default=30.0, help='Interval in seconds between progress reports with processing rate, percentage done and estimated remaining time. 0 disables progress reports (default: 30.0)')
+    group_bam_diagnostics.add_argument('--hot_regions', type=int, default=0, metavar='K', help='Record the clustering cost (signatures, graph edges, cliques and time) of every partition and write the K most expensive partitions and genomic regions to hot_partitions.bed and hot_regions.bed in the working directory. 0 disables the hot region profiler (default: 0)')
+    group_bam_diagnostics.add_argument('--metrics_interval', type=float, default=0, help='Periodically rewrite the file metrics.prom in the working directory with metrics of the running process in Prometheus text format (current stage, processed reads, signatures, remaining partitions, memory usage and throughput). Interval in seconds between updates (the file is also rewritten during long steps without progress), 0 disables the metrics file (default: 0)')
+    group_bam_diagnostics.add_argument('--profile', nargs='?', const='sampling', choices=['sampling', 'deterministic'], help='profile each stage of the pipeline separately and write the profiles in pstats format to the directory profiles in the working directory. Sampling profiling (the default) has a low overhead, deterministic profiling with cProfile records every function call.')
+    group_bam_diagnostics.add_argument('--profile_interval', type=float, default=5.0, help='Sampling interval of the sampling profiler in ms of CPU time (default: 5.0)')
+    group_bam_diagnostics.add_argument('--profile_top', type=int, default=20, help='Number of functions from each stage profile to summarize in the log (default: 20)')
+
+    parser_sweep = subparsers.add_parser('sweep', help='Run COLLECT once and CLUSTER and COMBINE with every combination of the given parameter values')
+    parser_sweep.add_argument('working_dir', type=os.path.abspath, help='working directory')
+    parser_sweep.add_argument('bam_file', type=str, help='SAM/BAM file with aligned long reads (sorted, preferentially on queryname with \'samtools sort -n\')')
+    group_sweep_collect = parser_sweep.add_argument_group('COLLECT')
+    group_sweep_collect.add_argument('--min_mapq', type=int, default=20, help='Minimum mapping quality of reads to consider')
+    group_sweep_collect.add_argument('--min_sv_size', type=int, default=40, help='Minimum SV size to detect')
+    group_sweep_collect.add_argument('--max_sv_size', type=int, default=100000, help='Maximum SV size to detect')
+    group_sweep_collect.add_argument('--skip_indel', action='store_true', help='disable signature collection from within read alignments')
+    group_sweep_collect.add_argument('--skip_segment', action='store_true', help='disable signature collection from between read alignments')
+    group_sweep_collect.add_argument('--segment_gap_tolerance', type=int, default=10, help='Maximum tolerated gap between adjacent alignment segments')
+    group_sweep_collect.add_argument('--segment_overlap_tolerance', type=int, default=5, help='Maximum tolerated overlap between adjacent alignment segments')
+    group_sweep_collect.add_argument('--regions', type=str, metavar='REGIONS', help='only detect SVs in these regions: a BED file or a comma-separated list of regions (e.g. chr1,chr2:1000000-2000000). Coordinate-sorted BAM files need an index and only the alignments in these regions are read.')
+    group_sweep_collect.add_argument('--exclude', type=str, metavar='REGIONS', help='do not detect SVs in these regions (e.g. centromeres, gaps or problematic loci): a BED file or a comma-separated list of regions')
+    group_sweep_grid = parser_sweep.add_argument_group('GRID', 'comma-separated lists of parameter values (see the CLUSTER and COMBINE options of the alignment mode)')
+    group_sweep_grid.add_argument('--partition_max_distance', type=parse_value_list(int), default=[5000], metavar='VALUES', help='Maximum distance in bp between SVs in a partition (default: 5000)')
+    group_sweep_grid.add_argument('--distance_normalizer', type=parse_value_list(int), default=[900], metavar='VALUES', help='Distance normalizer used for span-position distance (default: 900)')
+    group_sweep_grid.add_argument('--cluster_max_distance', type=parse_value_list(float), default=[0.7], metavar='VALUES', help='Maximum span-position distance between SVs in a cluster (default: 0.7)')
+    group_sweep_grid.add_argument('--del_ins_dup_max_distance', type=parse_value_list(float), default=[1.0], metavar='VALUES', help='Maximum span-position distance between the origin of an insertion and a deletion to be flagged as a potential cut&paste insertion (default: 1.0)')
+    group_sweep_grid.add_argument('--trans_destination_partition_max_distance', type=parse_value_list(int), default=[1000], metavar='VALUES', help='Maximum distance in bp between translocation breakpoint destinations in a partition (default: 1000)')
+    group_sweep_grid.add_argument('--trans_partition_max_distance', type=parse_value_list(int), default=[200], metavar='VALUES', help='Maximum distance in bp between translocation breakpoints in a partition (default: 200)')
+    group_sweep_grid.add_argument('--trans_sv_max_distance', type=parse_value_list(int), default=[500], metavar='VALUES', help='Maximum distance in bp between a translocation breakpoint and an SV signature to be combined (default: 500)')
+    group_sweep_combine = parser_sweep.add_argument_group('COMBINE')
+    group_sweep_combine.add_argument('--sample', type=str, default="Sample", help='Sample ID to include in output vcf (default: Sample)')
+    group_sweep_output = parser_sweep.add_argument_group('OUTPUT')
+    group_sweep_output.add_argument('--compress_output', action='store_true', help='write VCF files compressed with bgzip and indexed with tabix (.tbi, or .csi for contigs longer than 2^29 bp)')
+    group_sweep_output.add_argument('--index_bed', action='store_true', help='write BED files with signature clusters and candidates sorted by position, compressed with bgzip and indexed with tabix')
+    group_sweep_output.add_argument('--export_columnar', action='store_true', help='export signature clusters and candidates with their numeric fields and member reads as NumPy arrays (.npy files that can be memory-mapped) into signatures/columnar and candidates/columnar')
+    group_sweep_output.add_argument('--compression_threads', type=int, default=1, help='Number of threads to use for compressing output files (default: 1)')
+    group_sweep_resources = parser_sweep.add_argument_group('RESOURCES')
+    group_sweep_resources.add_argument('--sweep_workers', type=int, default=1, metavar='N', help='Number of worker processes that run the configurations of the grid. Each worker clusters the signatures again only when the CLUSTER parameters change (default: 1)')
+    group_sweep_diagnostics = parser_sweep.add_argument_group('DIAGNOSTICS')
+    group_sweep_diagnostics.add_argument('--progress_interval', type=float, default=30.0, help='Interval in seconds between progress reports with processing rate, percentage done and estimated remaining time. 0 disables progress reports (default: 30.0)')
+
+    parser_worker = subparsers.add_parser('worker', help='Run tasks from the work queue of a sharded run with --work_queue until all of them are finished')
+    parser_worker.add_argument('working_dir', type=os.path.abspath, help='working directory of the run (the worker waits for the queue to be created)')
+
+    parser_report = subparsers.add_parser('report', help='Plot histograms of signature clusters from a finished run')
+    parser_report.add_argument('working_dir', type=os.path.abspath, help='working directory of a previous run')
 
     return parser.parse_args(arguments)
 
 
+def parse_value_list(value_type):
+    """Return a function that parses a comma-separated list of values of the given type (for argparse)."""
+    def parse(text):
+        try:
+            return [value_type(value) for value in text.split(",") if value.strip() != ""]
+        except ValueError:
+            raise argparse.ArgumentTypeError("invalid list of {0} values: '{1}'".format(value_type.__name__, text))
+    return parse
+
+
 def guess_file_type(reads_path):
     if reads_path.endswith(".fa") or reads_path.endswith(".fasta") or reads_path.endswith(".FA"):
         logging.info("Recognized reads file as FASTA format.")
@@ -0,0 +1,88 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+
+class PositionIndex:
+    """Index of genomic positions on several contigs. The positions of each contig are kept in a sorted array
+    so that all positions within a given distance of a query position are found with two binary searches.
+    """
+    def __init__(self, entries):
+        """Build the index from an iterable of (contig, position, item index) tuples."""
+        entries_by_contig = defaultdict(list)
+        for contig, position, index in entries:
+            entries_by_contig[contig].append((position, index))
+        self.positions = {}
+        self.indices = {}
+        for contig, contig_entries in entries_by_contig.items():
+            contig_entries.sort()
+            self.positions[contig] = [position for position, index in contig_entries]
+            self.indices[contig] = [index for position, index in contig_entries]
+
+
+    def within(self, contig, position, max_distance):
+        """Return the item indices of all positions on contig with a distance of at most max_distance to position."""
+        try:
+            positions = self.positions[contig]
+        except KeyError:
+            return []
+        left = bisect_left(positions, position - max_distance)
+        right = bisect_right(positions, position + max_distance)
+        return self.indices[contig][left:right]
+
+
+class SortedIntervals:
+    """Half-open genomic intervals on several contigs. The intervals of each contig are kept in arrays
+    sorted by start (and end) position together with the index of each interval in the input sequence.
+    """
+    def __init__(self, intervals):
+        """Build the arrays from an iterable of (contig, start, end) tuples."""
+        intervals_by_contig = defaultdict(list)
+        for index, (contig, start, end) in enumerate(intervals):
+            intervals_by_contig[contig].append((start, end, index))
+        self.starts = {}
+        self.ends = {}
+        self.indices = {}
+        for contig, contig_intervals in intervals_by_contig.items():
+            contig_intervals.sort()
+            self.starts[contig] = [start for start, end, index in contig_intervals]
+            self.ends[contig] = [end for start, end, index in contig_intervals]
+            self.indices[contig] = [index for start, end, index in contig_intervals]
+
+
+    def get_contigs(self):
+        return self.starts.keys()
+
+
+def join_overlapping(left, right, predicate=None):
+    """Find all pairs of overlapping intervals from two SortedIntervals objects in a single sweep over each contig.
+    Yields (left index, right index) tuples for every pair of intervals on the same contig that overlap by at
+    least one base and, if a predicate is given, for which predicate(left index, right index) is true."""
+    for contig in left.get_contigs():
+        if contig not in right.starts:
+            continue
+        left_starts, left_ends, left_indices = left.starts[contig], left.ends[contig], left.indices[contig]
+        right_starts, right_ends, right_indices = right.starts[contig], right.ends[contig], right.indices[contig]
+        active = []
+        next_right = 0
+        for left_position in range(len(left_starts)):
+            left_start = left_starts[left_position]
+            left_end = left_ends[left_position]
+            # Activate right intervals starting before the end of the current left interval
+            while next_right < len(right_starts) and right_starts[next_right] < left_end:
+                active.append(next_right)
+                next_right += 1
+            # Right intervals ending before the current left interval cannot overlap any of the following
+            # left intervals either because those start at the same position or later
+            active = [right_position for right_position in active if right_ends[right_position] > left_start]
+            for right_position in active:
+                if right_starts[right_position] < left_end:
+                    if predicate is None or predicate(left_indices[left_position], right_indices[right_position]):
+                        yield (left_indices[left_position], right_indices[right_position])
+
+
+def compact(items, indices_to_remove):
+    """Return a new list with all items except those at the given indices (duplicate indices are allowed)."""
+    keep = [True] * len(items)
+    for index in indices_to_remove:
+        keep[index] = False
+    return [item for item, keep_item in zip(items, keep) if keep_item]
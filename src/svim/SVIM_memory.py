@@ -0,0 +1,225 @@
+import os
+import re
+import sys
+import pickle
+import shutil
+import logging
+
+from collections import Counter, defaultdict
+
+from svim.SVIM_stats import get_current_rss
+from svim.SVIM_progress import format_bytes
+
+
+# Estimated peak memory of clustering a chunk relative to the size of its signatures
+# (sorted copy, partitions, distance graphs, cliques and consolidated clusters)
+CLUSTERING_OVERHEAD = 3.0
+# Estimated memory of the clusters of a chunk relative to the size of its signatures (the clusters keep their
+# member signatures and add the cluster objects and their scores)
+CLUSTER_RESIDENT_OVERHEAD = 1.5
+# Order in which cluster_spilled_signatures loads the spilled signatures (translocations are loaded last, at once)
+CLUSTER_ORDER = ["del", "ins", "inv", "dup", "ins_dup", "tra"]
+# Fraction of the available memory that the signatures held in memory during COLLECT may use
+COLLECT_FRACTION = 0.5
+
+
+class MemoryBudgetError(Exception):
+    """Raised when a run cannot be completed within the memory budget."""
+    pass
+
+
+def parse_memory_size(text):
+    """Parse a memory size such as 500M, 16G or 16GB (binary units) or a number of bytes."""
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$", text, re.IGNORECASE)
+    if match == None:
+        raise ValueError("Invalid memory size: {0}".format(text))
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** "bkmgt".index(unit.lower() or "b"))
+
+
+def estimate_object_size(obj):
+    """Estimate the memory used by a signature-like object: the object itself, its attribute dictionary and
+    the attribute values (which are assumed not to be shared with other objects)."""
+    size = sys.getsizeof(obj)
+    attributes = getattr(obj, "__dict__", None)
+    if attributes != None:
+        size += sys.getsizeof(attributes)
+        values = attributes.values()
+    else:
+        values = [getattr(obj, name) for cls in type(obj).__mro__ for name in getattr(cls, "__slots__", ()) if hasattr(obj, name)]
+    for value in values:
+        size += sys.getsizeof(value)
+    return size
+
+
+def estimate_signature_size(signatures, sample_size=100):
+    """Estimate the average memory per signature (including the reference in a list) from an evenly spaced sample."""
+    if len(signatures) == 0:
+        return 0
+    signature_sample = signatures[::max(1, len(signatures) // sample_size)]
+    return sum(estimate_object_size(signature) for signature in signature_sample) / len(signature_sample) + 8
+
+
+def get_chunk_key(signature):
+    """Return the (type, contig) chunk in which a signature is clustered with a MemoryBudget."""
+    if signature.type == "tra":
+        # Translocations are not clustered and are kept in their original order
+        return ("tra", "")
+    # The first two fields of the key of every other signature type are its type and (source) contig
+    return signature.get_key()[:2]
+
+
+class SignatureSpillStore:
+    """Signatures spilled to disk, grouped by type and (source) contig. Every spill appends one pickled list
+    per group to the group's file, so that each group can later be loaded on its own."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.paths = {}
+        self.counts = Counter()
+        self.sizes = Counter()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+
+    def spill(self, signatures, signature_size):
+        groups = defaultdict(list)
+        for signature in signatures:
+            groups[get_chunk_key(signature)].append(signature)
+        for key, group in groups.items():
+            if key not in self.paths:
+                self.paths[key] = os.path.join(self.directory, "{0}.{1}.pickle".format(key[0], len(self.paths)))
+            with open(self.paths[key], "ab") as spill_file:
+                pickle.dump(group, spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.counts[key] += len(group)
+            self.sizes[key] += len(group) * signature_size
+
+
+    def load(self, key):
+        signatures = []
+        if key not in self.paths:
+            return signatures
+        with open(self.paths[key], "rb") as spill_file:
+            while True:
+                try:
+                    signatures.extend(pickle.load(spill_file))
+                except EOFError:
+                    break
+        return signatures
+
+
+    def get_contigs(self, sv_type):
+        return sorted(contig for signature_type, contig in self.paths.keys() if signature_type == sv_type)
+
+
+    def get_type_counts(self):
+        type_counts = Counter()
+        for (sv_type, contig), count in self.counts.items():
+            type_counts[sv_type] += count
+        return type_counts
+
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class MemoryBudget:
+    """Keep the signatures of a run within a memory budget (in bytes). During COLLECT, signatures are spilled
+    to disk (see SignatureSpillStore) whenever their estimated size exceeds a fraction of the available
+    memory. If any signatures have been spilled, the rest are spilled at the end of COLLECT and CLUSTER loads and
+    clusters one signature type on one contig at a time; otherwise they stay in memory. The signature clusters
+    (with their member signatures) stay in memory until COMBINE, so the run fails early with MemoryBudgetError
+    if clustering a chunk together with the clusters of the chunks before it is not expected to fit into the
+    budget. The memory used by COMBINE for the SV candidates is not part of the budget. If a SignatureDensityIndex
+    is given, the signatures are counted in it before they are spilled.
+    """
+    def __init__(self, max_memory, directory, density=None):
+        self.max_memory = max_memory
+        self.baseline = get_current_rss() or 0
+        self.available = max_memory - self.baseline
+        if self.available <= 0:
+            raise MemoryBudgetError("The memory budget of {0} is smaller than the {1} that SVIM uses before processing any reads.".format(format_bytes(max_memory), format_bytes(self.baseline)))
+        self.store = SignatureSpillStore(directory)
+        self.density = density
+        self.signature_size = None
+        self.spills = 0
+
+
+    def get_required_memory(self, chunk_size, resident_size=0):
+        """Return the budget (in bytes) required to cluster a chunk of signatures of the given estimated size while
+        the clusters of signatures of resident_size (estimated size of their signatures) are held in memory."""
+        return int(self.baseline + resident_size * CLUSTER_RESIDENT_OVERHEAD + chunk_size * CLUSTERING_OVERHEAD)
+
+
+    def check_chunks(self, counts=None, sizes=None):
+        """Raise a MemoryBudgetError if clustering the signatures one chunk at a time (in the order of
+        cluster_spilled_signatures) is not expected to fit into the budget. The clusters of all earlier chunks stay
+        in memory until COMBINE, so the estimate grows with every spill and the last chunk needs the most memory.
+        counts and sizes give the number and estimated size of the signatures by (type, contig) chunk (by default
+        those of the spilled signatures)."""
+        if counts == None:
+            counts, sizes = self.store.counts, self.store.sizes
+        resident_size = 0
+        for sv_type in CLUSTER_ORDER:
+            for contig in sorted(contig for signature_type, contig in counts.keys() if signature_type == sv_type):
+                size = sizes[(sv_type, contig)]
+                description = "{0} {1} signatures on contig {2}".format(counts[(sv_type, contig)], sv_type, contig) if sv_type != "tra" else "{0} translocation signatures".format(counts[(sv_type, contig)])
+                if self.get_required_memory(size) > self.max_memory:
+                    raise MemoryBudgetError("Clustering the {0} needs approximately {1} of memory (estimated {2} for the signatures), which exceeds the memory budget of {3}. Increase --max_memory to at least {1}.".format(
+                        description, format_bytes(self.get_required_memory(size)), format_bytes(size), format_bytes(self.max_memory)))
+                if self.get_required_memory(size, resident_size) > self.max_memory:
+                    raise MemoryBudgetError("Clustering the {0} while the clusters of the previous contigs and types are held in memory needs approximately {1} (estimated {2} for the clusters), which exceeds the memory budget of {3}. Increase --max_memory to at least {1}.".format(
+                        description, format_bytes(self.get_required_memory(size, resident_size)), format_bytes(int(resident_size * CLUSTER_RESIDENT_OVERHEAD)), format_bytes(self.max_memory)))
+                resident_size += size
+
+
+    def check_collect(self, signatures):
+        """Spill the signatures if they approach the budget. Returns the number of signatures that have been spilled
+        (and removed from the list)."""
+        if len(signatures) == 0:
+            return 0
+        if self.signature_size == None:
+            self.signature_size = estimate_signature_size(signatures)
+        if len(signatures) * self.signature_size < COLLECT_FRACTION * self.available:
+            return 0
+        spilled = len(signatures)
+        self.spill(signatures)
+        return spilled
+
+
+    def spill(self, signatures):
+        self.signature_size = estimate_signature_size(signatures)
+        logging.info("Spilling {0} signatures (approximately {1}) to {2}".format(len(signatures), format_bytes(len(signatures) * self.signature_size), self.store.directory))
+        if self.density != None:
+            self.density.add(signatures)
+        self.store.spill(signatures, self.signature_size)
+        del signatures[:]
+        self.spills += 1
+        self.check_chunks()
+
+
+    def finish_collect(self, signatures):
+        """Spill the remaining signatures if any have been spilled before, so that all signatures can be clustered in
+        chunks, and check that all signature clusters are expected to fit into the budget. Otherwise, the signatures
+        stay in memory and are checked by their estimated size."""
+        if self.spills > 0:
+            if len(signatures) > 0:
+                self.spill(signatures)
+            self.check_chunks()
+        elif len(signatures) > 0:
+            if self.signature_size == None:
+                self.signature_size = estimate_signature_size(signatures)
+            counts = Counter(get_chunk_key(signature) for signature in signatures)
+            self.check_chunks(counts, dict((key, count * self.signature_size) for key, count in counts.items()))
+
+
+    def iterate_chunks(self, sv_type):
+        """Yield (contig, signatures) tuples with the spilled signatures of a type, one contig at a time."""
+        for contig in self.store.get_contigs(sv_type):
+            yield contig, self.store.load((sv_type, contig))
+
+
+    def load_all(self, sv_type):
+        signatures = []
+        for contig, chunk in self.iterate_chunks(sv_type):
+            signatures.extend(chunk)
+        return signatures
@@ -3,27 +3,44 @@ from __future__ import print_function
 import sys
 from bisect import bisect_left
 from collections import defaultdict
-from math import pow, sqrt
+from math import pow, ceil
 
 from svim.SVSignature import SignatureTranslocation, SignatureInsertionFrom, SignatureClusterBiLocal
 from svim.SVCandidate import CandidateDuplicationInterspersed
+from svim.SVIM_intervals import PositionIndex
+from svim.SVIM_progress import ProgressReporter
+from svim.SVIM_stats import get_run_stats
 
 def flag_cutpaste_candidates(insertion_from_signature_clusters, deletion_signature_clusters, options):
     """Flag duplication signature clusters if they overlap a deletion"""
+    # The span-position distance of two clusters is at least the minimal distance between their starts, ends or
+    # centers divided by the distance normalizer. Only deletion clusters with their start, end or center within
+    # the resulting window around the origin of an insertion can therefore be close enough to flag it.
+    max_location_distance = int(ceil(options.del_ins_dup_max_distance * options.distance_normalizer)) + 1
+    deletion_starts = PositionIndex((del_cluster.contig, del_cluster.start, del_index) for del_index, del_cluster in enumerate(deletion_signature_clusters))
+    deletion_ends = PositionIndex((del_cluster.contig, del_cluster.end, del_index) for del_index, del_cluster in enumerate(deletion_signature_clusters))
+    deletion_centers = PositionIndex((del_cluster.contig, (del_cluster.start + del_cluster.end) // 2, del_index) for del_index, del_cluster in enumerate(deletion_signature_clusters))
+
     int_duplication_candidates = []
-    for ins_cluster in insertion_from_signature_clusters:
-        # Compute distances of every deletion cluster to the current insertion/duplication
-        distances = [(del_index, del_cluster.span_loc_distance(ins_cluster, options.distance_normalizer)) for del_index, del_cluster in enumerate(deletion_signature_clusters)]
-        closest_deletion_index, closest_deletion = sorted(distances, key=lambda obj: obj[1])[0]
+    progress = ProgressReporter(get_run_stats().get_current_stage() or "COMBINE", options.progress_interval, "insertions", len(insertion_from_signature_clusters))
+    for num, ins_cluster in enumerate(insertion_from_signature_clusters):
+        if num % 1000 == 0:
+            progress.update(num)
         source_contig, source_start, source_end = ins_cluster.get_source()
         dest_contig, dest_start, dest_end = ins_cluster.get_destination()
+        # Compute distances of all deletion clusters within reach to the current insertion/duplication
+        nearby_deletion_indices = set(deletion_starts.within(source_contig, source_start, max_location_distance))
+        nearby_deletion_indices.update(deletion_ends.within(source_contig, source_end, max_location_distance))
+        nearby_deletion_indices.update(deletion_centers.within(source_contig, (source_start + source_end) // 2, max_location_distance))
+        close_deletion_found = any(deletion_signature_clusters[del_index].span_loc_distance(ins_cluster, options.distance_normalizer) <= options.del_ins_dup_max_distance for del_index in nearby_deletion_indices)
         # If close deletion cluster found
-        if closest_deletion <= options.del_ins_dup_max_distance:
+        if close_deletion_found:
             #Potential cut&paste insertion
             int_duplication_candidates.append(CandidateDuplicationInterspersed(source_contig, source_start, source_end, dest_contig, dest_start, dest_end, ins_cluster.members, ins_cluster.score, ins_cluster.std_span, ins_cluster.std_pos, cutpaste=True))
         else:
             #Interspersed duplication
             int_duplication_candidates.append(CandidateDuplicationInterspersed(source_contig, source_start, source_end, dest_contig, dest_start, dest_end, ins_cluster.members, ins_cluster.score, ins_cluster.std_span, ins_cluster.std_pos, cutpaste=False))
+    progress.finish(len(insertion_from_signature_clusters))
     return int_duplication_candidates
 
 
@@ -48,29 +65,6 @@ def get_closest_index(input_list, input_number):
        return pos - 1
 
 
-def distance_positions(position1, position2):
-    return float("inf") if position1[0] != position2[0] else abs(position1[1] - position2[1])
-
-
-def cluster_positions_simple(positions, max_delta):
-    """Form partitions of (contig, position) pairs using simple distance."""
-    sorted_positions = sorted(positions, key=lambda position: (position[0], position[1]))
-    partitions = []
-    current_partition = []
-    for position in sorted_positions:
-        if len(current_partition) < 1:
-            current_partition.append(position)
-            continue
-        if distance_positions(current_partition[0], position) > max_delta:
-            partitions.append(current_partition[:])
-            while len(current_partition) > 0 and distance_positions(current_partition[0], position) > max_delta:
-                current_partition.pop(0)
-        current_partition.append(position)
-    if len(current_partition) > 0:
-        partitions.append(current_partition[:])
-    return partitions
-
-
 def calculate_score_deletion(main_score, translocation_distances, translocation_stds, translocation_deviation):
     """Calculate the score of a merged insertion detected from a deletion.
        Parameters: - main_score - score of the underlying main deletion
@@ -132,37 +126,40 @@ def calculate_score_insertion(main_score, translocation_distances, translocation
     return final_score
 
 
-def merge_translocations_at_insertions(translocation_partitions_fwdfwd_dict, translocation_partition_means_fwdfwd_dict, translocation_partition_stds_fwdfwd_dict, translocation_partitions_revrev_dict, translocation_partition_means_revrev_dict, translocation_partition_stds_revrev_dict, insertion_signature_clusters, options):
+def merge_translocations_at_insertions(translocation_index_fwdfwd, translocation_index_revrev, insertion_signature_clusters, options):
+    """Combine inserted regions with flanking translocation breakpoints pointing to a single region of origin.
+    Parameters: - translocation_index_fwdfwd, translocation_index_revrev - TranslocationBreakpointIndex of fwd/fwd and rev/rev translocation breakpoints"""
     inserted_regions_to_remove = []
     insertion_from_signature_clusters = []
+    progress = ProgressReporter(get_run_stats().get_current_stage() or "COMBINE", options.progress_interval, "inserted regions", len(insertion_signature_clusters))
     for insertion_index, ins_cluster in enumerate(insertion_signature_clusters):
+        if insertion_index % 1000 == 0:
+            progress.update(insertion_index)
         ins_contig, ins_start, ins_end = ins_cluster.get_source()
-        try:
-            closest_to_start_fwdfwd_index = get_closest_index(translocation_partition_means_fwdfwd_dict[ins_contig], ins_start)
-            closest_to_start_fwdfwd_mean = translocation_partition_means_fwdfwd_dict[ins_contig][closest_to_start_fwdfwd_index]
-            closest_to_start_revrev_index = get_closest_index(translocation_partition_means_revrev_dict[ins_contig], ins_start)
-            closest_to_start_revrev_mean = translocation_partition_means_revrev_dict[ins_contig][closest_to_start_revrev_index]
-        except KeyError:
+        closest_to_start_fwdfwd_index = translocation_index_fwdfwd.get_closest_partition(ins_contig, ins_start)
+        closest_to_start_revrev_index = translocation_index_revrev.get_closest_partition(ins_contig, ins_start)
+        if closest_to_start_fwdfwd_index == None or closest_to_start_revrev_index == None:
             continue
+        closest_to_start_fwdfwd_mean = translocation_index_fwdfwd.get_mean(ins_contig, closest_to_start_fwdfwd_index)
+        closest_to_start_revrev_mean = translocation_index_revrev.get_mean(ins_contig, closest_to_start_revrev_index)
         # if translocations found close to start of insertion
         if abs(closest_to_start_fwdfwd_mean - ins_start) <= options.trans_sv_max_distance and abs(closest_to_start_revrev_mean - ins_start) <= options.trans_sv_max_distance:
-            destinations_from_start_fwdfwd = cluster_positions_simple([(signature.contig2, signature.pos2) for signature in translocation_partitions_fwdfwd_dict[ins_contig][closest_to_start_fwdfwd_index]], options.trans_destination_partition_max_distance)
-            destinations_from_start_revrev = cluster_positions_simple([(signature.contig2, signature.pos2) for signature in translocation_partitions_revrev_dict[ins_contig][closest_to_start_revrev_index]], options.trans_destination_partition_max_distance)
+            destination_from_start_fwdfwd = translocation_index_fwdfwd.get_destination(ins_contig, closest_to_start_fwdfwd_index)
+            destination_from_start_revrev = translocation_index_revrev.get_destination(ins_contig, closest_to_start_revrev_index)
             # if translocations point to only one destination each
-            if len(destinations_from_start_fwdfwd) == 1 and len(destinations_from_start_revrev) == 1:
-                destination_from_start_fwdfwd = (destinations_from_start_fwdfwd[0][0][0], int(round(sum([pos for contig, pos in destinations_from_start_fwdfwd[0]]) / len(destinations_from_start_fwdfwd[0]))))
-                destination_from_start_fwdfwd_std = int(round(sqrt(sum([pow(abs(pos - destination_from_start_fwdfwd[1]), 2) for contig, pos in destinations_from_start_fwdfwd[0]]) / len(destinations_from_start_fwdfwd[0]))))
-                destination_from_start_revrev = (destinations_from_start_revrev[0][0][0], int(round(sum([pos for contig, pos in destinations_from_start_revrev[0]]) / len(destinations_from_start_revrev[0]))))
-                destination_from_start_revrev_std = int(round(sqrt(sum([pow(abs(pos - destination_from_start_revrev[1]), 2) for contig, pos in destinations_from_start_revrev[0]]) / len(destinations_from_start_revrev[0]))))
+            if destination_from_start_fwdfwd != None and destination_from_start_revrev != None:
+                destination_from_start_fwdfwd_contig, destination_from_start_fwdfwd_mean, destination_from_start_fwdfwd_std = destination_from_start_fwdfwd
+                destination_from_start_revrev_contig, destination_from_start_revrev_mean, destination_from_start_revrev_std = destination_from_start_revrev
                 # if the two destinations have the right distance
-                distance = abs(destination_from_start_revrev[1] - destination_from_start_fwdfwd[1])
-                if destination_from_start_revrev[0] == destination_from_start_fwdfwd[0] and 0.95 <= ((ins_end - ins_start + 1) / (distance + 1)) <= 1.1:
-                    members = ins_cluster.members + translocation_partitions_fwdfwd_dict[ins_contig][closest_to_start_fwdfwd_index] + translocation_partitions_revrev_dict[ins_contig][closest_to_start_revrev_index]
+                distance = abs(destination_from_start_revrev_mean - destination_from_start_fwdfwd_mean)
+                if destination_from_start_revrev_contig == destination_from_start_fwdfwd_contig and 0.95 <= ((ins_end - ins_start + 1) / (distance + 1)) <= 1.1:
+                    members = ins_cluster.members + translocation_index_fwdfwd.get_members(ins_contig, closest_to_start_fwdfwd_index) + translocation_index_revrev.get_members(ins_contig, closest_to_start_revrev_index)
                     score = calculate_score_insertion(ins_cluster.score, 
                                                       [abs(closest_to_start_fwdfwd_mean - ins_start), abs(closest_to_start_revrev_mean - ins_start)], 
-                                                      [translocation_partition_stds_fwdfwd_dict[ins_contig][closest_to_start_fwdfwd_index], translocation_partition_stds_revrev_dict[ins_contig][closest_to_start_revrev_index]], 
+                                                      [translocation_index_fwdfwd.get_std(ins_contig, closest_to_start_fwdfwd_index), translocation_index_revrev.get_std(ins_contig, closest_to_start_revrev_index)], 
                                                       [destination_from_start_fwdfwd_std, destination_from_start_revrev_std])
-                    insertion_from_signature_clusters.append(SignatureClusterBiLocal(destination_from_start_revrev[0], min(destination_from_start_revrev[1], destination_from_start_fwdfwd[1]), max(destination_from_start_revrev[1], destination_from_start_fwdfwd[1]), ins_contig, ins_start, ins_start + distance, score, len(members), members, "ins_dup", ins_cluster.std_span, ins_cluster.std_pos))
+                    insertion_from_signature_clusters.append(SignatureClusterBiLocal(destination_from_start_revrev_contig, min(destination_from_start_revrev_mean, destination_from_start_fwdfwd_mean), max(destination_from_start_revrev_mean, destination_from_start_fwdfwd_mean), ins_contig, ins_start, ins_start + distance, score, len(members), members, "ins_dup", ins_cluster.std_span, ins_cluster.std_pos))
                     inserted_regions_to_remove.append(insertion_index)
 
+    progress.finish(len(insertion_signature_clusters))
     return insertion_from_signature_clusters, inserted_regions_to_remove
@@ -0,0 +1,164 @@
+import os
+import logging
+import threading
+
+from collections import Counter, OrderedDict
+from time import perf_counter, time
+
+from svim.SVIM_stats import get_current_rss, get_peak_rss
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_metric(name, metric_type, description, samples):
+    """Format a metric in the Prometheus text exposition format. samples is a list of (labels, value) tuples."""
+    lines = ["# HELP {0} {1}".format(name, description), "# TYPE {0} {1}".format(name, metric_type)]
+    for labels, value in samples:
+        if value == None:
+            continue
+        if len(labels) > 0:
+            label_string = "{" + ",".join("{0}=\"{1}\"".format(key, escape_label_value(label)) for key, label in labels) + "}"
+        else:
+            label_string = ""
+        lines.append("{0}{1} {2}".format(name, label_string, repr(float(value)) if isinstance(value, float) else value))
+    return "\n".join(lines) + "\n"
+
+
+def write_atomically(path, text):
+    """Write text into a temporary file next to path and rename it so that readers never see a partial file."""
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as temporary_file:
+        temporary_file.write(text)
+    os.replace(temporary_path, path)
+
+
+class MetricsWriter:
+    """Periodically rewrites a metrics file in the Prometheus text format (e.g. for the textfile collector
+    of the node exporter) with the current stage, processed reads, signatures per type, remaining partitions,
+    memory usage and throughput. It is registered both as a stage listener (see RunStats) and as a progress
+    listener (see ProgressReporter). The file is rewritten at every stage boundary and at most once per
+    interval (in seconds) on progress updates, so that the cost during COLLECT is a single clock read.
+    During steps without progress updates (e.g. the clique search of a large partition), a daemon thread
+    rewrites the file with the last known values once the last write is older than the interval.
+    """
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.start_time = perf_counter()
+        self.last_write_time = self.start_time
+        self.stages = []
+        self.stage_start_times = []
+        self.finished = False
+        # Most recent (items, rate, remaining work) by progress reporter name and item unit
+        self.progress = OrderedDict()
+        # Reads processed by finished reporters and by the running COLLECT reporter
+        self.finished_reads = 0
+        self.current_reads = 0
+        self.collect_reporter = None
+        # Signatures counted so far and the number of results of the current COLLECT reporter counted
+        self.signatures = Counter()
+        self.counted_results = 0
+        # Guards the values above against the writes of the timer thread
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.timer = None
+        if self.interval > 0:
+            self.timer = threading.Thread(target=self.run_timer, name="MetricsWriter", daemon=True)
+            self.timer.start()
+
+
+    def run_timer(self):
+        delay = self.interval
+        while not self.stopped.wait(delay):
+            delay = self.last_write_time + self.interval - perf_counter()
+            if delay <= 0:
+                try:
+                    self.write()
+                except OSError as error:
+                    logging.warning("Cannot write the metrics file {0}: {1}".format(self.path, error))
+                delay = self.interval
+
+
+    def stage_started(self, name):
+        with self.lock:
+            self.stages.append(name)
+            self.stage_start_times.append(perf_counter())
+        self.write()
+
+
+    def stage_finished(self, name):
+        with self.lock:
+            self.stages.pop()
+            self.stage_start_times.pop()
+        self.write()
+
+
+    def progress_updated(self, reporter, items, work_done):
+        now = perf_counter()
+        elapsed = now - reporter.start_time
+        remaining = reporter.work_total - items if reporter.work_total and reporter.work_unit == None else None
+        with self.lock:
+            if reporter.item_unit == "reads":
+                self.update_reads(reporter, items)
+            self.progress[(reporter.name, reporter.item_unit)] = (items, items / elapsed if elapsed > 0 else 0.0, remaining)
+        if now - self.last_write_time >= self.interval:
+            self.write()
+
+
+    def update_reads(self, reporter, items):
+        if reporter is not self.collect_reporter:
+            self.finished_reads += self.current_reads
+            self.collect_reporter = reporter
+            self.counted_results = 0
+        self.current_reads = items
+        if reporter.results != None:
+            # Only count the results produced since the last update
+            for signature in reporter.results[max(0, self.counted_results - reporter.removed_results):]:
+                self.signatures[signature.type] += 1
+            self.counted_results = reporter.removed_results + len(reporter.results)
+
+
+    def finish(self):
+        """Stop the timer thread and write the metrics a final time marking the run as finished."""
+        self.stopped.set()
+        if self.timer != None:
+            self.timer.join()
+        self.finished = True
+        self.write()
+
+
+    def get_metrics(self):
+        now = perf_counter()
+        if len(self.stages) > 0:
+            stage_samples = [((("stage", self.stages[-1]),), 1)]
+            stage_elapsed = now - self.stage_start_times[-1]
+        else:
+            stage_samples = [((("stage", "none"),), 1)]
+            stage_elapsed = None
+        text = format_metric("svim_stage", "gauge", "Currently running pipeline stage (value is always 1).", stage_samples)
+        text += format_metric("svim_stage_elapsed_seconds", "gauge", "Time since the current stage started.", [((), stage_elapsed)])
+        text += format_metric("svim_elapsed_seconds", "gauge", "Time since the run started.", [((), now - self.start_time)])
+        text += format_metric("svim_finished", "gauge", "Whether the run has finished.", [((), 1 if self.finished else 0)])
+        text += format_metric("svim_reads_processed_total", "counter", "Reads analyzed in COLLECT.", [((), self.finished_reads + self.current_reads)])
+        text += format_metric("svim_signatures_total", "counter", "SV signatures collected by type.",
+                              [((("type", signature_type),), count) for signature_type, count in sorted(self.signatures.items())])
+        text += format_metric("svim_partitions_remaining", "gauge", "Partitions that remain to be clustered.",
+                              [((("stage", name),), remaining) for (name, unit), (items, rate, remaining) in self.progress.items() if unit == "partitions"])
+        text += format_metric("svim_throughput", "gauge", "Items processed per second by the most recent progress update of each step.",
+                              [((("stage", name), ("unit", unit)), rate) for (name, unit), (items, rate, remaining) in self.progress.items()])
+        current_rss, peak_rss = get_current_rss(), get_peak_rss()
+        # ru_maxrss and /proc/self/statm are measured differently, so the peak may lag behind the current size
+        if current_rss != None and peak_rss != None:
+            peak_rss = max(peak_rss, current_rss)
+        text += format_metric("svim_resident_memory_bytes", "gauge", "Current resident set size.", [((), current_rss)])
+        text += format_metric("svim_peak_resident_memory_bytes", "gauge", "Peak resident set size.", [((), peak_rss)])
+        text += format_metric("svim_last_update_timestamp_seconds", "gauge", "Unix time of the last update of this file.", [((), time())])
+        return text
+
+
+    def write(self):
+        with self.lock:
+            self.last_write_time = perf_counter()
+            write_atomically(self.path, self.get_metrics())
@@ -0,0 +1,338 @@
+import io
+import struct
+import zlib
+
+from collections import OrderedDict, defaultdict
+from heapq import merge
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Maximum amount of uncompressed data per BGZF block (same as htslib)
+BGZF_BLOCK_SIZE = 0xff00
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def compress_block(data, level):
+    """Compress data into a single BGZF block."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    if len(compressed) > 65536 - 26:
+        # Incompressible data: store it uncompressed
+        compressor = zlib.compressobj(0, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+    header = struct.pack("<BBBBIBBHBBHH", 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord("B"), ord("C"), 2, len(compressed) + 25)
+    return header + compressed + struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data))
+
+
+class BgzfWriter:
+    """Buffered writer for BGZF-compressed files. Full blocks are compressed by a pool of threads (zlib releases
+    the GIL while compressing) and written in order. Positions in the uncompressed stream are returned as
+    (block number, offset in block) tuples because the compressed offset of a block is only known after all
+    preceding blocks have been compressed. get_virtual_offsets() converts them once the file is closed.
+    """
+    def __init__(self, path, threads=1, level=6):
+        self.output = open(path, "wb")
+        self.level = level
+        self.buffer = bytearray()
+        self.block_number = 0
+        self.block_sizes = []
+        self.pending = []
+        self.max_pending = 2 * max(1, threads)
+        self.executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+
+
+    def tell(self):
+        """Return the position of the next byte as (block number, offset in block)."""
+        if len(self.buffer) == BGZF_BLOCK_SIZE:
+            return (self.block_number + 1, 0)
+        return (self.block_number, len(self.buffer))
+
+
+    def write(self, data):
+        view = memoryview(data)
+        while len(view) > 0:
+            if len(self.buffer) == BGZF_BLOCK_SIZE:
+                self.flush_block()
+            free = BGZF_BLOCK_SIZE - len(self.buffer)
+            self.buffer.extend(view[:free])
+            view = view[free:]
+
+
+    def flush_block(self):
+        if len(self.buffer) == 0:
+            return
+        data = bytes(self.buffer)
+        self.buffer = bytearray()
+        self.block_number += 1
+        if self.executor == None:
+            self.write_compressed(compress_block(data, self.level))
+        else:
+            self.pending.append(self.executor.submit(compress_block, data, self.level))
+            while len(self.pending) >= self.max_pending:
+                self.write_compressed(self.pending.pop(0).result())
+
+
+    def write_compressed(self, block):
+        self.block_sizes.append(len(block))
+        self.output.write(block)
+
+
+    def close(self):
+        self.flush_block()
+        for future in self.pending:
+            self.write_compressed(future.result())
+        self.pending = []
+        if self.executor != None:
+            self.executor.shutdown()
+        self.output.write(BGZF_EOF)
+        self.output.close()
+
+
+    def get_virtual_offsets(self):
+        """Return a function converting (block number, offset in block) tuples into BGZF virtual offsets."""
+        block_offsets = [0]
+        for block_size in self.block_sizes:
+            block_offsets.append(block_offsets[-1] + block_size)
+        def virtual_offset(position):
+            block_number, offset_in_block = position
+            return (block_offsets[block_number] << 16) | offset_in_block
+        return virtual_offset
+
+
+def reg2bin(beg, end, min_shift, depth):
+    """Return the bin of the 0-based half-open interval [beg, end) in the hierarchical binning scheme."""
+    end -= 1
+    level = depth
+    shift = min_shift
+    while level > 0:
+        if beg >> shift == end >> shift:
+            return ((1 << (3 * level)) - 1) // 7 + (beg >> shift)
+        level -= 1
+        shift += 3
+    return 0
+
+
+def bin_first_position(bin_number, min_shift, depth):
+    """Return the first position covered by a bin."""
+    level = 0
+    first_bin = 0
+    while bin_number >= first_bin + (1 << (3 * level)):
+        first_bin += 1 << (3 * level)
+        level += 1
+    return (bin_number - first_bin) << (min_shift + 3 * (depth - level))
+
+
+def parse_vcf_interval(line):
+    """Return (contig, 0-based start, end) of a VCF record like tabix does: the end is taken from the END
+    field if present and from the length of the reference allele otherwise."""
+    fields = line.split("\t", 8)
+    beg = int(fields[1]) - 1
+    end = beg + len(fields[3])
+    if len(fields) > 7:
+        for info_field in fields[7].split(";"):
+            if info_field.startswith("END="):
+                try:
+                    info_end = int(info_field[4:])
+                except ValueError:
+                    break
+                if info_end > beg:
+                    end = info_end
+                break
+    return fields[0], beg, end
+
+
+def parse_bed_interval(line):
+    """Return (contig, 0-based start, end) of a BED record."""
+    fields = line.split("\t", 3)
+    beg = int(fields[1])
+    end = int(fields[2])
+    return fields[0], beg, max(end, beg + 1)
+
+
+class IndexedWriter:
+    """Writer for coordinate-sorted tab-separated files (VCF or BED) that are BGZF-compressed and indexed
+    with a tabix (.tbi) or, for contigs longer than 2^29 bp or on request, a CSI (.csi) index. The index
+    is built from the virtual offsets of the records while they are written.
+    """
+    def __init__(self, path, preset, threads=1, csi=False, max_contig_length=0):
+        self.path = path
+        self.preset = preset
+        if preset == "vcf":
+            self.parse_interval = parse_vcf_interval
+        elif preset == "bed":
+            self.parse_interval = parse_bed_interval
+        else:
+            raise ValueError("Unknown preset {0}".format(preset))
+        self.csi = csi or max_contig_length > (1 << 29)
+        self.min_shift = 14
+        self.depth = 5
+        while self.csi and (1 << (self.min_shift + 3 * self.depth)) < max_contig_length:
+            self.depth += 1
+        self.writer = BgzfWriter(path, threads)
+        # For each contig (in file order): list of (beg, end, start position, end position) of its records
+        self.records = OrderedDict()
+
+
+    def write_header(self, line):
+        self.writer.write((line + "\n").encode())
+
+
+    def write_record(self, line):
+        contig, beg, end = self.parse_interval(line)
+        start_position = self.writer.tell()
+        self.writer.write((line + "\n").encode())
+        try:
+            contig_records = self.records[contig]
+        except KeyError:
+            contig_records = self.records[contig] = []
+        contig_records.append((beg, end, start_position, self.writer.tell()))
+
+
+    def close(self):
+        self.writer.close()
+        virtual_offset = self.writer.get_virtual_offsets()
+        index_output = BgzfWriter(self.path + (".csi" if self.csi else ".tbi"))
+        index_output.write(self.build_index(virtual_offset))
+        index_output.close()
+
+
+    def build_index(self, virtual_offset):
+        if self.preset == "vcf":
+            configuration = struct.pack("<iiiiii", 2, 1, 2, 0, ord("#"), 0)
+        else:
+            configuration = struct.pack("<iiiiii", 0x10000, 1, 2, 3, ord("#"), 0)
+        names = b"".join([contig.encode() + b"\0" for contig in self.records.keys()])
+        auxiliary = configuration + struct.pack("<i", len(names)) + names
+
+        index = io.BytesIO()
+        if self.csi:
+            index.write(b"CSI\1" + struct.pack("<iii", self.min_shift, self.depth, len(auxiliary)) + auxiliary)
+        else:
+            index.write(b"TBI\1" + struct.pack("<i", len(self.records)) + auxiliary)
+        if self.csi:
+            index.write(struct.pack("<i", len(self.records)))
+        for contig_records in self.records.values():
+            bins = defaultdict(list)
+            linear_index = []
+            for beg, end, start_position, end_position in contig_records:
+                start_offset = virtual_offset(start_position)
+                end_offset = virtual_offset(end_position)
+                chunks = bins[reg2bin(beg, end, self.min_shift, self.depth)]
+                if len(chunks) > 0 and chunks[-1][1] == start_offset:
+                    chunks[-1][1] = end_offset
+                else:
+                    chunks.append([start_offset, end_offset])
+                last_window = (end - 1) >> self.min_shift
+                if last_window >= len(linear_index):
+                    linear_index.extend([None] * (last_window + 1 - len(linear_index)))
+                for window in range(beg >> self.min_shift, last_window + 1):
+                    if linear_index[window] == None:
+                        linear_index[window] = start_offset
+            # Fill windows without records with the offset of the preceding window
+            previous_offset = 0
+            for window in range(len(linear_index)):
+                if linear_index[window] == None:
+                    linear_index[window] = previous_offset
+                previous_offset = linear_index[window]
+
+            index.write(struct.pack("<i", len(bins)))
+            for bin_number in sorted(bins.keys()):
+                chunks = bins[bin_number]
+                if self.csi:
+                    first_window = bin_first_position(bin_number, self.min_shift, self.depth) >> self.min_shift
+                    loffset = linear_index[first_window] if first_window < len(linear_index) else previous_offset
+                    index.write(struct.pack("<IQi", bin_number, loffset, len(chunks)))
+                else:
+                    index.write(struct.pack("<Ii", bin_number, len(chunks)))
+                for chunk_start, chunk_end in chunks:
+                    index.write(struct.pack("<QQ", chunk_start, chunk_end))
+            if not self.csi:
+                index.write(struct.pack("<i", len(linear_index)))
+                for offset in linear_index:
+                    index.write(struct.pack("<Q", offset))
+        return index.getvalue()
+
+
+class PlainWriter:
+    """Buffered writer for uncompressed text files with the same interface as IndexedWriter."""
+    def __init__(self, path):
+        self.output = open(path, "w", buffering=1 << 20)
+
+
+    def write_header(self, line):
+        self.output.write(line + "\n")
+
+
+    def write_record(self, line):
+        self.output.write(line + "\n")
+
+
+    def close(self):
+        self.output.close()
+
+
+def get_vcf_position(entry):
+    return int(entry.split("\t", 2)[1])
+
+
+def write_vcf_records(output, contig_names, record_streams, progress=None):
+    """Write the VCF records of several lists of candidates (or signature clusters) to output.
+    record_streams is a list of (items, get_contig) tuples where get_contig returns the contig an item is reported on.
+    Each list is split into per-contig streams sorted by position which are merged contig by contig.
+    Contigs are written in the order of contig_names, followed by any other contigs in lexicographic order.
+    Only the records of one contig are formatted at a time. The number of records written so far is passed to the
+    update method of progress (a ProgressReporter) if given."""
+    items_by_contig = defaultdict(lambda: [[] for stream in record_streams])
+    for stream_index, (items, get_contig) in enumerate(record_streams):
+        for item in items:
+            items_by_contig[get_contig(item)][stream_index].append(item)
+
+    known_contigs = set(contig_names)
+    ordered_contigs = [contig for contig in contig_names if contig in items_by_contig] + sorted([contig for contig in items_by_contig.keys() if contig not in known_contigs])
+    written = 0
+    for contig in ordered_contigs:
+        sorted_streams = []
+        for items in items_by_contig.pop(contig):
+            entries = [item.get_vcf_entry() for item in items]
+            sorted_streams.append(sorted(entries, key=get_vcf_position))
+        for entry in merge(*sorted_streams, key=get_vcf_position):
+            output.write_record(entry)
+            written += 1
+            if progress != None and written % 1000 == 0:
+                progress.update(written)
+
+
+def open_vcf_output(path, compress, threads=1, max_contig_length=0):
+    """Open a VCF output file. If compress is true, the file is BGZF-compressed and indexed and '.gz' is appended to path."""
+    if compress:
+        return IndexedWriter(path + ".gz", "vcf", threads, max_contig_length=max_contig_length)
+    else:
+        return PlainWriter(path)
+
+
+def get_bed_position(line):
+    fields = line.split("\t", 3)
+    return int(fields[1]), int(fields[2])
+
+
+def write_bed_file(path, lines, contig_names, index=False, threads=1, max_contig_length=0):
+    """Write BED lines to path. If index is true, the lines are sorted by contig (in the order of contig_names,
+    followed by any other contigs in lexicographic order), start and end, written BGZF-compressed to path + '.gz'
+    and indexed with tabix. Otherwise, they are written in the given order to an uncompressed file."""
+    if not index:
+        output = PlainWriter(path)
+        for line in lines:
+            output.write_record(line)
+        output.close()
+        return
+
+    lines_by_contig = defaultdict(list)
+    for line in lines:
+        lines_by_contig[line.split("\t", 1)[0]].append(line)
+    known_contigs = set(contig_names)
+    ordered_contigs = [contig for contig in contig_names if contig in lines_by_contig] + sorted([contig for contig in lines_by_contig.keys() if contig not in known_contigs])
+    output = IndexedWriter(path + ".gz", "bed", threads, max_contig_length=max_contig_length)
+    for contig in ordered_contigs:
+        for line in sorted(lines_by_contig.pop(contig), key=get_bed_position):
+            output.write_record(line)
+    output.close()
@@ -0,0 +1,424 @@
+import sys
+import os
+import logging
+import multiprocessing
+
+from collections import Counter, OrderedDict
+from copy import copy
+from time import perf_counter, sleep
+
+from svim.SVIM_input_parsing import guess_file_type, read_file_list
+from svim.SVIM_alignment import run_alignment
+from svim.SVIM_COLLECT import analyze_alignment_file
+from svim.SVIM_CLUSTER import cluster_sv_signatures, cluster_spilled_signatures, write_signature_clusters_bed, write_signature_clusters_vcf
+from svim.SVIM_plot import write_histograms
+from svim.SVIM_export import export_signature_clusters
+from svim.SVIM_stats import reset_run_stats
+from svim.SVIM_profile import create_stage_profiler
+from svim.SVIM_progress import format_bytes, format_duration, StageProgressLogger, add_progress_listener, remove_progress_listener
+from svim.SVIM_metrics import MetricsWriter
+from svim.SVIM_hotregions import HotRegionProfiler
+from svim.SVIM_hooks import register_hook, unregister_hook
+from svim.SVIM_memory import MemoryBudget
+from svim.SVIM_density import SignatureDensityIndex, read_density_index, load_density_index, estimate_density_from_bam_index
+from svim.SVIM_COMBINE import combine_clusters
+from svim.SVIM_shards import ShardLogFilter, get_shards, write_shard_layout, load_shard_layout, cluster_shard_signatures, write_shard_results, merge_shard_results
+from svim.SVIM_queue import WorkQueue, TaskLostError, get_worker_id
+from svim.SVIM_checkpoint import get_fingerprint, find_checkpoint, write_checkpoint, remove_checkpoint, iterate_checkpoint, get_signature_chunks
+
+
+# Seconds between two looks of the coordinator and idle workers at the work queue
+QUEUE_POLL_INTERVAL = 2.0
+# Events of the pipeline at which a queue worker checks whether its task has been given to another worker
+CANCELLATION_EVENTS = ["stage_started", "stage_finished", "reads_processed", "partition_clustered"]
+
+
+def get_alignment_files(options):
+    """Return the paths of the alignment files to analyze. In 'reads' mode, the reads are aligned first.
+    Returns None if the input cannot be processed."""
+    if options.sub == 'reads':
+        logging.info("MODE: reads")
+        logging.info("INPUT: {0}".format(os.path.abspath(options.reads)))
+        logging.info("GENOME: {0}".format(os.path.abspath(options.genome)))
+        reads_type = guess_file_type(options.reads)
+        if reads_type == "unknown":
+            return None
+        elif reads_type == "list":
+            # List of read files
+            alignment_files = []
+            for index, file_path in enumerate(read_file_list(options.reads)):
+                logging.info("Starting processing of file {0} from the list..".format(index))
+                reads_type = guess_file_type(file_path)
+                if reads_type == "unknown" or reads_type == "list":
+                    return None
+                alignment_files.append(run_alignment(options.working_dir, options.genome, file_path, reads_type, options.cores, options.aligner, options.nanopore))
+            return alignment_files
+        else:
+            # Single read file
+            return [run_alignment(options.working_dir, options.genome, options.reads, reads_type, options.cores, options.aligner, options.nanopore)]
+    logging.info("MODE: alignment")
+    logging.info("INPUT: {0}".format(os.path.abspath(options.bam_file)))
+    return [options.bam_file]
+
+
+def collect_signatures(alignment_files, options, budget=None, shard=None):
+    """Collect the signatures from all alignment files. Returns the signatures and the last alignment file
+    or (None, None) if an alignment file cannot be processed."""
+    # pysam is only needed for the calling modes
+    import pysam
+
+    sv_signatures = []
+    for bam_path in alignment_files:
+        aln_file = pysam.AlignmentFile(bam_path)
+        file_signatures = analyze_alignment_file(aln_file, options, budget, shard)
+        if file_signatures == None:
+            return None, None
+        sv_signatures.extend(file_signatures)
+    return sv_signatures, aln_file
+
+
+def run_pipeline(options, version, shard=None, alignment_files=None):
+    """Run the COLLECT, CLUSTER and COMBINE steps of SVIM ('reads' or 'alignment' mode) with the given parsed
+    command-line options (see parse_arguments) and write all results into the working directory.
+    Returns the statistics of the run (or None if the input cannot be processed). Callbacks registered with register_hook are called during the run
+    (in sharded runs, only the stage hooks of the shard and merge stages are called in this process).
+    If a shard is given, only the signatures in its view are analyzed and the results needed for merging are saved (see run_sharded_pipeline).
+    The results of COLLECT and CLUSTER are saved in the directory checkpoints in the working directory. With options.resume, the run
+    continues after the last stage with a valid checkpoint for the same input files and options (see get_fingerprint)."""
+    if not os.path.exists(options.working_dir):
+        os.makedirs(options.working_dir)
+    if shard == None and (options.shard_workers > 0 or options.work_queue):
+        return run_sharded_pipeline(options, version)
+
+    logging.info("****************** STEP 1: COLLECT ******************")
+    stats = reset_run_stats()
+    stats.add_listener(StageProgressLogger())
+    if options.metrics_interval > 0:
+        metrics = MetricsWriter(options.working_dir + "/metrics.prom", options.metrics_interval)
+        stats.add_listener(metrics)
+        add_progress_listener(metrics)
+    if options.profile:
+        stats.add_listener(create_stage_profiler(options.profile, options.working_dir + "/profiles", options.profile_interval / 1000, options.profile_top))
+    # The signature density index is written as a by-product of COLLECT (see run_sharded_pipeline)
+    density = SignatureDensityIndex(shard=shard)
+    if options.max_memory != None:
+        budget = MemoryBudget(options.max_memory, options.working_dir + "/spill", density)
+        logging.info("Memory budget: {0} ({1} available for signatures and clusters)".format(format_bytes(budget.max_memory), format_bytes(budget.available)))
+    else:
+        budget = None
+    # The budget whose signatures have been spilled to disk (None if they are all in memory)
+    spilled_budget = None
+    if options.hot_regions > 0:
+        hot_regions = HotRegionProfiler()
+        register_hook("partition_clustered", hot_regions.partition_clustered)
+    # The results of COLLECT and CLUSTER are saved as checkpoints to resume from with options.resume
+    checkpoint_dir = options.working_dir + "/checkpoints"
+    fingerprints = [(stage, get_fingerprint(options, version, stage, shard)) for stage in ["COLLECT", "CLUSTER"]]
+    if options.resume:
+        resume_stage, checkpoint = find_checkpoint(checkpoint_dir, fingerprints)
+        if resume_stage == None:
+            logging.info("No checkpoint to resume from in {0}. Starting from COLLECT.".format(checkpoint_dir))
+    else:
+        resume_stage = None
+    try:
+        with stats.stage("COLLECT"):
+            if resume_stage != None:
+                contig_names, contig_lengths = checkpoint["metadata"]["contig_names"], checkpoint["metadata"]["contig_lengths"]
+            if resume_stage == "CLUSTER":
+                logging.info("Skipping COLLECT and CLUSTER: resuming from the checkpoint written after CLUSTER in {0}".format(checkpoint_dir))
+                signature_counts = Counter(checkpoint["metadata"]["signatures"])
+            else:
+                if resume_stage == "COLLECT":
+                    logging.info("Skipping COLLECT: loading the signatures from the checkpoint written after COLLECT in {0}".format(checkpoint_dir))
+                    sv_signatures = []
+                    for chunk in iterate_checkpoint(checkpoint_dir, "COLLECT"):
+                        sv_signatures.extend(chunk)
+                        if budget != None:
+                            budget.check_collect(sv_signatures)
+                else:
+                    if alignment_files == None:
+                        alignment_files = get_alignment_files(options)
+                        if alignment_files == None:
+                            return
+                    sv_signatures, aln_file = collect_signatures(alignment_files, options, budget, shard)
+                    if sv_signatures == None:
+                        return
+                    contig_names, contig_lengths = aln_file.references, aln_file.lengths
+                if budget != None:
+                    budget.finish_collect(sv_signatures)
+                if budget != None and budget.spills > 0:
+                    signature_counts = budget.store.get_type_counts()
+                else:
+                    density.add(sv_signatures)
+                    signature_counts = Counter([signature.type for signature in sv_signatures])
+                density.write(options.working_dir + "/signature_density.npz", contig_names, contig_lengths)
+                if budget != None and budget.spills > 0:
+                    spilled_budget = budget
+            checkpoint_metadata = {"contig_names": list(contig_names), "contig_lengths": list(contig_lengths), "signatures": dict(signature_counts)}
+            if resume_stage == None:
+                with stats.stage("checkpoint"):
+                    remove_checkpoint(checkpoint_dir, "CLUSTER")
+                    write_checkpoint(checkpoint_dir, "COLLECT", fingerprints[0][1], get_signature_chunks(sv_signatures, spilled_budget), checkpoint_metadata)
+            stats.set("signatures", OrderedDict(sorted(signature_counts.items())))
+
+        logging.info("Found {0} signatures for deleted regions.".format(signature_counts['del']))
+        logging.info("Found {0} signatures for inserted regions.".format(signature_counts['ins']))
+        logging.info("Found {0} signatures for inverted regions.".format(signature_counts['inv']))
+        logging.info("Found {0} signatures for tandem duplicated regions.".format(signature_counts['dup']))
+        logging.info("Found {0} signatures for translocation breakpoints.".format(signature_counts['tra']))
+        logging.info("Found {0} signatures for inserted regions with detected region of origin.".format(signature_counts['ins_dup']))
+    
+        logging.info("****************** STEP 2: CLUSTER ******************")
+        with stats.stage("CLUSTER"):
+            if resume_stage == "CLUSTER":
+                signature_clusters, shard_results = next(iterate_checkpoint(checkpoint_dir, "CLUSTER"))
+            else:
+                shard_results = None
+                if shard != None:
+                    shard_results, signature_clusters = cluster_shard_signatures(shard, options, sv_signatures, spilled_budget)
+                elif spilled_budget != None:
+                    signature_clusters = cluster_spilled_signatures(spilled_budget, options)
+                else:
+                    signature_clusters = cluster_sv_signatures(sv_signatures, options)
+                with stats.stage("checkpoint"):
+                    write_checkpoint(checkpoint_dir, "CLUSTER", fingerprints[1][1], [(signature_clusters, shard_results)], checkpoint_metadata)
+            if shard != None:
+                write_shard_results(options.working_dir, shard, shard_results)
+
+            # Write SV signature clusters
+            with stats.stage("write_signature_clusters"):
+                logging.info("Finished clustering. Writing signature clusters..")
+                write_signature_clusters_bed(options.working_dir, signature_clusters, contig_names, contig_lengths, options.index_bed, options.compression_threads)
+                write_signature_clusters_vcf(options.working_dir, signature_clusters, version, contig_names, contig_lengths, options.compress_output, options.compression_threads)
+                if options.export_columnar:
+                    export_signature_clusters(options.working_dir, signature_clusters, contig_names)
+
+                # Save histograms of signature clusters for plotting with 'svim report'
+                write_histograms(options.working_dir, signature_clusters)
+
+        logging.info("****************** STEP 3: COMBINE ******************")
+        with stats.stage("COMBINE"):
+            combine_clusters(signature_clusters, options.working_dir, options, version, contig_names, contig_lengths, options.sample)
+
+        if options.hot_regions > 0:
+            hot_regions.write(options.working_dir, options.hot_regions)
+        stats.write(options.working_dir + "/run_report.json", version=version, command=" ".join(sys.argv), mode=options.sub, resumed_from=resume_stage)
+        logging.info("Wrote run report to {0}/run_report.json".format(options.working_dir))
+        return stats
+    finally:
+        if budget != None:
+            budget.store.remove()
+        if options.hot_regions > 0:
+            unregister_hook("partition_clustered", hot_regions.partition_clustered)
+        if options.metrics_interval > 0:
+            remove_progress_listener(metrics)
+            metrics.finish()
+
+
+def run_shard(arguments):
+    """Run all steps for one shard in its own working directory (see Shard.get_working_dir). This is the entry
+    point of the worker processes. Returns the shard and its wall-clock time."""
+    options, version, alignment_files, shard = arguments
+    root_logger = logging.getLogger()
+    if len(root_logger.handlers) == 0:
+        # Worker processes that are not forked do not inherit the log handlers
+        root_logger.setLevel(logging.INFO)
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)-7.7s]  %(message)s"))
+        root_logger.addHandler(console_handler)
+    log_filter = ShardLogFilter(shard.name)
+    root_logger.addFilter(log_filter)
+    shard_options = copy(options)
+    shard_options.working_dir = shard.get_working_dir(options.working_dir)
+    start_time = perf_counter()
+    try:
+        run_pipeline(shard_options, version, shard, alignment_files)
+    finally:
+        # Worker processes run several shards
+        root_logger.removeFilter(log_filter)
+    return shard, perf_counter() - start_time
+
+
+def run_pool_shards(arguments, workers):
+    """Run the shards in a pool of worker processes. Yields (shard, wall-clock time) tuples of the finished shards."""
+    pool = multiprocessing.Pool(workers)
+    try:
+        for shard, seconds in pool.imap_unordered(run_shard, arguments):
+            yield shard, seconds
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def run_queue_worker(queue_directory, poll_interval=QUEUE_POLL_INTERVAL):
+    """Claim and run the shards in a work queue (see run_queue_shards) until all tasks are finished or the queue is
+    closed. Waits for the queue to be created if it does not exist yet. This is the entry point of 'svim worker'.
+    Returns the number of shards run by this worker."""
+    queue = WorkQueue(queue_directory)
+    worker_id = get_worker_id()
+    finished = 0
+    logging.info("Worker {0} waiting for tasks in {1}".format(worker_id, queue_directory))
+    while True:
+        if queue.get_settings() == None:
+            sleep(poll_interval)
+            continue
+        if queue.is_finished():
+            break
+        task = queue.claim()
+        if task == None:
+            sleep(poll_interval)
+            continue
+        name, attempt, arguments = task
+        logging.info("Worker {0} claimed {1} (attempt {2})".format(worker_id, name, attempt))
+        # Attempts of the same task may overlap, so each one runs in its own working directory
+        arguments[3].attempt = attempt
+        try:
+            with queue.heartbeat(name, attempt) as heartbeat:
+                # Abandon the task at the next event of the pipeline if it has been given to another worker
+                for event in CANCELLATION_EVENTS:
+                    register_hook(event, heartbeat.check)
+                try:
+                    shard, seconds = run_shard(arguments)
+                finally:
+                    for event in CANCELLATION_EVENTS:
+                        unregister_hook(event, heartbeat.check)
+                heartbeat.check()
+        except TaskLostError as error:
+            logging.warning("Worker {0} abandoned {1} (attempt {2}): {3}".format(worker_id, name, attempt, error))
+            continue
+        except Exception as error:
+            logging.error("Worker {0} failed to run {1}".format(worker_id, name), exc_info=True)
+            queue.fail(name, attempt, "{0}: {1} (worker {2})".format(type(error).__name__, error, worker_id))
+            continue
+        queue.complete(name, attempt, {"worker": worker_id, "wall_time_s": round(seconds, 4), "working_dir": shard.get_working_dir(arguments[0].working_dir)})
+        finished += 1
+    logging.info("Worker {0} finished {1} tasks".format(worker_id, finished))
+    return finished
+
+
+def run_local_queue_worker(queue_directory):
+    try:
+        run_queue_worker(queue_directory)
+    except KeyboardInterrupt:
+        pass
+
+
+def run_queue_shards(arguments, options, workers):
+    """Write a task for every shard into the work queue in the directory queue in the working directory and wait
+    until all of them are finished by the given number of local worker processes and by any workers started with
+    'svim worker' (see run_queue_worker). Tasks of crashed or failed workers are retried up to options.task_attempts
+    times. Local workers that have exited before the end are restarted. Yields (shard, wall-clock time) tuples of
+    the finished shards."""
+    queue = WorkQueue(os.path.join(options.working_dir, "queue"))
+    shards = OrderedDict((shard_arguments[3].name, shard_arguments[3]) for shard_arguments in arguments)
+    queue.create([(shard_arguments[3].name, shard_arguments) for shard_arguments in arguments], {"heartbeat_interval": max(1.0, options.task_timeout / 10)})
+    logging.info("Wrote {0} tasks to the work queue {1}. Start more workers on any node with 'svim worker {2}'.".format(len(shards), queue.directory, options.working_dir))
+    local_workers = []
+    reported = set()
+    complete = False
+    try:
+        while len(reported) < len(shards):
+            for name, attempt, reason in queue.retry_tasks(options.task_timeout, options.task_attempts):
+                logging.warning("Retrying {0} (attempt {1} of {2}): {3}".format(name, attempt, options.task_attempts, reason))
+            for name, result in sorted(queue.get_results().items()):
+                if name not in reported:
+                    reported.add(name)
+                    logging.info("Worker {0} finished {1} (attempt {2}).".format(result["worker"], name, result["attempt"]))
+                    # The results of the shard are in the working directory of the finished attempt
+                    shards[name].attempt = result["attempt"]
+                    yield shards[name], result["wall_time_s"]
+            local_workers = [process for process in local_workers if process.is_alive()]
+            while len(local_workers) < workers and len(reported) < len(shards):
+                process = multiprocessing.Process(target=run_local_queue_worker, args=(queue.directory,))
+                process.start()
+                local_workers.append(process)
+            if len(reported) < len(shards):
+                sleep(QUEUE_POLL_INTERVAL)
+        complete = True
+    finally:
+        queue.close()
+        for process in local_workers:
+            if not complete:
+                process.terminate()
+            process.join()
+
+
+def run_sharded_pipeline(options, version):
+    """Run COLLECT and CLUSTER for every window of a large contig, every contig or group of small contigs (see
+    get_shards) in a separate worker process (from a pool or, with options.work_queue, from a work queue on the
+    filesystem, see run_queue_shards) and merge the results. Each shard also runs COMBINE on its own clusters
+    and writes its signature clusters, candidates and VCF into shards/<shard name> in the working directory as soon
+    as it is finished. The most expensive shards are started first. Finally, the results of all shards are merged and
+    combined into the working directory (see merge_shard_results).
+    Returns the statistics of the run (or None if the input cannot be processed)."""
+    import pysam
+
+    stats = reset_run_stats()
+    stats.add_listener(StageProgressLogger())
+    alignment_files = get_alignment_files(options)
+    if alignment_files == None:
+        return
+    if options.work_queue:
+        # Workers on other nodes may run in another directory
+        options = copy(options)
+        options.working_dir = os.path.abspath(options.working_dir)
+        alignment_files = [os.path.abspath(path) for path in alignment_files]
+        for name in ["regions", "exclude"]:
+            if getattr(options, name) != None and os.path.isfile(getattr(options, name)):
+                setattr(options, name, os.path.abspath(getattr(options, name)))
+    with pysam.AlignmentFile(alignment_files[0]) as aln_file:
+        contig_names, contig_lengths = aln_file.references, aln_file.lengths
+    # Partitions crossing the edge of a window are reconciled during the merge if the margin is larger than partition_max_distance
+    layout_parameters = {"contigs": list(zip(contig_names, contig_lengths)), "min_length": options.shard_min_length, "window_size": options.shard_window_size,
+                         "margin": options.partition_max_distance + options.max_sv_size, "read_margin": options.max_sv_size}
+    # Resumed shards need the same regions as before (the signature density index has been updated in the meantime)
+    shards = load_shard_layout(options.working_dir, layout_parameters) if options.resume else None
+    if shards != None:
+        logging.info("Resuming the {0} shards of the previous run".format(len(shards)))
+    else:
+        density_path = options.density_index or options.working_dir + "/signature_density.npz"
+        density = load_density_index(density_path, contig_names, contig_lengths)
+        if density != None:
+            logging.info("Splitting the genome by the expected cost from the signature density index {0}".format(density_path))
+        else:
+            if options.density_index != None:
+                logging.warning("Cannot use the signature density index {0}.".format(options.density_index))
+            # First run of a sample: estimate the cost from the amount of alignment data per window
+            density = estimate_density_from_bam_index(alignment_files, contig_names)
+            if density != None:
+                logging.info("Splitting the genome by the amount of alignment data per window from the BAM index")
+            else:
+                logging.info("Splitting the genome by length (no signature density index or BAM index)")
+        shards = get_shards(contig_names, contig_lengths, options.shard_min_length, options.shard_window_size,
+                            layout_parameters["margin"], layout_parameters["read_margin"], density)
+        write_shard_layout(options.working_dir, shards, layout_parameters)
+    workers = min(options.shard_workers, len(shards))
+    if options.work_queue:
+        logging.info("****************** SHARDED RUN: {0} contigs in {1} shards on {2} local and any number of remote worker processes ******************".format(len(contig_names), len(shards), workers))
+    else:
+        logging.info("****************** SHARDED RUN: {0} contigs in {1} shards on {2} worker processes ******************".format(len(contig_names), len(shards), workers))
+
+    with stats.stage("SHARDS"):
+        # Start the most expensive shards first so that no shard is left running alone at the end
+        sorted_shards = sorted(shards, key=lambda shard: shard.cost, reverse=True)
+        arguments = [(options, version, alignment_files, shard) for shard in sorted_shards]
+        if options.work_queue:
+            finished_shards = run_queue_shards(arguments, options, workers)
+        else:
+            finished_shards = run_pool_shards(arguments, workers)
+        for finished, (shard, seconds) in enumerate(finished_shards):
+            logging.info("Finished {0} ({1}) in {2}. Wrote results to {3} ({4} of {5} shards finished).".format(shard.name, shard.describe(), format_duration(seconds),
+                                                                                                               shard.get_working_dir(options.working_dir), finished + 1, len(shards)))
+            stats.set(shard.name, OrderedDict([("regions", shard.describe()), ("length", shard.get_length()), ("expected_cost", round(shard.cost, 1)), ("wall_time_s", round(seconds, 4))]))
+
+    logging.info("****************** MERGE ******************")
+    with stats.stage("MERGE"):
+        merge_shard_results(options.working_dir, shards, options, version, contig_names, contig_lengths)
+        merged_density = SignatureDensityIndex()
+        for shard in shards:
+            merged_density.update(read_density_index(shard.get_working_dir(options.working_dir) + "/signature_density.npz")[0])
+        merged_density.write(options.working_dir + "/signature_density.npz", contig_names, contig_lengths)
+    stats.write(options.working_dir + "/run_report.json", version=version, command=" ".join(sys.argv), mode=options.sub, shards=len(shards))
+    logging.info("Wrote run report to {0}/run_report.json".format(options.working_dir))
+    return stats
@@ -0,0 +1,76 @@
+import os
+import logging
+
+
+HISTOGRAM_FILE = '/signatures/signature_cluster_histograms.npz'
+HISTOGRAM_TYPES = [("del", "Deleted region signature clusters"),
+                   ("ins", "Inserted regions"),
+                   ("inv", "Inverted regions")]
+
+
+def write_histograms(working_dir, clusters):
+    """Bin the scores (100 bins) and sizes (20 bins) of deletion, insertion and inversion signature clusters
+    and save the histograms into the working directory so that they can be plotted later by the report step."""
+    import numpy as np
+
+    deletion_signature_clusters, insertion_signature_clusters, inversion_signature_clusters, tandem_duplication_signature_clusters, insertion_from_signature_clusters, completed_translocations = clusters
+
+    if not os.path.exists(working_dir + '/signatures'):
+        os.mkdir(working_dir + '/signatures')
+    histograms = {}
+    for (sv_type, title), sv_clusters in zip(HISTOGRAM_TYPES, [deletion_signature_clusters, insertion_signature_clusters, inversion_signature_clusters]):
+        scores = np.fromiter((cluster.score for cluster in sv_clusters), dtype=np.float64, count=len(sv_clusters))
+        sizes = np.fromiter((cluster.end - cluster.start for cluster in sv_clusters), dtype=np.int64, count=len(sv_clusters))
+        histograms[sv_type + "_score_counts"], histograms[sv_type + "_score_edges"] = np.histogram(scores, bins=100)
+        histograms[sv_type + "_size_counts"], histograms[sv_type + "_size_edges"] = np.histogram(sizes, bins=20)
+    np.savez(working_dir + HISTOGRAM_FILE, **histograms)
+
+
+def get_log_scale_arguments():
+    """Return the keyword argument of yscale('log') that clips non-positive values (renamed in matplotlib 3.3)."""
+    import matplotlib
+    version = tuple(int(part) for part in matplotlib.__version__.split(".")[:2] if part.isdigit())
+    if version >= (3, 3):
+        return {'nonpositive': 'clip'}
+    return {'nonposy': 'clip'}
+
+
+def plot_histogram(plt, counts, edges, xlabel, title):
+    plt.hist(edges[:-1], bins=edges, weights=counts)
+    plt.xlabel(xlabel)
+    plt.ylabel('Count')
+    plt.yscale('log', **get_log_scale_arguments())
+    plt.title(title)
+    plt.grid(True)
+
+
+def plot_histograms(working_dir):
+    """Plot the histograms saved by write_histograms into a PDF file in the working directory."""
+    # Import matplotlib only here so that calling SVs does not depend on it
+    import numpy as np
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    try:
+        histograms = np.load(working_dir + HISTOGRAM_FILE)
+    except FileNotFoundError:
+        logging.error("Could not find signature cluster histograms in {0}. Please run SVIM on this working directory first.".format(working_dir))
+        return False
+
+    pdf = PdfPages(working_dir + '/signatures/signature_cluster_histograms.pdf')
+    for sv_type, title in HISTOGRAM_TYPES:
+        fig = plt.figure()
+        fig.suptitle(title, fontsize=10)
+
+        plt.subplot(2, 1, 1)
+        plot_histogram(plt, histograms[sv_type + "_score_counts"], histograms[sv_type + "_score_edges"], 'Score', 'Histogram of Score')
+
+        plt.subplot(2, 1, 2)
+        plot_histogram(plt, histograms[sv_type + "_size_counts"], histograms[sv_type + "_size_edges"], 'Size in bp', 'Histogram of Size')
+
+        pdf.savefig(fig)
+        plt.close(fig)
+    pdf.close()
+    return True
@@ -0,0 +1,138 @@
+import os
+import io
+import signal
+import marshal
+import logging
+
+from collections import Counter
+
+
+def get_profile_path(directory, stage_name):
+    return os.path.join(directory, stage_name.replace("/", ".") + ".pstats")
+
+
+def log_profile_summary(path, stage_name, top):
+    """Log the top functions (by internal time) of a profile in pstats format."""
+    import pstats
+
+    summary = io.StringIO()
+    pstats.Stats(path, stream=summary).sort_stats("tottime").print_stats(top)
+    logging.info("Profile of stage {0} (top {1} functions by internal time, full profile in {2}):\n{3}".format(stage_name, top, path, summary.getvalue().strip("\n")))
+
+
+class DeterministicStageProfiler:
+    """Profile each pipeline stage separately with cProfile. While a nested stage runs, the profiler of the
+    enclosing stage is paused so that every profile only contains the time spent in its own stage.
+    Profiles are written in pstats format into the given directory when their stage ends.
+    """
+    def __init__(self, directory, top=20):
+        self.directory = directory
+        self.top = top
+        self.profilers = []
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+
+    def stage_started(self, name):
+        import cProfile
+
+        if len(self.profilers) > 0:
+            self.profilers[-1].disable()
+        profiler = cProfile.Profile()
+        self.profilers.append(profiler)
+        profiler.enable()
+
+
+    def stage_finished(self, name):
+        profiler = self.profilers.pop()
+        profiler.disable()
+        path = get_profile_path(self.directory, name)
+        profiler.dump_stats(path)
+        if self.top > 0:
+            log_profile_summary(path, name, self.top)
+        if len(self.profilers) > 0:
+            self.profilers[-1].enable()
+
+
+class SamplingStageProfiler:
+    """Profile each pipeline stage separately by sampling the call stack of the main thread at a fixed
+    interval of CPU time (using a profiling timer signal). The overhead only depends on the sampling interval
+    and not on the number of function calls. Samples are attributed to the innermost running stage and
+    written in pstats format (with times estimated from the number of samples) when the stage ends.
+    """
+    def __init__(self, directory, interval=0.005, top=20):
+        self.directory = directory
+        self.interval = interval
+        self.top = top
+        # Counts of sampled call stacks for each running stage
+        self.samples = []
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+
+    def handle_sample(self, signum, frame):
+        if len(self.samples) == 0:
+            return
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        self.samples[-1][tuple(stack)] += 1
+
+
+    def stage_started(self, name):
+        if len(self.samples) == 0:
+            signal.signal(signal.SIGPROF, self.handle_sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.samples.append(Counter())
+
+
+    def stage_finished(self, name):
+        samples = self.samples.pop()
+        if len(self.samples) == 0:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        if len(samples) == 0:
+            return
+        path = get_profile_path(self.directory, name)
+        with open(path, "wb") as profile_file:
+            marshal.dump(samples_to_pstats(samples, self.interval), profile_file)
+        if self.top > 0:
+            log_profile_summary(path, name, self.top)
+
+
+def samples_to_pstats(samples, interval):
+    """Convert a Counter of sampled call stacks (innermost frame first) into the dictionary format of pstats:
+    {function: (primitive calls, calls, internal time, cumulative time, {caller: (primitive calls, calls, internal time, cumulative time)})}.
+    The 'calls' of a function are the number of samples in which it appears."""
+    functions = {}
+    for stack, count in samples.items():
+        time = count * interval
+        seen = set()
+        for position, function in enumerate(stack):
+            # Count recursive functions only once per sample
+            if function in seen:
+                continue
+            seen.add(function)
+            entry = functions.setdefault(function, [0, 0, 0.0, 0.0, {}])
+            entry[0] += count
+            entry[1] += count
+            entry[3] += time
+            if position == 0:
+                entry[2] += time
+            if position + 1 < len(stack):
+                caller = stack[position + 1]
+                caller_entry = entry[4].get(caller, (0, 0, 0.0, 0.0))
+                entry[4][caller] = (caller_entry[0] + count, caller_entry[1] + count, caller_entry[2] + (time if position == 0 else 0.0), caller_entry[3] + time)
+    return dict((function, (entry[0], entry[1], entry[2], entry[3], entry[4])) for function, entry in functions.items())
+
+
+def create_stage_profiler(mode, directory, interval=0.005, top=20):
+    """Return a stage profiler of the given mode ('deterministic' or 'sampling'). Sampling requires profiling
+    timer signals, so deterministic profiling is used instead on platforms that do not support them."""
+    if mode == "sampling":
+        if hasattr(signal, "setitimer") and hasattr(signal, "SIGPROF"):
+            return SamplingStageProfiler(directory, interval, top)
+        logging.warning("Sampling profiler is not supported on this platform. Using deterministic profiling instead.")
+    return DeterministicStageProfiler(directory, top)
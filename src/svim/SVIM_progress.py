@@ -0,0 +1,148 @@
+import os
+import logging
+
+from time import perf_counter
+
+
+# Listeners that are notified of every progress update by calling their progress_updated(reporter, items, work done) method
+progress_listeners = []
+
+
+def add_progress_listener(listener):
+    progress_listeners.append(listener)
+
+
+def remove_progress_listener(listener):
+    progress_listeners.remove(listener)
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    return "{0}:{1:02d}:{2:02d}".format(seconds // 3600, (seconds % 3600) // 60, seconds % 60)
+
+
+def format_bytes(number):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(number) < 1024:
+            return "{0:.1f} {1}".format(number, unit)
+        number /= 1024
+    return "{0:.1f} TB".format(number)
+
+
+class ProgressReporter:
+    """Logs the progress of a long-running step at a fixed time interval (in seconds): the number of processed
+    items and their rate, the fraction of the total work done and the estimated time until the step finishes.
+    The total work is measured either in items or in another unit (e.g. bytes of the input file or alignments)
+    that is passed to update() together with the number of items. Reporting is disabled if interval <= 0.
+    Progress listeners are notified of every update regardless of the interval. The list of results
+    produced so far (e.g. SV signatures) can be passed to make it available to listeners. If results are
+    removed from the front of the list (e.g. spilled to disk), their number is added to removed_results.
+    """
+    def __init__(self, name, interval, item_unit, work_total=None, work_unit=None, results=None):
+        self.name = name
+        self.interval = interval
+        self.item_unit = item_unit
+        self.work_total = work_total
+        self.work_unit = work_unit
+        self.results = results
+        self.removed_results = 0
+        self.start_time = perf_counter()
+        self.last_report_time = self.start_time
+        self.reports = 0
+
+
+    def update(self, items, work_done=None):
+        """Report the progress if the reporting interval has passed since the last report."""
+        if progress_listeners:
+            for listener in progress_listeners:
+                listener.progress_updated(self, items, work_done)
+        if self.interval <= 0:
+            return
+        now = perf_counter()
+        if now - self.last_report_time >= self.interval:
+            self.last_report_time = now
+            self.report(items, work_done, now)
+
+
+    def get_fraction_done(self, items, work_done):
+        if self.work_total:
+            if self.work_unit == None:
+                return min(1.0, items / self.work_total)
+            elif work_done != None:
+                return min(1.0, work_done / self.work_total)
+        return None
+
+
+    def report(self, items, work_done, now):
+        self.reports += 1
+        elapsed = now - self.start_time
+        message = "{0}: processed {1} {2} ({3:.1f} {2}/s)".format(self.name, items, self.item_unit, items / elapsed if elapsed > 0 else 0.0)
+        if self.work_unit == "bytes" and work_done != None:
+            message += ", read {0} ({1}/s)".format(format_bytes(work_done), format_bytes(work_done / elapsed if elapsed > 0 else 0))
+        fraction = self.get_fraction_done(items, work_done)
+        if fraction != None:
+            message += ", {0:.1f}% done".format(100 * fraction)
+            if fraction > 0:
+                message += ", ETA {0}".format(format_duration(elapsed * (1 - fraction) / fraction))
+        logging.info(message)
+
+
+    def finish(self, items):
+        """Log a summary if the progress has been reported before (i.e. the step took longer than the interval)."""
+        if progress_listeners:
+            for listener in progress_listeners:
+                listener.progress_updated(self, items, self.work_total if self.work_unit != None else None)
+        if self.reports > 0:
+            elapsed = perf_counter() - self.start_time
+            logging.info("{0}: finished {1} {2} in {3} ({4:.1f} {2}/s)".format(self.name, items, self.item_unit, format_duration(elapsed), items / elapsed if elapsed > 0 else 0.0))
+
+
+class StageProgressLogger:
+    """Stage listener that logs the duration of every pipeline stage when it finishes."""
+    def __init__(self):
+        self.start_times = []
+
+
+    def stage_started(self, name):
+        self.start_times.append(perf_counter())
+
+
+    def stage_finished(self, name):
+        logging.info("Finished stage {0} in {1}".format(name, format_duration(perf_counter() - self.start_times.pop())))
+
+
+def get_file_progress(bam, name, interval, results=None):
+    """Return a progress reporter for reading an alignment file from start to end. For BAM files, the work
+    is measured in compressed bytes (see get_compressed_offset) relative to the file size."""
+    if bam.is_bam:
+        try:
+            return ProgressReporter(name, interval, "reads", os.path.getsize(bam.filename), "bytes", results)
+        except (OSError, TypeError):
+            pass
+    return ProgressReporter(name, interval, "reads", results=results)
+
+
+def get_compressed_offset(bam):
+    """Return the number of compressed bytes of a BAM file read so far (the BGZF virtual offset shifted right by 16 bits)."""
+    if bam.is_bam:
+        return bam.tell() >> 16
+    return None
+
+
+def get_alignment_progress(bam, name, interval, results=None, regions=None):
+    """Return a progress reporter for iterating over all alignments of an alignment file (or over the alignments
+    in the given (contig, start, end) regions where end may be None). If the file is indexed, the total number of
+    alignments is taken from the index statistics (for parts of contigs, in proportion to their length)."""
+    try:
+        if regions != None:
+            totals = dict((statistics.contig, statistics.total) for statistics in bam.get_index_statistics())
+            total = 0
+            for contig, start, end in regions:
+                length = bam.get_reference_length(contig)
+                covered = min(length, length if end == None else end) - start
+                total += int(totals.get(contig, 0) * covered / max(1, length))
+        else:
+            total = bam.mapped + bam.unmapped
+    except ValueError:
+        total = None
+    return ProgressReporter(name, interval, "reads", total, "alignments", results)
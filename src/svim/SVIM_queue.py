@@ -0,0 +1,249 @@
+import os
+import json
+import pickle
+import shutil
+import socket
+import threading
+
+from time import time
+
+
+QUEUE_STATES = ["pending", "claimed", "done", "failed"]
+
+
+class QueueError(Exception):
+    """Raised when a task of a work queue has failed too often."""
+    pass
+
+
+class TaskLostError(QueueError):
+    """Raised by a worker whose claimed task has been given to another worker (see Heartbeat.check)."""
+    pass
+
+
+def get_worker_id():
+    return "{0}:{1}".format(socket.gethostname(), os.getpid())
+
+
+def write_file_atomically(path, data):
+    """Write data (bytes) into a temporary file next to path and rename it to path."""
+    directory, filename = os.path.split(path)
+    temporary_path = os.path.join(directory, ".{0}.{1}".format(filename, get_worker_id()))
+    with open(temporary_path, "wb") as output_file:
+        output_file.write(data)
+    os.rename(temporary_path, path)
+
+
+class Heartbeat:
+    """Touch a file every interval seconds in a background thread (as a context manager). If the file has
+    disappeared, the task has been given to another worker (see WorkQueue.retry_tasks) and check raises a
+    TaskLostError."""
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                os.utime(self.path, None)
+            except FileNotFoundError:
+                self.lost.set()
+                break
+            except OSError:
+                # Temporary errors of the shared filesystem
+                pass
+
+
+    def check(self, *args):
+        """Raise a TaskLostError if the task has been given to another worker (can be used as a callback)."""
+        if self.lost.is_set():
+            raise TaskLostError("The task {0} has been given to another worker".format(os.path.basename(self.path)))
+
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stopped.set()
+        self.thread.join()
+
+
+class WorkQueue:
+    """A queue of tasks in a directory on a shared filesystem that any number of worker processes on any node
+    can work on without a message broker. Each task is a pickled object in a file <name>.<attempt>.task that is
+    moved between the directories pending, claimed and failed by atomic renames, so that every attempt is claimed
+    by exactly one worker. A worker touches the file of its claimed task regularly (see Heartbeat) and writes the
+    result of the task into done/<name>.json. Tasks without a recent heartbeat (e.g. of a crashed worker) and
+    failed tasks are put back into pending by the coordinator (see retry_tasks). A worker that is still running a
+    task that has been put back notices it from its heartbeat and abandons the task, but attempts may overlap
+    until then, so every attempt needs its own outputs. The file queue.json is written after all tasks and lists
+    the tasks in the order in which they are claimed."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.settings = None
+
+
+    def get_path(self, state, filename=""):
+        return os.path.join(self.directory, state, filename)
+
+
+    def create(self, tasks, settings):
+        """Create a new queue (replacing an existing one) with the given (name, task) tuples and settings."""
+        if os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+        for state in QUEUE_STATES:
+            os.makedirs(self.get_path(state))
+        for name, task in tasks:
+            write_file_atomically(self.get_path("pending", "{0}.1.task".format(name)), pickle.dumps(task, protocol=pickle.HIGHEST_PROTOCOL))
+        settings = dict(settings, tasks=[name for name, task in tasks])
+        write_file_atomically(os.path.join(self.directory, "queue.json"), json.dumps(settings, indent=2).encode())
+        self.settings = settings
+
+
+    def get_settings(self):
+        """Return the settings of the queue or None if it has not been created yet."""
+        if self.settings == None:
+            try:
+                with open(os.path.join(self.directory, "queue.json"), "r") as settings_file:
+                    self.settings = json.load(settings_file)
+            except (OSError, ValueError):
+                return None
+        return self.settings
+
+
+    def list_tasks(self, state):
+        """Return the (name, attempt, filename) of the tasks in a state in the order of the queue."""
+        try:
+            filenames = os.listdir(self.get_path(state))
+        except FileNotFoundError:
+            return []
+        tasks = []
+        for filename in filenames:
+            if filename.endswith(".task") and not filename.startswith("."):
+                name, attempt = filename[:-len(".task")].rsplit(".", 1)
+                tasks.append((name, int(attempt), filename))
+        order = dict((name, index) for index, name in enumerate(self.get_settings()["tasks"]))
+        return sorted(tasks, key=lambda task: (order.get(task[0], len(order)), task[1]))
+
+
+    def is_done(self, name):
+        return os.path.exists(self.get_path("done", name + ".json"))
+
+
+    def get_results(self):
+        """Return the results of the finished tasks by name."""
+        results = {}
+        for filename in os.listdir(self.get_path("done")):
+            if filename.endswith(".json") and not filename.startswith("."):
+                with open(self.get_path("done", filename), "r") as result_file:
+                    results[filename[:-len(".json")]] = json.load(result_file)
+        return results
+
+
+    def claim(self):
+        """Claim the next pending task. Returns a tuple (name, attempt, task) or None if no task is pending."""
+        for name, attempt, filename in self.list_tasks("pending"):
+            try:
+                os.rename(self.get_path("pending", filename), self.get_path("claimed", filename))
+            except FileNotFoundError:
+                # Claimed by another worker
+                continue
+            try:
+                os.utime(self.get_path("claimed", filename), None)
+                if self.is_done(name):
+                    # A retried task that was finished by its previous worker after all
+                    os.remove(self.get_path("claimed", filename))
+                    continue
+                with open(self.get_path("claimed", filename), "rb") as task_file:
+                    return name, attempt, pickle.load(task_file)
+            except FileNotFoundError:
+                continue
+        return None
+
+
+    def heartbeat(self, name, attempt):
+        return Heartbeat(self.get_path("claimed", "{0}.{1}.task".format(name, attempt)), self.get_settings()["heartbeat_interval"])
+
+
+    def complete(self, name, attempt, result):
+        """Record the result (a dictionary) of a claimed task."""
+        result = dict(result, attempt=attempt)
+        write_file_atomically(self.get_path("done", name + ".json"), json.dumps(result).encode())
+        try:
+            os.remove(self.get_path("claimed", "{0}.{1}.task".format(name, attempt)))
+        except FileNotFoundError:
+            pass
+
+
+    def fail(self, name, attempt, error):
+        """Move a claimed task to failed with the description of the error."""
+        filename = "{0}.{1}.task".format(name, attempt)
+        write_file_atomically(self.get_path("failed", filename + ".error"), error.encode())
+        try:
+            os.rename(self.get_path("claimed", filename), self.get_path("failed", filename))
+        except FileNotFoundError:
+            pass
+
+
+    def retry_tasks(self, timeout, max_attempts):
+        """Put the failed tasks and the claimed tasks without a heartbeat for timeout seconds back into pending with
+        the next attempt number. Raises a QueueError if a task has failed max_attempts times.
+        Returns a list of (name, next attempt, reason) tuples."""
+        retried = []
+        now = time()
+        for name, attempt, filename in self.list_tasks("claimed"):
+            try:
+                status = os.stat(self.get_path("claimed", filename))
+            except FileNotFoundError:
+                continue
+            # Renames update the status change time, heartbeats both times
+            idle = now - max(status.st_mtime, status.st_ctime)
+            if idle > timeout:
+                reason = "no heartbeat from the worker for {0:.0f} s".format(idle)
+                if self.requeue("claimed", name, attempt, max_attempts, reason):
+                    retried.append((name, attempt + 1, reason))
+        for name, attempt, filename in self.list_tasks("failed"):
+            try:
+                with open(self.get_path("failed", filename + ".error"), "r") as error_file:
+                    reason = error_file.read().strip()
+            except FileNotFoundError:
+                reason = "unknown error"
+            if self.requeue("failed", name, attempt, max_attempts, reason):
+                retried.append((name, attempt + 1, reason))
+        return retried
+
+
+    def requeue(self, state, name, attempt, max_attempts, reason):
+        filename = "{0}.{1}.task".format(name, attempt)
+        try:
+            if self.is_done(name):
+                os.remove(self.get_path(state, filename))
+                return False
+            if attempt >= max_attempts:
+                if state == "claimed":
+                    write_file_atomically(self.get_path("failed", filename + ".error"), reason.encode())
+                    os.rename(self.get_path(state, filename), self.get_path("failed", filename))
+                raise QueueError("Task {0} failed {1} times. Last error: {2}".format(name, attempt, reason))
+            os.rename(self.get_path(state, filename), self.get_path("pending", "{0}.{1}.task".format(name, attempt + 1)))
+        except FileNotFoundError:
+            # Finished or failed by its worker in the meantime
+            return False
+        return True
+
+
+    def close(self):
+        """Tell all workers to stop."""
+        write_file_atomically(os.path.join(self.directory, "closed"), b"")
+
+
+    def is_finished(self):
+        """Return whether the queue has been closed or all tasks are done."""
+        if os.path.exists(os.path.join(self.directory, "closed")):
+            return True
+        return all(self.is_done(name) for name in self.get_settings()["tasks"])
@@ -0,0 +1,180 @@
+import os
+import gzip
+import logging
+
+from bisect import bisect_right
+from collections import defaultdict
+
+from svim.SVIM_shards import get_signature_position
+
+
+def parse_region(text):
+    """Parse a region in the format contig, contig:start or contig:start-end (1-based, inclusive) into a
+    (contig, start, end) tuple (0-based, half-open, end is None at the end of the contig)."""
+    contig, separator, interval = text.strip().rpartition(":")
+    if separator == "" or not interval.replace("-", "").isdigit():
+        return text.strip(), 0, None
+    start, separator, end = interval.partition("-")
+    return contig, max(0, int(start) - 1), int(end) if end != "" else None
+
+
+def read_bed_file(path):
+    """Yield the (contig, start, end) regions from a BED file (optionally gzipped)."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as bed_file:
+        for line in bed_file:
+            if line.startswith("#") or line.startswith("track") or line.startswith("browser") or line.strip() == "":
+                continue
+            fields = line.split("\t")
+            yield fields[0], int(fields[1]), int(fields[2])
+
+
+def read_regions(text):
+    """Return the regions from a BED file or a comma-separated list of regions (see parse_region)."""
+    if os.path.isfile(text):
+        return list(read_bed_file(text))
+    return [parse_region(region) for region in text.split(",") if region.strip() != ""]
+
+
+def merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if len(merged) > 0 and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(intervals, removed):
+    """Return the parts of the sorted, merged intervals that do not overlap the sorted, merged removed intervals."""
+    remaining = []
+    for start, end in intervals:
+        for removed_start, removed_end in removed:
+            if removed_end <= start or removed_start >= end:
+                continue
+            if removed_start > start:
+                remaining.append((start, removed_start))
+            start = max(start, removed_end)
+        if start < end:
+            remaining.append((start, end))
+    return remaining
+
+
+class GenomeRegions:
+    """The parts of the genome to analyze: the included regions (all contigs if None) without the excluded regions.
+    Signatures are kept if their position (see get_signature_position) lies in an analyzed region. Reads are analyzed
+    if one of their alignments lies within read_margin of an analyzed region. Like a Shard, it can be passed to
+    analyze_alignment_file to restrict COLLECT."""
+    def __init__(self, contig_names, contig_lengths, include=None, exclude=None, read_margin=0):
+        """include and exclude are lists of (contig, start, end) regions (end is None at the end of the contig)."""
+        self.contig_names = list(contig_names)
+        self.contig_lengths = dict(zip(contig_names, contig_lengths))
+        self.read_margin = read_margin
+        if include == None:
+            included = dict((contig, [(0, length)]) for contig, length in self.contig_lengths.items())
+        else:
+            included = self.get_intervals(include)
+        excluded = self.get_intervals(exclude or [])
+        self.intervals = {}
+        for contig in self.contig_names:
+            contig_intervals = subtract_intervals(included.get(contig, []), excluded.get(contig, []))
+            if len(contig_intervals) > 0:
+                self.intervals[contig] = contig_intervals
+        self.starts = dict((contig, [start for start, end in intervals]) for contig, intervals in self.intervals.items())
+
+
+    def get_intervals(self, regions):
+        intervals = defaultdict(list)
+        unknown_contigs = set()
+        for contig, start, end in regions:
+            if contig not in self.contig_lengths:
+                unknown_contigs.add(contig)
+                continue
+            end = self.contig_lengths[contig] if end == None else min(end, self.contig_lengths[contig])
+            if start < end:
+                intervals[contig].append((start, end))
+        if len(unknown_contigs) > 0:
+            logging.warning("Ignoring regions on contigs that are not in the alignment file: {0}".format(", ".join(sorted(unknown_contigs))))
+        return dict((contig, merge_intervals(contig_intervals)) for contig, contig_intervals in intervals.items())
+
+
+    def get_length(self):
+        return sum(end - start for intervals in self.intervals.values() for start, end in intervals)
+
+
+    def contains(self, contig, position):
+        try:
+            index = bisect_right(self.starts[contig], position) - 1
+        except KeyError:
+            return False
+        return index >= 0 and position < self.intervals[contig][index][1]
+
+
+    def overlaps(self, contig, start, end):
+        """Return whether an alignment from start to end on contig lies within read_margin of an analyzed region."""
+        try:
+            index = bisect_right(self.starts[contig], end + self.read_margin - 1) - 1
+        except KeyError:
+            return False
+        return index >= 0 and self.intervals[contig][index][1] > start - self.read_margin
+
+
+    def select_signatures(self, signatures):
+        return [signature for signature in signatures if self.contains(*get_signature_position(signature))]
+
+
+    def get_read_regions(self):
+        """Return the sorted, non-overlapping (contig, start, end) regions with the alignments of the reads to analyze."""
+        read_regions = []
+        for contig in self.contig_names:
+            for start, end in merge_intervals([(max(0, start - self.read_margin), min(self.contig_lengths[contig], end + self.read_margin)) for start, end in self.intervals.get(contig, [])]):
+                read_regions.append((contig, start, end))
+        return read_regions
+
+
+class ShardRegions:
+    """The part of a shard in the analyzed regions of the genome (with the methods of Shard used by COLLECT)."""
+    def __init__(self, shard, regions):
+        self.shard = shard
+        self.regions = regions
+
+
+    def overlaps(self, contig, start, end):
+        return self.shard.overlaps(contig, start, end) and self.regions.overlaps(contig, start, end)
+
+
+    def select_signatures(self, signatures):
+        return self.regions.select_signatures(self.shard.select_signatures(signatures))
+
+
+    def get_read_regions(self):
+        shard_regions = dict((contig, (start, float("inf") if end == None else end)) for contig, start, end in self.shard.get_read_regions())
+        read_regions = []
+        for contig, start, end in self.regions.get_read_regions():
+            if contig in shard_regions and max(start, shard_regions[contig][0]) < min(end, shard_regions[contig][1]):
+                read_regions.append((contig, max(start, shard_regions[contig][0]), min(end, shard_regions[contig][1])))
+        return read_regions
+
+
+def load_genome_regions(options, contig_names, contig_lengths):
+    """Return the GenomeRegions given with options.regions and options.exclude or None if neither is given."""
+    if options.regions == None and options.exclude == None:
+        return None
+    include = read_regions(options.regions) if options.regions != None else None
+    exclude = read_regions(options.exclude) if options.exclude != None else None
+    return GenomeRegions(contig_names, contig_lengths, include, exclude, options.max_sv_size)
+
+
+def fetch_alignments(bam, regions):
+    """Yield the alignments overlapping the sorted, non-overlapping (contig, start, end) regions of an indexed
+    alignment file. Alignments overlapping several regions are only yielded for the first of them."""
+    previous_contig = None
+    previous_end = None
+    for contig, start, end in regions:
+        for alignment in bam.fetch(contig, start, end, multiple_iterators=True):
+            if contig == previous_contig and alignment.reference_start < previous_end:
+                continue
+            yield alignment
+        previous_contig = contig
+        previous_end = float("inf") if end == None else end
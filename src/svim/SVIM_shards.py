@@ -0,0 +1,407 @@
+import os
+import pickle
+import logging
+
+from math import ceil
+from collections import defaultdict, OrderedDict
+
+from svim.SVIM_clustering import form_partitions, cluster_partitions, record_clustering_stats, consolidate_clusters_unilocal, consolidate_clusters_bilocal
+from svim.SVIM_CLUSTER import complete_translocations, write_signature_clusters_bed, write_signature_clusters_vcf
+from svim.SVIM_COMBINE import combine_clusters
+from svim.SVIM_export import export_signature_clusters
+from svim.SVIM_plot import write_histograms
+from svim.SVIM_stats import get_run_stats
+
+
+# Clustered signature types in the order of the signature clusters (see cluster_sv_signatures)
+CLUSTERED_TYPES = [("del", "deleted regions"),
+                   ("ins", "inserted regions"),
+                   ("inv", "inverted regions"),
+                   ("dup", "tandem duplicated regions"),
+                   ("ins_dup", "inserted regions with detected region of origin")]
+BILOCAL_TYPES = set(["dup", "ins_dup"])
+
+
+def get_signature_position(signature):
+    """Return the (contig, position) of a signature that decides which shard owns it: the insertion point of
+    interspersed duplications, the first breakpoint of translocations and the center of all other signatures
+    (the position used by form_partitions)."""
+    if signature.type == "tra":
+        return signature.contig1, signature.pos1
+    elif signature.type == "ins_dup":
+        return signature.contig2, signature.pos
+    else:
+        contig, start, end = signature.get_source()
+        return contig, (start + end) // 2
+
+
+class Shard:
+    """A part of the genome that is analyzed independently from the rest: a window of a large contig, a whole
+    contig or a group of small contigs. A shard owns the signatures in its regions (see get_signature_position)
+    so that every signature is owned by exactly one shard. It keeps all signatures in its view, i.e. its regions
+    extended by a margin on both sides (translocations if either breakpoint lies in the view), and analyzes every
+    read with an alignment within read_margin of the view. The regions at the ends of a contig are open."""
+    def __init__(self, index, regions, margin=0, read_margin=0):
+        """regions is a list of (contig, start, end, contig length) tuples with at most one region per contig."""
+        self.index = index
+        self.name = "shard_{0:04d}".format(index)
+        self.contigs = [contig for contig, start, end, length in regions]
+        self.regions = [(contig, start, end) for contig, start, end, length in regions]
+        self.read_margin = read_margin
+        self.cores = {}
+        self.views = {}
+        self.windowed = False
+        for contig, start, end, length in regions:
+            if end < length:
+                self.cores[contig] = (start, end)
+                self.views[contig] = (max(0, start - margin), end + margin)
+            else:
+                self.cores[contig] = (start, float("inf"))
+                self.views[contig] = (max(0, start - margin), float("inf"))
+            if start > 0 or end < length:
+                self.windowed = True
+        # Expected cost of analyzing the shard (see get_shards)
+        self.cost = self.get_length()
+        # Attempt of a shard run from a work queue (see get_working_dir)
+        self.attempt = None
+
+
+    def describe(self):
+        if self.windowed:
+            return "{0}:{1}-{2}".format(*self.regions[0])
+        return ", ".join(self.contigs[:3]) + (", .." if len(self.contigs) > 3 else "")
+
+
+    def get_length(self):
+        return sum(end - start for contig, start, end in self.regions)
+
+
+    def get_read_regions(self):
+        """Return the (contig, start, end) regions with the alignments of the reads to analyze (end is None at the end of a contig)."""
+        read_regions = []
+        for contig in self.contigs:
+            view_start, view_end = self.views[contig]
+            read_regions.append((contig, max(0, view_start - self.read_margin), None if view_end == float("inf") else view_end + self.read_margin))
+        return read_regions
+
+
+    def overlaps(self, contig, start, end):
+        """Return whether an alignment from start to end on contig lies within read_margin of the view."""
+        try:
+            view_start, view_end = self.views[contig]
+        except KeyError:
+            return False
+        return start < view_end + self.read_margin and end > view_start - self.read_margin
+
+
+    def in_view(self, contig, position):
+        try:
+            view_start, view_end = self.views[contig]
+        except KeyError:
+            return False
+        return view_start <= position < view_end
+
+
+    def in_core(self, contig, position):
+        try:
+            core_start, core_end = self.cores[contig]
+        except KeyError:
+            return False
+        return core_start <= position < core_end
+
+
+    def covers_signature(self, signature):
+        if signature.type == "tra":
+            return self.in_view(signature.contig1, signature.pos1) or self.in_view(signature.contig2, signature.pos2)
+        return self.in_view(*get_signature_position(signature))
+
+
+    def owns_signature(self, signature):
+        return self.in_core(*get_signature_position(signature))
+
+
+    def select_signatures(self, signatures):
+        return [signature for signature in signatures if self.covers_signature(signature)]
+
+
+    def get_working_dir(self, working_dir):
+        """Return the working directory of the shard (of its attempt if it is run from a work queue)."""
+        if self.attempt != None:
+            return os.path.join(working_dir, "shards", self.name, "attempt_{0}".format(self.attempt))
+        return os.path.join(working_dir, "shards", self.name)
+
+
+class ShardLogFilter(logging.Filter):
+    """Prefix all log messages of a worker process with the name of its shard."""
+    def __init__(self, shard_name):
+        super().__init__()
+        self.prefix = "[{0}] ".format(shard_name)
+
+
+    def filter(self, record):
+        record.msg = self.prefix + str(record.msg)
+        return True
+
+
+def get_shards(contig_names, contig_lengths, min_length, window_size=0, margin=0, read_margin=0, density=None):
+    """Split the genome into shards. Contigs longer than window_size (if it is not 0) are split into windows of
+    equal length (at least margin), contigs of at least min_length form their own shard and shorter contigs are
+    grouped (in their order) into shards of at least min_length in total. If a SignatureDensityIndex is given,
+    contigs with a higher expected cost than window_size bp of average cost are split into windows of equal
+    expected cost instead and the cost of each shard is set to its expected cost (otherwise to its length)."""
+    if density != None:
+        base_cost = density.get_base_cost(contig_names, contig_lengths)
+        contig_costs = [density.get_cost(contig, length, 0, length, base_cost) for contig, length in zip(contig_names, contig_lengths)]
+        window_cost = sum(contig_costs) * window_size / max(1, sum(contig_lengths))
+    groups = []
+    group = []
+    group_length = 0
+    for contig_index, (contig, length) in enumerate(zip(contig_names, contig_lengths)):
+        if window_size > 0:
+            if density != None:
+                number_of_windows = int(ceil(contig_costs[contig_index] / window_cost)) if window_cost > 0 else 1
+            else:
+                number_of_windows = -(-length // window_size)
+            number_of_windows = min(number_of_windows, length // max(1, margin))
+            if number_of_windows > 1:
+                if density != None:
+                    bounds = density.split_contig(contig, length, number_of_windows, margin, base_cost)
+                else:
+                    bounds = [length * window_index // number_of_windows for window_index in range(number_of_windows + 1)]
+                for start, end in zip(bounds[:-1], bounds[1:]):
+                    groups.append([(contig, start, end, length)])
+                continue
+        if length >= min_length:
+            groups.append([(contig, 0, length, length)])
+            continue
+        group.append((contig, 0, length, length))
+        group_length += length
+        if group_length >= min_length:
+            groups.append(group)
+            group = []
+            group_length = 0
+    if len(group) > 0:
+        groups.append(group)
+    shards = [Shard(index, regions, margin, read_margin) for index, regions in enumerate(groups)]
+    if density != None:
+        for shard, regions in zip(shards, groups):
+            shard.cost = sum(density.get_cost(contig, length, start, end, base_cost) for contig, start, end, length in regions)
+    return shards
+
+
+def write_shard_layout(working_dir, shards, parameters):
+    """Save the shards of a run and the parameters they were created with into shards/layout.pickle in the working directory."""
+    directory = os.path.join(working_dir, "shards")
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(os.path.join(directory, "layout.pickle"), "wb") as layout_file:
+        pickle.dump({"parameters": parameters, "shards": shards}, layout_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_shard_layout(working_dir, parameters):
+    """Return the shards saved by write_shard_layout if they were created with the same parameters, otherwise None."""
+    try:
+        with open(os.path.join(working_dir, "shards", "layout.pickle"), "rb") as layout_file:
+            layout = pickle.load(layout_file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if layout["parameters"] != parameters:
+        return None
+    return layout["shards"]
+
+
+def find_first_partition_start(positions, view_start, max_delta):
+    """Return the index of the first of the sorted signature positions that certainly starts a partition (see
+    form_partitions) although the signatures before view_start are unknown: the first signature of a contig or
+    a signature more than max_delta after the previous one. Returns len(positions) if there is none."""
+    previous = None if view_start == 0 else view_start
+    for index, position in enumerate(positions):
+        if previous == None or position - previous > max_delta:
+            return index
+        previous = position
+    return len(positions)
+
+
+def partition_window(signatures, shard, contig, max_delta):
+    """Partition the signatures of one unilocal type in the view of a shard on a contig. The partitions starting
+    from the first certain partition start are the same as in form_partitions over all signatures of the contig.
+    Returns a tuple (partitions starting in the region of the shard, signatures in the region before the first
+    certain partition start, position of the last returned partition or None). The margin of the view must be
+    larger than max_delta so that all returned partitions are complete."""
+    sorted_signatures = sorted(signatures, key=lambda signature: signature.get_sort_key())
+    positions = [get_signature_position(signature)[1] for signature in sorted_signatures]
+    first_start = find_first_partition_start(positions, shard.views[contig][0], max_delta)
+    partitions = [partition for partition in form_partitions(sorted_signatures[first_start:], max_delta) if shard.owns_signature(partition[0])]
+    pending = [signature for signature in sorted_signatures[:first_start] if shard.owns_signature(signature)]
+    last_start = get_signature_position(partitions[-1][0])[1] if len(partitions) > 0 else None
+    return partitions, pending, last_start
+
+
+def reconcile_pending_signatures(windows, max_delta):
+    """Partition the pending signatures of the consecutive windows of a contig. windows is a list of
+    (pending signatures, position of the last partition of the window or None) tuples (see partition_window).
+    Signatures that belong to the last partition of the previous window are dropped because it was complete.
+    Returns the partitions of the remaining signatures which are the same as in form_partitions over all
+    signatures of the contig."""
+    partitions = []
+    current_partition = None
+    current_start = None
+    for pending, last_start in windows:
+        for signature in pending:
+            position = get_signature_position(signature)[1]
+            if current_start != None and position - current_start <= max_delta:
+                if current_partition != None:
+                    current_partition.append(signature)
+            else:
+                if current_partition != None:
+                    partitions.append(current_partition)
+                current_partition = [signature]
+                current_start = position
+        if last_start != None:
+            if current_partition != None:
+                partitions.append(current_partition)
+            current_partition = None
+            current_start = last_start
+    if current_partition != None:
+        partitions.append(current_partition)
+    return partitions
+
+
+def cluster_and_consolidate(partitions, sv_type, options):
+    """Cluster the signatures in each partition. Returns a list of (sort key of the first signature of the
+    partition, consolidated clusters of the partition) tuples."""
+    clusters_by_partition = cluster_partitions(partitions, options)
+    record_clustering_stats(partitions, [cluster for partition_clusters in clusters_by_partition for cluster in partition_clusters])
+    if sv_type in BILOCAL_TYPES:
+        consolidated = [consolidate_clusters_bilocal(partition_clusters) for partition_clusters in clusters_by_partition]
+    else:
+        consolidated = [consolidate_clusters_unilocal(partition_clusters, options) for partition_clusters in clusters_by_partition]
+    return [(partition[0].get_sort_key(), partition_clusters) for partition, partition_clusters in zip(partitions, consolidated)]
+
+
+def flatten_partition_clusters(partition_clusters, sv_type):
+    """Return the clusters of all partitions in the order of partition_and_cluster_unilocal or partition_and_cluster_bilocal."""
+    clusters = [cluster for key, clusters in sorted(partition_clusters, key=lambda item: item[0]) for cluster in clusters]
+    if sv_type not in BILOCAL_TYPES:
+        clusters.sort(key=lambda cluster: (cluster.contig, (cluster.end + cluster.start) / 2))
+    return clusters
+
+
+def get_signature_chunks(sv_type, sv_signatures, budget):
+    """Yield (contig, signatures) tuples with the signatures of a type, one (source) contig at a time."""
+    if budget != None:
+        for contig, signatures in budget.iterate_chunks(sv_type):
+            yield contig, signatures
+    else:
+        signatures_by_contig = defaultdict(list)
+        for signature in sv_signatures:
+            if signature.type == sv_type:
+                signatures_by_contig[signature.get_key()[1]].append(signature)
+        for contig in sorted(signatures_by_contig.keys()):
+            yield contig, signatures_by_contig[contig]
+
+
+def cluster_shard_signatures(shard, options, sv_signatures=None, budget=None):
+    """Cluster the signatures of a shard (from a list or spilled by a MemoryBudget). Only the partitions that start
+    in the regions of the shard and are certainly complete are clustered. The other signatures owned by the shard
+    are left for merge_shard_results: the signatures before the first certain partition start in a window (see
+    partition_window) and all interspersed duplications inserted into a window. Returns a tuple (results for
+    write_shard_results, signature clusters of the shard in the format of cluster_sv_signatures)."""
+    stats = get_run_stats()
+    results = OrderedDict()
+    for sv_type, description in CLUSTERED_TYPES:
+        with stats.stage(sv_type):
+            partitions = []
+            pending = defaultdict(list)
+            last_starts = {}
+            for contig, signatures in get_signature_chunks(sv_type, sv_signatures, budget):
+                if sv_type == "ins_dup":
+                    # Partitions of interspersed duplications are formed on source and destination. They are only
+                    # complete if the shard covers the whole destination contig.
+                    if shard.windowed:
+                        for signature in signatures:
+                            if shard.owns_signature(signature):
+                                pending[signature.contig2].append(signature)
+                    else:
+                        partitions.extend(form_partitions(signatures, options.partition_max_distance))
+                else:
+                    contig_partitions, contig_pending, last_start = partition_window(signatures, shard, contig, options.partition_max_distance)
+                    partitions.extend(contig_partitions)
+                    if len(contig_pending) > 0:
+                        pending[contig] = contig_pending
+                    if last_start != None:
+                        last_starts[contig] = last_start
+                del signatures
+            partition_clusters = cluster_and_consolidate(partitions, sv_type, options)
+            number_of_clusters = sum(len(clusters) for key, clusters in partition_clusters)
+            number_of_pending = sum(len(signatures) for signatures in pending.values())
+            logging.info("Clustered {0}: {1} partitions and {2} clusters ({3} signatures left for the merge)".format(description, len(partitions), number_of_clusters, number_of_pending))
+            stats.set("clusters", number_of_clusters)
+            stats.set("pending_signatures", number_of_pending)
+            results[sv_type] = {"partitions": partition_clusters, "pending": dict(pending), "last_partition_starts": last_starts}
+    if budget != None:
+        translocations = budget.load_all("tra")
+    else:
+        translocations = [signature for signature in sv_signatures if signature.type == "tra"]
+    # Translocations between two shards are merged from the shard of their first breakpoint
+    results["tra"] = [translocation for translocation in translocations if shard.owns_signature(translocation)]
+    signature_clusters = tuple(flatten_partition_clusters(results[sv_type]["partitions"], sv_type) for sv_type, description in CLUSTERED_TYPES)
+    return results, signature_clusters + (complete_translocations(translocations),)
+
+
+def write_shard_results(working_dir, shard, results):
+    """Save the results of cluster_shard_signatures into shard_results.pickle in the working directory of a shard.
+    The file is written under a temporary name first, so that it is either complete or missing."""
+    path = os.path.join(working_dir, "shard_results.pickle")
+    with open("{0}.{1}.tmp".format(path, os.getpid()), "wb") as results_file:
+        pickle.dump({"contigs": shard.contigs, "results": results}, results_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.rename("{0}.{1}.tmp".format(path, os.getpid()), path)
+
+
+def load_shard_results(working_dir, shard):
+    with open(os.path.join(shard.get_working_dir(working_dir), "shard_results.pickle"), "rb") as results_file:
+        return pickle.load(results_file)["results"]
+
+
+def merge_shard_results(working_dir, shards, options, version, contig_names, contig_lengths):
+    """Merge the results of all shards (in the order of get_shards) and run COMBINE on them. The pending signatures
+    of the windows of each contig are partitioned (see reconcile_pending_signatures) and clustered, so that the
+    signature clusters, candidates and VCF files in the working directory are the same as in a run without shards."""
+    stats = get_run_stats()
+    partition_clusters = dict((sv_type, []) for sv_type, description in CLUSTERED_TYPES)
+    windows = dict((sv_type, OrderedDict()) for sv_type, description in CLUSTERED_TYPES)
+    translocations = []
+    with stats.stage("load"):
+        for shard in shards:
+            results = load_shard_results(working_dir, shard)
+            for sv_type, description in CLUSTERED_TYPES:
+                partition_clusters[sv_type].extend(results[sv_type]["partitions"])
+                for contig in shard.contigs:
+                    windows[sv_type].setdefault(contig, []).append((results[sv_type]["pending"].get(contig, []), results[sv_type]["last_partition_starts"].get(contig)))
+            translocations.extend(results["tra"])
+        stats.set("translocation_breakpoints", len(translocations))
+
+    with stats.stage("reconcile"):
+        for sv_type, description in CLUSTERED_TYPES:
+            with stats.stage(sv_type):
+                if sv_type == "ins_dup":
+                    pending = [signature for contig_windows in windows[sv_type].values() for window_pending, last_start in contig_windows for signature in window_pending]
+                    partitions = form_partitions(pending, options.partition_max_distance)
+                else:
+                    partitions = []
+                    for contig_windows in windows[sv_type].values():
+                        partitions.extend(reconcile_pending_signatures(contig_windows, options.partition_max_distance))
+                partition_clusters[sv_type].extend(cluster_and_consolidate(partitions, sv_type, options))
+                logging.info("Reconciled {0}: {1} partitions from the edges of windows".format(description, len(partitions)))
+        signature_clusters = tuple(flatten_partition_clusters(partition_clusters[sv_type], sv_type) for sv_type, description in CLUSTERED_TYPES)
+        signature_clusters += (complete_translocations(translocations),)
+
+    with stats.stage("write_signature_clusters"):
+        write_signature_clusters_bed(working_dir, signature_clusters, contig_names, contig_lengths, options.index_bed, options.compression_threads)
+        write_signature_clusters_vcf(working_dir, signature_clusters, version, contig_names, contig_lengths, options.compress_output, options.compression_threads)
+        if options.export_columnar:
+            export_signature_clusters(working_dir, signature_clusters, contig_names)
+        write_histograms(working_dir, signature_clusters)
+
+    with stats.stage("COMBINE"):
+        combine_clusters(signature_clusters, working_dir, options, version, contig_names, contig_lengths, options.sample)
@@ -0,0 +1,209 @@
+import os
+import sys
+import json
+import threading
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import perf_counter, process_time, sleep
+
+from svim.SVIM_hooks import hooks, emit
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+def get_peak_rss():
+    """Return the peak resident set size of the process in bytes (or None if unknown)."""
+    if resource == None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on macOS and in kilobytes on Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_current_rss():
+    """Return the current resident set size of the process in bytes (or None if unknown)."""
+    try:
+        with open("/proc/self/statm") as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class RssSampler:
+    """Sample the resident set size in a background thread while stages are open and record the peak of every
+    open stage. ru_maxrss only gives the peak of the whole process, which later stages cannot fall below."""
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        # Peaks of the open stages as one-item lists
+        self.open_peaks = []
+        self.thread = None
+
+
+    def sample(self):
+        rss = get_current_rss()
+        if rss == None:
+            return
+        with self.lock:
+            for peak in self.open_peaks:
+                if peak[0] == None or rss > peak[0]:
+                    peak[0] = rss
+
+
+    def run(self):
+        while True:
+            sleep(self.interval)
+            with self.lock:
+                if len(self.open_peaks) == 0:
+                    self.thread = None
+                    return
+            self.sample()
+
+
+    def start_stage(self):
+        """Start recording the peak of a new stage. Returns the peak to pass to finish_stage."""
+        peak = [None]
+        with self.lock:
+            self.open_peaks.append(peak)
+            # Threads are not inherited by forked processes
+            if self.thread == None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        self.sample()
+        return peak
+
+
+    def finish_stage(self, peak):
+        """Stop recording the peak of a stage and return it in bytes (or None if unknown)."""
+        self.sample()
+        with self.lock:
+            # Peaks of nested stages may be equal, so they are compared by identity
+            self.open_peaks = [open_peak for open_peak in self.open_peaks if open_peak is not peak]
+        return peak[0]
+
+
+def summarize_sizes(sizes):
+    """Summarize a list of sizes (e.g. of partitions) by their count, minimum, maximum, mean and quantiles."""
+    if len(sizes) == 0:
+        return OrderedDict([("count", 0)])
+    sorted_sizes = sorted(sizes)
+    def quantile(fraction):
+        return sorted_sizes[min(len(sorted_sizes) - 1, int(fraction * len(sorted_sizes)))]
+    return OrderedDict([("count", len(sorted_sizes)),
+                        ("min", sorted_sizes[0]),
+                        ("median", quantile(0.5)),
+                        ("mean", round(sum(sorted_sizes) / len(sorted_sizes), 2)),
+                        ("p90", quantile(0.9)),
+                        ("p99", quantile(0.99)),
+                        ("max", sorted_sizes[-1]),
+                        ("total", sum(sorted_sizes))])
+
+
+# Seconds between two samples of the resident set size while stages are open
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+class RunStats:
+    """Per-stage statistics of an SVIM run: wall-clock and CPU time, memory usage and counters.
+    The peak memory usage of each stage is sampled while it is open (see RssSampler).
+    Stages are opened with the stage() context manager and can be nested (e.g. CLUSTER/del).
+    Counters are always added to the innermost open stage. Listeners are notified when stages start and end
+    by calling their stage_started(name) and stage_finished(name) methods. Registered stage hooks are called
+    inside of the listeners (see SVIM_hooks).
+    """
+    def __init__(self):
+        self.stages = []
+        self.open_stages = []
+        self.listeners = []
+        self.start_wall_time = perf_counter()
+        self.start_cpu_time = process_time()
+        self.rss_sampler = RssSampler(RSS_SAMPLE_INTERVAL)
+
+
+    @contextmanager
+    def stage(self, name):
+        if len(self.open_stages) > 0:
+            name = self.open_stages[-1]["name"] + "/" + name
+        stage = OrderedDict([("name", name), ("counters", OrderedDict())])
+        self.stages.append(stage)
+        self.open_stages.append(stage)
+        for listener in self.listeners:
+            listener.stage_started(name)
+        start_wall_time = perf_counter()
+        start_cpu_time = process_time()
+        peak_rss = self.rss_sampler.start_stage()
+        try:
+            if hooks:
+                emit("stage_started", name)
+            yield stage
+        finally:
+            stage["wall_time_s"] = round(perf_counter() - start_wall_time, 4)
+            stage["cpu_time_s"] = round(process_time() - start_cpu_time, 4)
+            stage["peak_rss_bytes"] = self.rss_sampler.finish_stage(peak_rss)
+            stage["rss_bytes"] = get_current_rss()
+            self.open_stages.pop()
+            if hooks:
+                emit("stage_finished", name)
+            for listener in reversed(self.listeners):
+                listener.stage_finished(name)
+
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+
+    def get_current_stage(self):
+        """Return the name of the innermost open stage (or None)."""
+        if len(self.open_stages) == 0:
+            return None
+        return self.open_stages[-1]["name"]
+
+
+    def count(self, key, value=1):
+        """Add value to a counter of the current stage."""
+        if len(self.open_stages) == 0:
+            return
+        counters = self.open_stages[-1]["counters"]
+        counters[key] = counters.get(key, 0) + value
+
+
+    def set(self, key, value):
+        """Set a statistic of the current stage."""
+        if len(self.open_stages) == 0:
+            return
+        self.open_stages[-1]["counters"][key] = value
+
+
+    def get_report(self):
+        return OrderedDict([("wall_time_s", round(perf_counter() - self.start_wall_time, 4)),
+                            ("cpu_time_s", round(process_time() - self.start_cpu_time, 4)),
+                            ("peak_rss_bytes", get_peak_rss()),
+                            ("stages", self.stages)])
+
+
+    def write(self, path, **metadata):
+        """Write the statistics as JSON to path. Additional keyword arguments are included as metadata."""
+        report = OrderedDict(sorted(metadata.items()))
+        report.update(self.get_report())
+        with open(path, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+
+run_stats = RunStats()
+
+
+def get_run_stats():
+    """Return the statistics of the current run."""
+    return run_stats
+
+
+def reset_run_stats():
+    """Start collecting statistics for a new run and return the new RunStats object."""
+    global run_stats
+    run_stats = RunStats()
+    return run_stats
@@ -0,0 +1,149 @@
+import os
+import sys
+import logging
+import multiprocessing
+
+from copy import copy, deepcopy
+from math import ceil
+from itertools import product
+from collections import Counter, OrderedDict
+from time import perf_counter
+
+from svim.SVIM_pipeline import collect_signatures
+from svim.SVIM_CLUSTER import cluster_sv_signatures
+from svim.SVIM_COMBINE import combine_clusters
+from svim.SVIM_checkpoint import get_fingerprint, find_checkpoint, write_checkpoint, iterate_checkpoint, get_signature_chunks
+from svim.SVIM_stats import reset_run_stats
+from svim.SVIM_progress import StageProgressLogger, format_duration
+from svim.SVIM_shards import ShardLogFilter
+
+
+CLUSTER_PARAMETERS = ["partition_max_distance", "distance_normalizer", "cluster_max_distance"]
+COMBINE_PARAMETERS = ["del_ins_dup_max_distance", "trans_destination_partition_max_distance", "trans_partition_max_distance", "trans_sv_max_distance"]
+# Types of the candidates in the order returned by combine_clusters
+CANDIDATE_TYPES = ["dup_int", "inv", "dup_tan", "del", "nov_ins"]
+
+# Signatures of the sweep (shared with forked worker processes) and the last signature clusters of a worker process
+sweep_signatures = None
+sweep_clusters = (None, None)
+
+
+def get_configurations(options):
+    """Return the configurations of the parameter grid as a list of (name, OrderedDict of parameter values) tuples.
+    Configurations with the same CLUSTER parameters are consecutive."""
+    names = CLUSTER_PARAMETERS + COMBINE_PARAMETERS
+    configurations = []
+    for index, values in enumerate(product(*[getattr(options, name) for name in names])):
+        configurations.append(("config_{0:04d}".format(index + 1), OrderedDict(zip(names, values))))
+    return configurations
+
+
+def init_sweep_worker(checkpoint_dir):
+    global sweep_signatures
+    if sweep_signatures == None:
+        # Worker processes that are not forked load the signatures from the COLLECT checkpoint
+        sweep_signatures = [signature for chunk in iterate_checkpoint(checkpoint_dir, "COLLECT") for signature in chunk]
+
+
+def run_sweep_configuration(arguments):
+    """Run CLUSTER and COMBINE for one configuration of a sweep. CLUSTER is skipped if the previous configuration of
+    the process had the same CLUSTER parameters. Returns a tuple (name, numbers of candidates by type, CLUSTER time,
+    COMBINE time)."""
+    global sweep_clusters
+    options, version, contig_names, contig_lengths, name, parameters = arguments
+    configuration_options = copy(options)
+    for parameter, value in parameters.items():
+        setattr(configuration_options, parameter, value)
+    configuration_options.working_dir = os.path.join(options.working_dir, "sweep", name)
+    if not os.path.exists(configuration_options.working_dir):
+        os.makedirs(configuration_options.working_dir)
+    root_logger = logging.getLogger()
+    log_filter = ShardLogFilter(name)
+    root_logger.addFilter(log_filter)
+    try:
+        reset_run_stats()
+        cluster_key = tuple(parameters[parameter] for parameter in CLUSTER_PARAMETERS)
+        start_time = perf_counter()
+        if sweep_clusters[0] != cluster_key:
+            sweep_clusters = (cluster_key, cluster_sv_signatures(sweep_signatures, configuration_options))
+        cluster_seconds = perf_counter() - start_time
+        start_time = perf_counter()
+        # COMBINE modifies the signature clusters
+        candidates = combine_clusters(deepcopy(sweep_clusters[1]), configuration_options.working_dir, configuration_options, version,
+                                      contig_names, contig_lengths, options.sample)
+        combine_seconds = perf_counter() - start_time
+    finally:
+        root_logger.removeFilter(log_filter)
+    candidate_counts = OrderedDict((sv_type, len(type_candidates)) for sv_type, type_candidates in zip(CANDIDATE_TYPES, candidates))
+    return name, candidate_counts, cluster_seconds, combine_seconds
+
+
+def write_sweep_report(path, configurations, results):
+    """Write one tab-separated row per configuration with its parameter values, numbers of candidates and run times."""
+    with open(path, "w") as report_file:
+        print("\t".join(["configuration"] + CLUSTER_PARAMETERS + COMBINE_PARAMETERS + CANDIDATE_TYPES + ["cluster_time_s", "combine_time_s"]), file=report_file)
+        for name, parameters in configurations:
+            candidate_counts, cluster_seconds, combine_seconds = results[name]
+            fields = [name] + [str(value) for value in parameters.values()] + [str(count) for count in candidate_counts.values()]
+            fields += ["{0:.4f}".format(cluster_seconds), "{0:.4f}".format(combine_seconds)]
+            print("\t".join(fields), file=report_file)
+
+
+def run_sweep(options, version):
+    """Run COLLECT once (or load the signatures from a matching COLLECT checkpoint, see run_pipeline) and then CLUSTER
+    and COMBINE for every configuration of the parameter grid (see get_configurations) in options.sweep_workers
+    worker processes that share the signatures. Writes the candidates and VCF of each configuration into
+    sweep/<configuration> and one row per configuration into sweep/sweep_report.tsv in the working directory.
+    Returns the statistics of the run (or None if the input cannot be processed)."""
+    global sweep_signatures
+    if not os.path.exists(options.working_dir):
+        os.makedirs(options.working_dir)
+    stats = reset_run_stats()
+    stats.add_listener(StageProgressLogger())
+    configurations = get_configurations(options)
+    checkpoint_dir = options.working_dir + "/checkpoints"
+    fingerprint = get_fingerprint(options, version, "COLLECT")
+
+    logging.info("****************** STEP 1: COLLECT ******************")
+    with stats.stage("COLLECT"):
+        stage, checkpoint = find_checkpoint(checkpoint_dir, [("COLLECT", fingerprint)])
+        if stage != None:
+            logging.info("Loading the signatures from the checkpoint written after COLLECT in {0}".format(checkpoint_dir))
+            sv_signatures = [signature for chunk in iterate_checkpoint(checkpoint_dir, "COLLECT") for signature in chunk]
+            contig_names, contig_lengths = checkpoint["metadata"]["contig_names"], checkpoint["metadata"]["contig_lengths"]
+            signature_counts = Counter(checkpoint["metadata"]["signatures"])
+        else:
+            sv_signatures, aln_file = collect_signatures([options.bam_file], options)
+            if sv_signatures == None:
+                return
+            contig_names, contig_lengths = list(aln_file.references), list(aln_file.lengths)
+            signature_counts = Counter([signature.type for signature in sv_signatures])
+            with stats.stage("checkpoint"):
+                write_checkpoint(checkpoint_dir, "COLLECT", fingerprint, get_signature_chunks(sv_signatures),
+                                 {"contig_names": contig_names, "contig_lengths": contig_lengths, "signatures": dict(signature_counts)})
+        stats.set("signatures", OrderedDict(sorted(signature_counts.items())))
+    logging.info("Found {0} signatures.".format(len(sv_signatures)))
+
+    workers = max(1, min(options.sweep_workers, len(configurations)))
+    logging.info("****************** SWEEP: {0} configurations on {1} worker processes ******************".format(len(configurations), workers))
+    results = {}
+    with stats.stage("SWEEP"):
+        sweep_signatures = sv_signatures
+        arguments = [(options, version, contig_names, contig_lengths, name, parameters) for name, parameters in configurations]
+        # Consecutive configurations share their CLUSTER parameters, so every worker gets one block of them
+        pool = multiprocessing.Pool(workers, init_sweep_worker, (checkpoint_dir,))
+        try:
+            for finished, (name, candidate_counts, cluster_seconds, combine_seconds) in enumerate(pool.imap_unordered(run_sweep_configuration, arguments, int(ceil(len(arguments) / workers)))):
+                logging.info("Finished {0} in {1} ({2} of {3} configurations finished).".format(name, format_duration(cluster_seconds + combine_seconds), finished + 1, len(configurations)))
+                results[name] = (candidate_counts, cluster_seconds, combine_seconds)
+                stats.set(name, OrderedDict([("candidates", candidate_counts), ("cluster_time_s", round(cluster_seconds, 4)), ("combine_time_s", round(combine_seconds, 4))]))
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+            sweep_signatures = None
+
+    write_sweep_report(options.working_dir + "/sweep/sweep_report.tsv", configurations, results)
+    logging.info("Wrote the results of all configurations to {0}/sweep/sweep_report.tsv".format(options.working_dir))
+    stats.write(options.working_dir + "/run_report.json", version=version, command=" ".join(sys.argv), mode=options.sub, configurations=len(configurations))
+    return stats
@@ -0,0 +1,131 @@
+from array import array
+from collections import defaultdict
+from math import pow, sqrt
+
+from svim.SVSignature import SignatureTranslocationReversed
+from svim.SVIM_merging import get_closest_index
+
+
+class CompletedTranslocations:
+    """Read-only sequence of translocation signatures in both orientations. The first half of the sequence
+    contains the given signatures, the second half their reversed counterparts. Each translocation is stored
+    only once and reversed signatures are created as lightweight views when they are accessed.
+    """
+    def __init__(self, translocations):
+        self.translocations = translocations
+
+
+    def __len__(self):
+        return 2 * len(self.translocations)
+
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if 0 <= index < len(self.translocations):
+            return self.translocations[index]
+        elif len(self.translocations) <= index < len(self):
+            return SignatureTranslocationReversed(self.translocations[index - len(self.translocations)])
+        else:
+            raise IndexError("translocation index out of range")
+
+
+    def __iter__(self):
+        for translocation in self.translocations:
+            yield translocation
+        for translocation in self.translocations:
+            yield SignatureTranslocationReversed(translocation)
+
+
+def summarize_positions(positions):
+    """Return the rounded mean and the rounded standard deviation (around the rounded mean) of a list of positions."""
+    position_mean = int(round(sum(positions) / len(positions)))
+    position_std = int(round(sqrt(sum([pow(abs(position - position_mean), 2) for position in positions]) / len(positions))))
+    return position_mean, position_std
+
+
+def summarize_destinations(destinations, max_delta):
+    """Summarize a list of (contig, position) destinations of translocation breakpoints.
+    Returns a (contig, mean position, standard deviation) tuple if all destinations lie on the same contig
+    within max_delta of each other and None if they point to several destinations."""
+    contigs = set([contig for contig, position in destinations])
+    if len(contigs) > 1:
+        return None
+    positions = [position for contig, position in destinations]
+    if max(positions) - min(positions) > max_delta:
+        return None
+    position_mean, position_std = summarize_positions(positions)
+    return (destinations[0][0], position_mean, position_std)
+
+
+class TranslocationBreakpointIndex:
+    """Index of translocation breakpoints with a given orientation (fwd/fwd or rev/rev).
+    For each contig, the breakpoint positions are kept in a sorted array and split into partitions of breakpoints
+    within partition_max_distance of the first breakpoint of the partition. The mean position and standard
+    deviation of each partition and a summary of the breakpoint destinations are precomputed so that the
+    partition closest to a genomic position is found with a binary search. Only the indices of the breakpoints
+    in the given sequence of translocations are stored.
+    """
+    def __init__(self, translocations, direction, partition_max_distance, destination_partition_max_distance):
+        self.translocations = translocations
+        breakpoints_by_contig = defaultdict(list)
+        for translocation_index, translocation in enumerate(translocations):
+            if translocation.direction1 == direction and translocation.direction2 == direction:
+                breakpoints_by_contig[translocation.contig1].append((translocation.pos1, translocation_index))
+
+        self.members = {}
+        self.partition_starts = {}
+        self.partition_means = {}
+        self.partition_stds = {}
+        self.destinations = {}
+        for contig, contig_breakpoints in breakpoints_by_contig.items():
+            contig_breakpoints.sort()
+            positions = array('q', [position for position, translocation_index in contig_breakpoints])
+            members = array('q', [translocation_index for position, translocation_index in contig_breakpoints])
+            partition_starts = []
+            for index, position in enumerate(positions):
+                if len(partition_starts) == 0 or position - positions[partition_starts[-1]] > partition_max_distance:
+                    partition_starts.append(index)
+            partition_ends = partition_starts[1:] + [len(positions)]
+
+            self.members[contig] = members
+            self.partition_starts[contig] = array('q', partition_starts)
+            self.partition_means[contig] = []
+            self.partition_stds[contig] = []
+            self.destinations[contig] = []
+            for start, end in zip(partition_starts, partition_ends):
+                position_mean, position_std = summarize_positions(positions[start:end])
+                self.partition_means[contig].append(position_mean)
+                self.partition_stds[contig].append(position_std)
+                partition_translocations = [translocations[translocation_index] for translocation_index in members[start:end]]
+                self.destinations[contig].append(summarize_destinations([(translocation.contig2, translocation.pos2) for translocation in partition_translocations], destination_partition_max_distance))
+
+
+    def get_closest_partition(self, contig, position):
+        """Return the index of the partition on contig with the mean closest to position or None if there are no breakpoints on contig."""
+        try:
+            return get_closest_index(self.partition_means[contig], position)
+        except KeyError:
+            return None
+
+
+    def get_mean(self, contig, partition_index):
+        return self.partition_means[contig][partition_index]
+
+
+    def get_std(self, contig, partition_index):
+        return self.partition_stds[contig][partition_index]
+
+
+    def get_destination(self, contig, partition_index):
+        """Return (contig, mean position, standard deviation) of the partition's destinations or None if they point to several destinations."""
+        return self.destinations[contig][partition_index]
+
+
+    def get_members(self, contig, partition_index):
+        start = self.partition_starts[contig][partition_index]
+        try:
+            end = self.partition_starts[contig][partition_index + 1]
+        except IndexError:
+            end = len(self.members[contig])
+        return [self.translocations[translocation_index] for translocation_index in self.members[contig][start:end]]
@@ -23,6 +23,12 @@ class Signature:
         return (self.type, contig, (start + end) // 2)
 
 
+    def get_sort_key(self):
+        """Return a key that orders signatures by get_key and signatures with equal keys by all their attributes
+        so that the order does not depend on the order in which the signatures were collected."""
+        return (self.get_key(), self.as_string())
+
+
     def mean_distance_to(self, signature2):
         """Return distance between means of two signatures."""
         this_contig, this_start, this_end = self.get_source()
@@ -226,6 +232,55 @@ class SignatureTranslocation(Signature):
             return float("inf")
 
 
+class SignatureTranslocationReversed(SignatureTranslocation):
+    """SV Signature: view of a translocation signature in reverse orientation (contig2:pos2 connected to contig1:pos1).
+    All attributes are read from the original signature which is not copied."""
+    type = "tra"
+
+    def __init__(self, original):
+        self.original = original
+
+
+    @property
+    def contig1(self):
+        return self.original.contig2
+
+
+    @property
+    def pos1(self):
+        return self.original.pos2
+
+
+    @property
+    def direction1(self):
+        return 'fwd' if self.original.direction2 == 'rev' else 'rev'
+
+
+    @property
+    def contig2(self):
+        return self.original.contig1
+
+
+    @property
+    def pos2(self):
+        return self.original.pos1
+
+
+    @property
+    def direction2(self):
+        return 'fwd' if self.original.direction1 == 'rev' else 'rev'
+
+
+    @property
+    def signature(self):
+        return self.original.signature
+
+
+    @property
+    def read(self):
+        return self.original.read
+
+
 class SignatureClusterUniLocal(Signature):
     """Signature cluster class for clusters of signatures with only one genomic location.
     """
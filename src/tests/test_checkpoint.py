@@ -0,0 +1,62 @@
+import unittest
+import os
+import tempfile
+
+from svim.SVIM_checkpoint import get_fingerprint, write_checkpoint, load_checkpoint_header, iterate_checkpoint, find_checkpoint
+from svim.SVIM_input_parsing import parse_arguments
+from svim.SVIM_shards import Shard
+from svim.SVSignature import SignatureDeletion
+
+class TestSVIMCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.bam_path = os.path.join(self.directory.name, "input.bam")
+        with open(self.bam_path, "w") as bam_file:
+            bam_file.write("alignments")
+        self.checkpoint_dir = os.path.join(self.directory.name, "checkpoints")
+        self.options = parse_arguments('0.4.3', ["alignment", self.directory.name, self.bam_path])
+        self.signatures = [SignatureDeletion("chr1", 100 * i, 100 * i + 200, "cigar", "read{0}".format(i)) for i in range(10)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_fingerprints(self, options):
+        return [(stage, get_fingerprint(options, "0.4.3", stage)) for stage in ["COLLECT", "CLUSTER"]]
+
+    def test_fingerprint(self):
+        collect, cluster = [fingerprint for stage, fingerprint in self.get_fingerprints(self.options)]
+        self.assertEqual(collect["inputs"][0]["size"], 10)
+        self.assertIn("min_mapq", collect)
+        self.assertNotIn("cluster_max_distance", collect)
+        self.assertIn("cluster_max_distance", cluster)
+        self.assertNotIn("sample", cluster)
+        self.assertNotEqual(get_fingerprint(self.options, "0.4.3", "COLLECT", Shard(0, [("chr1", 0, 1000, 2000)])), collect)
+
+    def test_write_read(self):
+        fingerprint = self.get_fingerprints(self.options)[0][1]
+        write_checkpoint(self.checkpoint_dir, "COLLECT", fingerprint, [self.signatures[:5], self.signatures[5:]], {"contig_names": ["chr1"]})
+        header = load_checkpoint_header(self.checkpoint_dir, "COLLECT", fingerprint)
+        self.assertEqual(header["metadata"], {"contig_names": ["chr1"]})
+        self.assertEqual(header["chunks"], 2)
+        chunks = list(iterate_checkpoint(self.checkpoint_dir, "COLLECT"))
+        self.assertEqual([signature.read for chunk in chunks for signature in chunk], [signature.read for signature in self.signatures])
+        # Damaged checkpoints are not used
+        with open(os.path.join(self.checkpoint_dir, "collect.pickle"), "r+b") as data_file:
+            data_file.seek(20)
+            data_file.write(b"\x00")
+        self.assertIsNone(load_checkpoint_header(self.checkpoint_dir, "COLLECT", fingerprint))
+
+    def test_find_checkpoint(self):
+        fingerprints = self.get_fingerprints(self.options)
+        self.assertEqual(find_checkpoint(self.checkpoint_dir, fingerprints), (None, None))
+        write_checkpoint(self.checkpoint_dir, "COLLECT", fingerprints[0][1], [self.signatures])
+        write_checkpoint(self.checkpoint_dir, "CLUSTER", fingerprints[1][1], [([], None)])
+        self.assertEqual(find_checkpoint(self.checkpoint_dir, fingerprints)[0], "CLUSTER")
+        # Changing a CLUSTER option invalidates only the CLUSTER checkpoint
+        self.options.cluster_max_distance = 0.5
+        self.assertEqual(find_checkpoint(self.checkpoint_dir, self.get_fingerprints(self.options))[0], "COLLECT")
+        # Changing the input invalidates both
+        with open(self.bam_path, "a") as bam_file:
+            bam_file.write("more alignments")
+        self.assertEqual(find_checkpoint(self.checkpoint_dir, self.get_fingerprints(self.options)), (None, None))
@@ -0,0 +1,91 @@
+import unittest
+import os
+import tempfile
+import random
+import pysam
+
+from svim.SVIM_density import SignatureDensityIndex, read_density_index, load_density_index, estimate_density_from_bam_index
+from svim.SVIM_shards import Shard, get_shards
+from svim.SVSignature import SignatureDeletion, SignatureInsertionFrom
+
+class TestSVIMDensity(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.index = SignatureDensityIndex(bin_size=1000)
+        signatures = [SignatureDeletion("chr1", 100 * i, 100 * i + 200, "cigar", "read{0}".format(i)) for i in range(50)]
+        signatures.append(SignatureInsertionFrom("chr2", 100, 200, "chr1", 9500, "suppl", "read50"))
+        self.index.add(signatures)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_add(self):
+        self.assertEqual(self.index.get_total(), 51)
+        self.assertEqual(self.index.get_bin_counts("chr1", 10000, "del")[:6], [9, 10, 10, 10, 10, 1])
+        # Deletions are counted at their center, interspersed duplications at their insertion
+        self.assertEqual(self.index.get_bin_counts("chr1", 10000, "ins_dup")[9], 1)
+        # Only the signatures owned by a shard are counted
+        shard_index = SignatureDensityIndex(bin_size=1000, shard=Shard(0, [("chr1", 0, 2000, 10000)], margin=500))
+        shard_index.add([SignatureDeletion("chr1", 100 * i, 100 * i + 200, "cigar", "read{0}".format(i)) for i in range(50)])
+        self.assertEqual(shard_index.get_total(), 19)
+
+    def test_write_read(self):
+        path = os.path.join(self.directory.name, "signature_density.npz")
+        self.index.write(path, ["chr1", "chr2"], [10000, 5000])
+        index, contig_names, contig_lengths = read_density_index(path)
+        self.assertEqual((contig_names, contig_lengths), (["chr1", "chr2"], [10000, 5000]))
+        self.assertEqual(index.bin_size, 1000)
+        self.assertEqual(index.counts["chr1"], self.index.counts["chr1"])
+        self.assertIsNotNone(load_density_index(path, ["chr1", "chr2"], [10000, 5000]))
+        self.assertIsNone(load_density_index(path, ["chr1", "chr2"], [10000, 6000]))
+        self.assertIsNone(load_density_index(os.path.join(self.directory.name, "missing.npz"), ["chr1"], [10000]))
+
+    def test_split_contig(self):
+        bounds = self.index.split_contig("chr1", 10000, 4, 500)
+        self.assertEqual(bounds[0], 0)
+        self.assertEqual(bounds[-1], 10000)
+        costs = [self.index.get_cost("chr1", 10000, start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+        self.assertTrue(max(costs) - min(costs) < 2)
+        # The dense start of the contig is split into shorter windows
+        self.assertTrue(bounds[1] < 2500)
+        # Windows are at least min_length long
+        bounds = self.index.split_contig("chr1", 10000, 4, 2400)
+        self.assertTrue(all(end - start >= 2400 for start, end in zip(bounds[:-1], bounds[1:])))
+
+    def test_get_shards(self):
+        shards = get_shards(["chr1", "chr2"], [10000, 5000], 3000, window_size=2500, margin=200, density=self.index)
+        windows = [shard for shard in shards if shard.regions[0][0] == "chr1"]
+        self.assertTrue(len(windows) > 1)
+        self.assertEqual(windows[0].regions[0][1], 0)
+        self.assertEqual(windows[-1].regions[0][2], 10000)
+        self.assertTrue(windows[0].get_length() < windows[-1].get_length())
+        self.assertTrue(all(shard.cost > 0 for shard in shards))
+
+    def test_estimate_from_bam_index(self):
+        """Write a coordinate-sorted BAM file with most reads in the first 100 kb of chr1."""
+        random.seed(0)
+        header = {"HD": {"VN": "1.0", "SO": "coordinate"}, "SQ": [{"SN": "chr1", "LN": 1000000}, {"SN": "chr2", "LN": 100000}]}
+        positions = sorted([("chr1", random.randrange(0, 100000)) for i in range(20000)] + [("chr1", random.randrange(100000, 1000000)) for i in range(2000)])
+        path = os.path.join(self.directory.name, "reads.bam")
+        self.assertIsNone(estimate_density_from_bam_index([path], ["chr1", "chr2"]))
+        with pysam.AlignmentFile(path, "wb", header=header) as bam:
+            for index, (contig, position) in enumerate(positions):
+                alignment = pysam.AlignedSegment()
+                alignment.query_name = "read{0}".format(index)
+                alignment.reference_id = 0
+                alignment.reference_start = position
+                alignment.mapping_quality = 60
+                alignment.cigarstring = "200M"
+                alignment.query_sequence = "".join(random.choice("ACGT") for i in range(200))
+                bam.write(alignment)
+        pysam.index(path)
+        index = estimate_density_from_bam_index([path], ["chr1", "chr2"], bin_size=100000)
+        costs = index.get_bin_costs("chr1", 1000000, 0.0)
+        self.assertEqual(len(costs), 11)
+        self.assertGreater(costs[0], 5 * max(costs[1:]))
+        self.assertGreater(min(costs[1:10]), 0)
+        self.assertEqual(index.get_bin_costs("chr2", 100000, 0.0), [0.0, 0.0])
+        # The dense bin is split more finely than the rest of the contig
+        bounds = index.split_contig("chr1", 1000000, 4, 0, index.get_base_cost(["chr1", "chr2"], [1000000, 100000]))
+        self.assertLessEqual(bounds[1], 100000)
@@ -0,0 +1,56 @@
+import unittest
+import math
+import shutil
+import tempfile
+
+from svim.SVSignature import SignatureDeletion, SignatureClusterUniLocal
+from svim.SVCandidate import CandidateDuplicationInterspersed
+from svim.SVIM_export import ColumnarExport, load_columnar, UNILOCAL_CLUSTER_COLUMNS, INTERSPERSED_DUPLICATION_CANDIDATE_COLUMNS
+
+class TestSVIMExport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        deletion1 = SignatureDeletion("chr1", 100, 300, "cigar", "read1")
+        deletion2 = SignatureDeletion("chr1", 110, 290, "cigar", "read2")
+        deletion3 = SignatureDeletion("chrU", 500, 800, "suppl", "read1")
+        self.clusters = [SignatureClusterUniLocal("chr1", 105, 295, 4.5, 190, [deletion1, deletion2], "del", 10.0, 5.0),
+                         SignatureClusterUniLocal("chrU", 500, 800, 1.0, 300, [deletion3], "del", None, None)]
+        self.candidates = [CandidateDuplicationInterspersed("chr2", 1000, 2000, "chr1", 105, 106, [deletion1], 2.0, 1.0, 2.0, cutpaste=True)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        export = ColumnarExport(self.directory, ["chr1", "chr2"])
+        export.add_table("del", self.clusters, UNILOCAL_CLUSTER_COLUMNS)
+        export.add_table("int_duplications", self.candidates, INTERSPERSED_DUPLICATION_CANDIDATE_COLUMNS)
+        export.write()
+
+        contigs, reads, tables = load_columnar(self.directory)
+        self.assertEqual(contigs.tolist(), [b"chr1", b"chr2", b"chrU"])
+        self.assertEqual(reads.tolist(), [b"read1", b"read2"])
+        deletions = tables["del"]
+        self.assertEqual(deletions["contig"].tolist(), [0, 2])
+        self.assertEqual(deletions["start"].tolist(), [105, 500])
+        self.assertEqual(deletions["size"].dtype.name, "int64")
+        self.assertEqual(deletions["score"].tolist(), [4.5, 1.0])
+        self.assertEqual(deletions["std_span"][0], 10.0)
+        self.assertTrue(math.isnan(deletions["std_pos"][1]))
+        self.assertEqual(deletions["member_offsets"].tolist(), [0, 2, 3])
+        self.assertEqual(deletions["member_reads"].tolist(), [0, 1, 0])
+        duplications = tables["int_duplications"]
+        self.assertEqual((duplications["source_contig"][0], duplications["dest_contig"][0]), (1, 0))
+        self.assertEqual(duplications["cutpaste"].tolist(), [True])
+
+    def test_empty_table(self):
+        export = ColumnarExport(self.directory, ["chr1"])
+        export.add_table("del", [], UNILOCAL_CLUSTER_COLUMNS)
+        export.write()
+        contigs, reads, tables = load_columnar(self.directory, mmap_mode=None)
+        self.assertEqual(len(tables["del"]["start"]), 0)
+        self.assertEqual(tables["del"]["member_offsets"].tolist(), [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
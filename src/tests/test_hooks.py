@@ -0,0 +1,96 @@
+import unittest
+
+from argparse import Namespace
+
+from svim.SVIM_hooks import register_hook, unregister_hook, clear_hooks, hooks, emit, ReadOnlyView, SequenceView, AbortPipeline
+from svim.SVIM_stats import RunStats
+from svim.SVIM_clustering import clusters_from_partitions
+from svim.SVSignature import SignatureDeletion, SignatureClusterUniLocal
+
+class TestSVIMHooks(unittest.TestCase):
+
+    def tearDown(self):
+        clear_hooks()
+
+    def test_register(self):
+        events = []
+        callback = lambda name: events.append(name)
+        register_hook("stage_started", callback)
+        emit("stage_started", "COLLECT")
+        emit("stage_finished", "COLLECT")
+        unregister_hook("stage_started", callback)
+        emit("stage_started", "CLUSTER")
+        self.assertEqual(events, ["COLLECT"])
+        self.assertEqual(hooks, {})
+        with self.assertRaises(ValueError):
+            register_hook("unknown", callback)
+
+    def test_stage_hooks(self):
+        events = []
+        register_hook("stage_started", lambda name: events.append(("started", name)))
+        register_hook("stage_finished", lambda name: events.append(("finished", name)))
+        stats = RunStats()
+        with stats.stage("CLUSTER"):
+            with stats.stage("del"):
+                pass
+        self.assertEqual(events, [("started", "CLUSTER"), ("started", "CLUSTER/del"), ("finished", "CLUSTER/del"), ("finished", "CLUSTER")])
+
+    def test_abort(self):
+        def abort(name):
+            raise AbortPipeline("stop")
+        register_hook("stage_started", abort)
+        stats = RunStats()
+        with self.assertRaises(AbortPipeline):
+            with stats.stage("COLLECT"):
+                pass
+        self.assertEqual(stats.get_current_stage(), None)
+
+    def test_views(self):
+        signatures = [SignatureDeletion("chr1", 100 * i, 100 * i + 50, "cigar", "read{0}".format(i)) for i in range(5)]
+        view = ReadOnlyView(signatures[0])
+        self.assertEqual(view.get_source(), ("chr1", 0, 50))
+        with self.assertRaises(AttributeError):
+            view.start = 10
+        sequence = SequenceView(signatures, 1, 4)
+        self.assertEqual(len(sequence), 3)
+        self.assertEqual([signature.read for signature in sequence], ["read1", "read2", "read3"])
+        self.assertEqual(sequence[-1].read, "read3")
+        self.assertEqual([signature.read for signature in sequence[1:]], ["read2", "read3"])
+        with self.assertRaises(IndexError):
+            sequence[3]
+        self.assertEqual(len(SequenceView([signatures])[0]), 5)
+
+    def test_view_mutation(self):
+        members = [SignatureDeletion("chr1", 100, 150, "cigar", "read{0}".format(i)) for i in range(2)]
+        cluster = SignatureClusterUniLocal("chr1", 100, 150, 2.0, 2, members, "del", 0.0, 0.0)
+        cluster.annotations = {"filter": "PASS"}
+        view = ReadOnlyView(cluster)
+        with self.assertRaises(AttributeError):
+            view.__dict__["start"] = 999
+        with self.assertRaises(AttributeError):
+            view._object.start = 999
+        with self.assertRaises(AttributeError):
+            view.members.append(members[0])
+        with self.assertRaises(AttributeError):
+            view.members[0].start = 999
+        with self.assertRaises(TypeError):
+            view.annotations["filter"] = "q20"
+        # Methods cannot modify the object through self
+        SignatureClusterUniLocal.reset_score = lambda self: setattr(self, "score", 0.0)
+        try:
+            with self.assertRaises(AttributeError):
+                view.reset_score()
+        finally:
+            del SignatureClusterUniLocal.reset_score
+        self.assertEqual((cluster.start, len(cluster.members), members[0].start, cluster.annotations["filter"], cluster.score), (100, 2, 100, "PASS", 2.0))
+        self.assertTrue(view.get_bed_entry().startswith("chr1\t100\t150"))
+        self.assertEqual(view.span_loc_distance(members[0], 900), cluster.span_loc_distance(members[0], 900))
+
+    def test_partition_clustered(self):
+        events = []
+        register_hook("partition_clustered", lambda stage, partition, clusters, cost: events.append((stage, len(partition), [len(cluster) for cluster in clusters], cost["edges"], cost["cliques"])))
+        partitions = [[SignatureDeletion("chr1", 1000, 1500, "cigar", "read{0}".format(i)) for i in range(3)],
+                      [SignatureDeletion("chr1", 9000, 9100, "cigar", "read3")]]
+        clusters = clusters_from_partitions(partitions, Namespace(distance_normalizer=900, cluster_max_distance=0.7, progress_interval=0))
+        self.assertEqual(events, [("CLUSTER", 3, [3], 3, 1), ("CLUSTER", 1, [1], 0, 1)])
+        self.assertEqual(len(clusters), 2)
@@ -0,0 +1,38 @@
+import unittest
+import os
+import tempfile
+
+from svim.SVIM_hotregions import HotRegionProfiler
+from svim.SVSignature import SignatureDeletion
+
+def cost(seconds, signatures):
+    return {"seconds": seconds, "signatures": signatures, "sampled_signatures": min(signatures, 100), "edges": signatures * 2, "cliques": 1}
+
+class TestSVIMHotRegions(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = HotRegionProfiler()
+        self.profiler.partition_clustered("CLUSTER/del", [SignatureDeletion("chr1", 100, 500, "cigar", "r1"), SignatureDeletion("chr1", 150, 700, "cigar", "r2")], [], cost(2.0, 2))
+        self.profiler.partition_clustered("CLUSTER/ins", [SignatureDeletion("chr1", 600, 900, "cigar", "r3")], [], cost(1.0, 1))
+        self.profiler.partition_clustered("CLUSTER/del", [SignatureDeletion("chr1", 5000, 5100, "cigar", "r4")], [], cost(0.5, 150))
+        self.profiler.partition_clustered("CLUSTER/inv", [SignatureDeletion("chr2", 10, 20, "cigar", "r5")], [], cost(4.0, 1))
+
+    def test_regions(self):
+        regions = self.profiler.get_regions()
+        self.assertEqual([(contig, start, end, stages) for contig, start, end, stages, costs in regions],
+                         [("chr1", 100, 900, "CLUSTER/del,CLUSTER/ins"), ("chr1", 5000, 5100, "CLUSTER/del"), ("chr2", 10, 20, "CLUSTER/inv")])
+        self.assertEqual(regions[0][4], {"seconds": 3.0, "partitions": 2, "signatures": 3, "sampled_signatures": 3, "edges": 6, "cliques": 2})
+        self.assertEqual(regions[1][4]["sampled_signatures"], 100)
+
+    def test_top(self):
+        self.assertEqual([region[0:3] for region in self.profiler.get_top_regions(2)], [("chr2", 10, 20), ("chr1", 100, 900)])
+        self.assertEqual([partition[0:3] for partition in self.profiler.get_top_partitions(2)], [("chr2", 10, 20), ("chr1", 100, 700)])
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.profiler.write(directory, 2)
+            with open(os.path.join(directory, "hot_regions.bed")) as bed_file:
+                lines = bed_file.read().splitlines()
+            self.assertEqual(lines[0].split("\t")[:5], ["#contig", "start", "end", "stages", "seconds"])
+            self.assertEqual(lines[2].split("\t"), ["chr1", "100", "900", "CLUSTER/del,CLUSTER/ins", "3.000000", "2", "3", "3", "6", "2"])
+            self.assertTrue(os.path.exists(os.path.join(directory, "hot_partitions.bed")))
@@ -0,0 +1,21 @@
+import unittest
+import os
+import sys
+import subprocess
+
+class TestImports(unittest.TestCase):
+
+    def test_no_heavy_imports(self):
+        """Importing the SVIM modules must not import heavy dependencies that are only needed on some code paths."""
+        source_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+        code = ("import sys\n"
+                "import svim.SVIM_input_parsing, svim.SVIM_alignment, svim.SVIM_COLLECT, svim.SVIM_CLUSTER, svim.SVIM_COMBINE, svim.SVIM_plot\n"
+                "print(','.join(sorted(module for module in ['pysam', 'networkx', 'numpy', 'matplotlib'] if module in sys.modules)))\n")
+        environment = dict(os.environ)
+        environment["PYTHONPATH"] = source_dir + os.pathsep + environment.get("PYTHONPATH", "")
+        output = subprocess.check_output([sys.executable, "-c", code], env=environment, universal_newlines=True)
+        self.assertEqual(output.strip(), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -47,3 +47,8 @@ class TestInputParsing(unittest.TestCase):
         self.assertEqual(type(options.sample), str)
         self.assertEqual(type(options.trans_partition_max_distance), int)
         self.assertEqual(type(options.trans_partition_max_distance), int)
+
+    def test_parse_arguments_report(self):
+        options = parse_arguments('0.4.4', ['report', 'myworkdir'])
+        self.assertEqual(options.sub, 'report')
+        self.assertTrue(options.working_dir.endswith('myworkdir'))
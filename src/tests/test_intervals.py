@@ -0,0 +1,58 @@
+import unittest
+
+from random import randint, seed
+
+from svim.SVIM_intervals import PositionIndex, SortedIntervals, join_overlapping, compact
+
+class TestSVIMIntervals(unittest.TestCase):
+
+    def generate_intervals(self, number, max_length):
+        intervals = []
+        for index in range(number):
+            contig = "chr{0}".format(randint(1, 3))
+            start = randint(0, 20000)
+            intervals.append((contig, start, start + randint(1, max_length)))
+        return intervals
+
+    def setUp(self):
+        seed(0)
+        self.left = self.generate_intervals(500, 1000)
+        self.right = self.generate_intervals(300, 5000)
+
+    def test_position_index(self):
+        positions = [("chr1", 100, 0), ("chr1", 50, 1), ("chr2", 100, 2), ("chr1", 200, 3), ("chr1", 151, 4)]
+        index = PositionIndex(positions)
+        self.assertEqual(sorted(index.within("chr1", 100, 50)), [0, 1])
+        self.assertEqual(sorted(index.within("chr1", 150, 50)), [0, 3, 4])
+        self.assertEqual(index.within("chr2", 0, 99), [])
+        self.assertEqual(index.within("chr3", 100, 1000), [])
+
+    def test_join_overlapping(self):
+        expected = set()
+        for left_index, (left_contig, left_start, left_end) in enumerate(self.left):
+            for right_index, (right_contig, right_start, right_end) in enumerate(self.right):
+                if left_contig == right_contig and left_start < right_end and right_start < left_end:
+                    expected.add((left_index, right_index))
+        pairs = list(join_overlapping(SortedIntervals(self.left), SortedIntervals(self.right)))
+        self.assertEqual(len(pairs), len(set(pairs)))
+        self.assertEqual(set(pairs), expected)
+
+    def test_join_overlapping_touching(self):
+        left = SortedIntervals([("chr1", 100, 200)])
+        right = SortedIntervals([("chr1", 0, 100), ("chr1", 200, 300), ("chr1", 199, 200), ("chr2", 100, 200)])
+        self.assertEqual(list(join_overlapping(left, right)), [(0, 2)])
+
+    def test_join_overlapping_predicate(self):
+        def similar_length(left_index, right_index):
+            return abs((self.left[left_index][2] - self.left[left_index][1]) - (self.right[right_index][2] - self.right[right_index][1])) < 100
+        pairs = set(join_overlapping(SortedIntervals(self.left), SortedIntervals(self.right)))
+        filtered_pairs = set(join_overlapping(SortedIntervals(self.left), SortedIntervals(self.right), similar_length))
+        self.assertEqual(filtered_pairs, set([pair for pair in pairs if similar_length(*pair)]))
+
+    def test_compact(self):
+        self.assertEqual(compact(["a", "b", "c", "d"], [3, 1, 3]), ["a", "c"])
+        self.assertEqual(compact(["a", "b"], []), ["a", "b"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import os
+import tempfile
+
+from argparse import Namespace
+
+from svim.SVIM_memory import MemoryBudget, MemoryBudgetError, SignatureSpillStore, parse_memory_size, estimate_signature_size
+from svim.SVIM_CLUSTER import cluster_sv_signatures, cluster_spilled_signatures
+from svim.SVSignature import SignatureDeletion, SignatureInsertion, SignatureTranslocation
+
+class TestSVIMMemory(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.signatures = []
+        for contig in ["chr2", "chr1"]:
+            for i in range(4):
+                self.signatures.append(SignatureDeletion(contig, 1000 + i, 1500 + i, "cigar", "read{0}".format(i)))
+                self.signatures.append(SignatureInsertion(contig, 8000 + i, 8100 + i, "cigar", "read{0}".format(i)))
+        self.signatures.append(SignatureTranslocation("chr2", 500, "fwd", "chr1", 700, "fwd", "suppl", "read9"))
+        self.signatures.append(SignatureTranslocation("chr1", 100, "fwd", "chr2", 300, "fwd", "suppl", "read8"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_parse_memory_size(self):
+        self.assertEqual(parse_memory_size("512"), 512)
+        self.assertEqual(parse_memory_size("2k"), 2048)
+        self.assertEqual(parse_memory_size("1.5G"), 1536 * 1024 * 1024)
+        self.assertEqual(parse_memory_size("16GB"), 16 * 1024 ** 3)
+        with self.assertRaises(ValueError):
+            parse_memory_size("lots")
+
+    def test_spill_store(self):
+        store = SignatureSpillStore(os.path.join(self.directory.name, "spill"))
+        store.spill(self.signatures[:6], 100)
+        store.spill(self.signatures[6:], 100)
+        self.assertEqual(store.get_contigs("del"), ["chr1", "chr2"])
+        self.assertEqual([signature.start for signature in store.load(("del", "chr2"))], [1000, 1001, 1002, 1003])
+        self.assertEqual([signature.contig1 for signature in store.load(("tra", ""))], ["chr2", "chr1"])
+        self.assertEqual(store.get_type_counts(), {"del": 8, "ins": 8, "tra": 2})
+        self.assertEqual(store.sizes[("ins", "chr1")], 400)
+        store.remove()
+        self.assertFalse(os.path.exists(store.directory))
+
+    def test_cluster_spilled(self):
+        options = Namespace(partition_max_distance=5000, distance_normalizer=900, cluster_max_distance=0.7, progress_interval=0)
+        budget = MemoryBudget(1024 ** 4, os.path.join(self.directory.name, "spill"))
+        signatures = list(self.signatures)
+        self.assertEqual(budget.check_collect(signatures), 0)
+        # Far below the budget, the signatures stay in memory
+        budget.finish_collect(signatures)
+        self.assertEqual(len(signatures), len(self.signatures))
+        self.assertEqual((budget.spills, budget.store.paths), (0, {}))
+        # Once a batch has been spilled, the rest is spilled at the end of COLLECT
+        budget.available = 1
+        first_batch = signatures[:6]
+        self.assertEqual(budget.check_collect(first_batch), 6)
+        rest = signatures[6:]
+        budget.finish_collect(rest)
+        self.assertEqual(rest, [])
+        self.assertEqual(sum(budget.store.get_type_counts().values()), len(self.signatures))
+        spilled_clusters = cluster_spilled_signatures(budget, options)
+        clusters = cluster_sv_signatures(self.signatures, options)
+        for spilled, in_memory in zip(spilled_clusters[:5], clusters[:5]):
+            self.assertEqual([cluster.get_bed_entry() for cluster in spilled], [cluster.get_bed_entry() for cluster in in_memory])
+        self.assertEqual(len(spilled_clusters[5]), len(clusters[5]))
+
+    def test_budget_exceeded(self):
+        with self.assertRaises(MemoryBudgetError):
+            MemoryBudget(1, os.path.join(self.directory.name, "spill"))
+        budget = MemoryBudget(1024 ** 4, os.path.join(self.directory.name, "spill"))
+        budget.max_memory = budget.baseline + estimate_signature_size(self.signatures) * 4
+        budget.available = budget.max_memory - budget.baseline
+        with self.assertRaises(MemoryBudgetError) as context:
+            budget.finish_collect(list(self.signatures))
+        self.assertIn("Increase --max_memory to at least", str(context.exception))
+
+    def test_budget_exceeded_by_clusters(self):
+        budget = MemoryBudget(1024 ** 4, os.path.join(self.directory.name, "spill"))
+        # Every chunk (four signatures) fits into the budget but not together with the clusters of the chunks before it
+        budget.max_memory = budget.baseline + estimate_signature_size(self.signatures) * 15
+        budget.available = budget.max_memory - budget.baseline
+        with self.assertRaises(MemoryBudgetError) as context:
+            budget.finish_collect(list(self.signatures))
+        self.assertIn("while the clusters of the previous contigs and types are held in memory", str(context.exception))
@@ -0,0 +1,45 @@
+import unittest
+
+from random import randint, seed
+
+from svim.SVIM_merging import flag_cutpaste_candidates
+from svim.SVIM_input_parsing import parse_arguments
+from svim.SVSignature import SignatureClusterUniLocal, SignatureClusterBiLocal
+
+class TestSVIMMerging(unittest.TestCase):
+
+    def setUp(self):
+        seed(0)
+        self.options = parse_arguments('0.4.3', ['alignment', 'myworkdir', 'mybamfile'])
+        self.deletion_clusters = []
+        for index in range(300):
+            contig = "chr{0}".format(randint(1, 2))
+            start = randint(0, 100000)
+            end = start + randint(50, 5000)
+            self.deletion_clusters.append(SignatureClusterUniLocal(contig, start, end, 10, 1, [], "del", None, None))
+        self.insertion_from_clusters = []
+        for index in range(300):
+            source_contig = "chr{0}".format(randint(1, 3))
+            source_start = randint(0, 100000)
+            source_end = source_start + randint(50, 5000)
+            dest_start = randint(0, 100000)
+            self.insertion_from_clusters.append(SignatureClusterBiLocal(source_contig, source_start, source_end, "chr1", dest_start, dest_start + source_end - source_start, 10, 1, [], "ins_dup", None, None))
+
+    def test_flag_cutpaste_candidates(self):
+        candidates = flag_cutpaste_candidates(self.insertion_from_clusters, self.deletion_clusters, self.options)
+        self.assertEqual(len(candidates), len(self.insertion_from_clusters))
+        for ins_cluster, candidate in zip(self.insertion_from_clusters, candidates):
+            closest_deletion = min([del_cluster.span_loc_distance(ins_cluster, self.options.distance_normalizer) for del_cluster in self.deletion_clusters])
+            self.assertEqual(candidate.cutpaste, closest_deletion <= self.options.del_ins_dup_max_distance)
+            self.assertEqual(candidate.get_source(), ins_cluster.get_source())
+            self.assertEqual(candidate.get_destination(), ins_cluster.get_destination())
+        self.assertTrue(any([candidate.cutpaste for candidate in candidates]))
+
+    def test_flag_cutpaste_candidates_without_deletions(self):
+        candidates = flag_cutpaste_candidates(self.insertion_from_clusters, [], self.options)
+        self.assertEqual(len(candidates), len(self.insertion_from_clusters))
+        self.assertFalse(any([candidate.cutpaste for candidate in candidates]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+import os
+import tempfile
+import time
+
+from unittest import mock
+
+from svim.SVIM_metrics import MetricsWriter, format_metric
+from svim.SVIM_progress import ProgressReporter, add_progress_listener, remove_progress_listener
+from svim.SVIM_stats import RunStats
+
+class Signature:
+    def __init__(self, type):
+        self.type = type
+
+class TestSVIMMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "metrics.prom")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_samples(self):
+        samples = {}
+        with open(self.path) as metrics_file:
+            for line in metrics_file:
+                if not line.startswith("#"):
+                    name, value = line.rsplit(" ", 1)
+                    samples[name] = float(value)
+        return samples
+
+    def test_format_metric(self):
+        self.assertEqual(format_metric("svim_stage", "gauge", "Stage.", [((("stage", "a\"b"),), 1), ((), None)]),
+                         "# HELP svim_stage Stage.\n# TYPE svim_stage gauge\nsvim_stage{stage=\"a\\\"b\"} 1\n")
+
+    def test_pipeline(self):
+        stats = RunStats()
+        metrics = MetricsWriter(self.path, 0)
+        stats.add_listener(metrics)
+        add_progress_listener(metrics)
+        try:
+            with stats.stage("COLLECT"):
+                samples = self.read_samples()
+                self.assertEqual(samples["svim_stage{stage=\"COLLECT\"}"], 1)
+                signatures = []
+                progress = ProgressReporter("COLLECT", 0, "reads", results=signatures)
+                signatures.extend([Signature("del"), Signature("ins")])
+                progress.update(10)
+                signatures.append(Signature("del"))
+                progress.finish(20)
+                samples = self.read_samples()
+                self.assertEqual(samples["svim_reads_processed_total"], 20)
+                self.assertEqual(samples["svim_signatures_total{type=\"del\"}"], 2)
+                self.assertEqual(samples["svim_signatures_total{type=\"ins\"}"], 1)
+            with stats.stage("CLUSTER"):
+                with stats.stage("del"):
+                    progress = ProgressReporter("CLUSTER/del", 0, "partitions", 8)
+                    progress.update(3)
+                    samples = self.read_samples()
+                    self.assertEqual(samples["svim_stage{stage=\"CLUSTER/del\"}"], 1)
+                    self.assertEqual(samples["svim_partitions_remaining{stage=\"CLUSTER/del\"}"], 5)
+                    self.assertIn("svim_throughput{stage=\"CLUSTER/del\",unit=\"partitions\"}", samples)
+        finally:
+            remove_progress_listener(metrics)
+        metrics.finish()
+        samples = self.read_samples()
+        self.assertEqual(samples["svim_stage{stage=\"none\"}"], 1)
+        self.assertEqual(samples["svim_finished"], 1)
+        self.assertEqual(os.listdir(self.directory.name), ["metrics.prom"])
+
+    def test_interval(self):
+        metrics = MetricsWriter(self.path, 3600)
+        metrics.progress_updated(ProgressReporter("COLLECT", 0, "reads"), 10, None)
+        self.assertFalse(os.path.exists(self.path))
+        metrics.finish()
+
+    def test_timer(self):
+        stats = RunStats()
+        metrics = MetricsWriter(self.path, 0.05)
+        stats.add_listener(metrics)
+        with stats.stage("COMBINE"):
+            timestamp = self.read_samples()["svim_last_update_timestamp_seconds"]
+            # No progress updates: the file is rewritten by the timer thread
+            time.sleep(0.3)
+            samples = self.read_samples()
+            self.assertGreater(samples["svim_last_update_timestamp_seconds"], timestamp)
+            self.assertGreater(samples["svim_stage_elapsed_seconds"], 0.1)
+            self.assertEqual(samples["svim_stage{stage=\"COMBINE\"}"], 1)
+        metrics.finish()
+        self.assertFalse(metrics.timer.is_alive())
+        self.assertEqual(self.read_samples()["svim_finished"], 1)
+
+    def test_peak_rss(self):
+        metrics = MetricsWriter(self.path, 0)
+        with mock.patch("svim.SVIM_metrics.get_current_rss", return_value=2048), mock.patch("svim.SVIM_metrics.get_peak_rss", return_value=1024):
+            metrics.write()
+        samples = self.read_samples()
+        self.assertEqual(samples["svim_resident_memory_bytes"], 2048)
+        self.assertEqual(samples["svim_peak_resident_memory_bytes"], 2048)
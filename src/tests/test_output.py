@@ -0,0 +1,126 @@
+import unittest
+import gzip
+import os
+import shutil
+import tempfile
+
+from random import randint, seed
+
+import pysam
+
+from svim.SVIM_output import IndexedWriter, PlainWriter, reg2bin, parse_vcf_interval, write_vcf_records, write_bed_file
+
+class Record:
+    def __init__(self, contig, position):
+        self.contig = contig
+        self.position = position
+
+    def get_vcf_entry(self):
+        return "{0}\t{1}\t.\tN\t<DEL>\t.\tPASS\tSVTYPE=DEL;END={2}".format(self.contig, self.position, self.position + 500)
+
+
+class TestSVIMOutput(unittest.TestCase):
+
+    def setUp(self):
+        seed(0)
+        self.directory = tempfile.mkdtemp()
+        self.header = ["##fileformat=VCFv4.2", "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO"]
+        self.contigs = ["chr2", "chr1", "chrX"]
+        self.records = [Record(self.contigs[randint(0, 2)], randint(1, 200000)) for index in range(3000)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, path, output):
+        for line in self.header:
+            output.write_header(line)
+        write_vcf_records(output, self.contigs, [(self.records[:1000], lambda record: record.contig),
+                                                 (self.records[1000:], lambda record: record.contig)])
+        output.close()
+
+    def test_progress(self):
+        class Progress:
+            updates = []
+            def update(self, items, work_done=None):
+                self.updates.append(items)
+        progress = Progress()
+        path = os.path.join(self.directory, "plain.vcf")
+        output = PlainWriter(path)
+        write_vcf_records(output, self.contigs, [(self.records, lambda record: record.contig)], progress)
+        output.close()
+        self.assertEqual(progress.updates, [1000, 2000, 3000])
+
+    def test_reg2bin(self):
+        self.assertEqual(reg2bin(0, 1, 14, 5), 4681)
+        self.assertEqual(reg2bin(0, 1 << 14, 14, 5), 4681)
+        self.assertEqual(reg2bin(0, (1 << 14) + 1, 14, 5), 585)
+        self.assertEqual(reg2bin(0, 1 << 29, 14, 5), 0)
+
+    def test_parse_vcf_interval(self):
+        self.assertEqual(parse_vcf_interval("chr1\t100\t.\tN\t<DEL>\t.\tPASS\tSVTYPE=DEL;END=600"), ("chr1", 99, 600))
+        self.assertEqual(parse_vcf_interval("chr1\t100\t.\tACG\tA\t.\tPASS\tSVTYPE=DEL"), ("chr1", 99, 102))
+
+    def test_plain_order(self):
+        path = os.path.join(self.directory, "plain.vcf")
+        self.write(path, PlainWriter(path))
+        with open(path) as vcf_file:
+            lines = [line.rstrip("\n") for line in vcf_file]
+        self.assertEqual(lines[:2], self.header)
+        positions = [(self.contigs.index(line.split("\t")[0]), int(line.split("\t")[1])) for line in lines[2:]]
+        self.assertEqual(len(positions), len(self.records))
+        self.assertEqual(positions, sorted(positions))
+
+    def test_compressed_matches_plain(self):
+        plain_path = os.path.join(self.directory, "plain.vcf")
+        self.write(plain_path, PlainWriter(plain_path))
+        for threads in [1, 4]:
+            path = os.path.join(self.directory, "compressed{0}.vcf.gz".format(threads))
+            self.write(path, IndexedWriter(path, "vcf", threads))
+            with gzip.open(path, "rt") as compressed_file, open(plain_path) as plain_file:
+                self.assertEqual(compressed_file.read(), plain_file.read())
+
+    def check_fetch(self, path, index_path):
+        self.assertTrue(os.path.exists(index_path))
+        tabix_file = pysam.TabixFile(path, index=index_path)
+        for query in range(50):
+            contig = self.contigs[randint(0, 2)]
+            start = randint(0, 200000)
+            end = start + randint(1, 20000)
+            expected = sorted([record.get_vcf_entry() for record in self.records if record.contig == contig and record.position - 1 < end and start < record.position + 500])
+            self.assertEqual(sorted(tabix_file.fetch(contig, start, end)), expected)
+        tabix_file.close()
+
+    def test_tabix_fetch(self):
+        path = os.path.join(self.directory, "indexed.vcf.gz")
+        self.write(path, IndexedWriter(path, "vcf"))
+        self.check_fetch(path, path + ".tbi")
+
+    def test_csi_fetch(self):
+        path = os.path.join(self.directory, "indexed.vcf.gz")
+        self.write(path, IndexedWriter(path, "vcf", max_contig_length=1 << 31))
+        self.check_fetch(path, path + ".csi")
+
+    def test_bed_file(self):
+        lines = ["{0}\t{1}\t{2}\tdel;{3}".format(record.contig, record.position, record.position + 500, index) for index, record in enumerate(self.records)]
+        path = os.path.join(self.directory, "del.bed")
+        write_bed_file(path, iter(lines), self.contigs)
+        with open(path) as bed_file:
+            self.assertEqual([line.rstrip("\n") for line in bed_file], lines)
+        write_bed_file(path, iter(lines), self.contigs, index=True, threads=2)
+        with gzip.open(path + ".gz", "rt") as bed_file:
+            written = [line.rstrip("\n") for line in bed_file]
+        self.assertEqual(sorted(written), sorted(lines))
+        positions = [(self.contigs.index(line.split("\t")[0]), int(line.split("\t")[1])) for line in written]
+        self.assertEqual(positions, sorted(positions))
+        tabix_file = pysam.TabixFile(path + ".gz")
+        for query in range(50):
+            contig = self.contigs[randint(0, 2)]
+            start = randint(0, 200000)
+            end = start + randint(1, 20000)
+            expected = sorted([line for line in lines if line.split("\t")[0] == contig and int(line.split("\t")[1]) < end and start < int(line.split("\t")[2])])
+            self.assertEqual(sorted(tabix_file.fetch(contig, start, end)), expected)
+        tabix_file.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
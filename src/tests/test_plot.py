@@ -0,0 +1,45 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from unittest import mock
+
+import numpy as np
+
+from svim.SVSignature import SignatureClusterUniLocal
+from svim.SVIM_plot import write_histograms, plot_histograms, get_log_scale_arguments
+
+class TestSVIMPlot(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.deletions = [SignatureClusterUniLocal("chr1", 100 * index, 100 * index + 50 + 10 * index, index % 7, 50 + 10 * index, [], "del", 0, 0) for index in range(30)]
+        self.clusters = (self.deletions, [], [], [], [], [])
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def test_write_histograms(self):
+        write_histograms(self.working_dir, self.clusters)
+        histograms = np.load(self.working_dir + "/signatures/signature_cluster_histograms.npz")
+        self.assertEqual(len(histograms["del_score_counts"]), 100)
+        self.assertEqual(len(histograms["del_size_edges"]), 21)
+        self.assertEqual(histograms["del_size_counts"].tolist(), np.histogram([cluster.end - cluster.start for cluster in self.deletions], bins=20)[0].tolist())
+        self.assertEqual(histograms["ins_score_counts"].sum(), 0)
+
+    def test_plot_histograms(self):
+        self.assertFalse(plot_histograms(self.working_dir))
+        write_histograms(self.working_dir, self.clusters)
+        self.assertTrue(plot_histograms(self.working_dir))
+        self.assertTrue(os.path.exists(self.working_dir + "/signatures/signature_cluster_histograms.pdf"))
+
+    def test_log_scale_arguments(self):
+        with mock.patch("matplotlib.__version__", "3.0.3"):
+            self.assertEqual(get_log_scale_arguments(), {'nonposy': 'clip'})
+        with mock.patch("matplotlib.__version__", "3.3.0rc1"):
+            self.assertEqual(get_log_scale_arguments(), {'nonpositive': 'clip'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import os
+import marshal
+import pstats
+import tempfile
+
+from collections import Counter
+
+from svim.SVIM_stats import RunStats
+from svim.SVIM_profile import DeterministicStageProfiler, SamplingStageProfiler, samples_to_pstats
+
+def busy(number):
+    return sum([index * index for index in range(number)])
+
+class TestSVIMProfile(unittest.TestCase):
+
+    def test_samples_to_pstats(self):
+        main = ("svim", 1, "main")
+        cluster = ("SVIM_clustering.py", 10, "cluster")
+        distance = ("SVSignature.py", 20, "distance")
+        samples = Counter({(distance, cluster, main): 3, (cluster, main): 1, (main,): 1})
+        stats = samples_to_pstats(samples, 0.01)
+        self.assertEqual(stats[main][:4], (5, 5, 0.01, 0.05))
+        self.assertEqual(stats[cluster][:4], (4, 4, 0.01, 0.04))
+        self.assertEqual(stats[distance][:4], (3, 3, 0.03, 0.03))
+        self.assertEqual(stats[distance][4], {cluster: (3, 3, 0.03, 0.03)})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "test.pstats")
+            with open(path, "wb") as profile_file:
+                marshal.dump(stats, profile_file)
+            self.assertAlmostEqual(pstats.Stats(path).total_tt, 0.05)
+
+    def test_deterministic_profiler(self):
+        with tempfile.TemporaryDirectory() as directory:
+            stats = RunStats()
+            stats.add_listener(DeterministicStageProfiler(directory, top=0))
+            with stats.stage("CLUSTER"):
+                busy(1000)
+                with stats.stage("del"):
+                    busy(2000)
+            self.assertEqual(sorted(os.listdir(directory)), ["CLUSTER.del.pstats", "CLUSTER.pstats"])
+            outer_functions = [function[2] for function in pstats.Stats(os.path.join(directory, "CLUSTER.pstats")).stats]
+            inner_functions = [function[2] for function in pstats.Stats(os.path.join(directory, "CLUSTER.del.pstats")).stats]
+            self.assertIn("busy", outer_functions)
+            self.assertIn("busy", inner_functions)
+
+    def test_sampling_profiler(self):
+        with tempfile.TemporaryDirectory() as directory:
+            stats = RunStats()
+            stats.add_listener(SamplingStageProfiler(directory, interval=0.001, top=0))
+            with stats.stage("COLLECT"):
+                busy(2000000)
+            profile = pstats.Stats(os.path.join(directory, "COLLECT.pstats"))
+            self.assertIn("busy", [function[2] for function in profile.stats])
+
+
+if __name__ == '__main__':
+    unittest.main()
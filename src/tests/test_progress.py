@@ -0,0 +1,49 @@
+import unittest
+
+from svim.SVIM_progress import ProgressReporter, StageProgressLogger, format_duration, format_bytes
+from svim.SVIM_stats import RunStats
+
+class TestSVIMProgress(unittest.TestCase):
+
+    def test_format(self):
+        self.assertEqual(format_duration(0), "0:00:00")
+        self.assertEqual(format_duration(3725.4), "1:02:05")
+        self.assertEqual(format_bytes(512), "512.0 B")
+        self.assertEqual(format_bytes(3 * 1024 * 1024), "3.0 MB")
+
+    def test_fraction_done(self):
+        reporter = ProgressReporter("COLLECT", 1, "reads", 1000, "bytes")
+        self.assertEqual(reporter.get_fraction_done(10, 250), 0.25)
+        self.assertEqual(reporter.get_fraction_done(10, 2000), 1.0)
+        self.assertEqual(reporter.get_fraction_done(10, None), None)
+        reporter = ProgressReporter("CLUSTER", 1, "partitions", 8)
+        self.assertEqual(reporter.get_fraction_done(2, None), 0.25)
+        reporter = ProgressReporter("COLLECT", 1, "reads")
+        self.assertEqual(reporter.get_fraction_done(2, None), None)
+
+    def test_report(self):
+        reporter = ProgressReporter("CLUSTER", 1e-9, "partitions", 4)
+        with self.assertLogs(level="INFO") as logs:
+            reporter.update(1)
+            reporter.finish(4)
+        self.assertEqual(reporter.reports, 1)
+        self.assertIn("CLUSTER: processed 1 partitions", logs.output[0])
+        self.assertIn("25.0% done, ETA", logs.output[0])
+        self.assertIn("CLUSTER: finished 4 partitions", logs.output[1])
+
+    def test_disabled(self):
+        reporter = ProgressReporter("CLUSTER", 0, "partitions", 4)
+        reporter.update(1)
+        reporter.finish(4)
+        self.assertEqual(reporter.reports, 0)
+
+    def test_stage_logger(self):
+        stats = RunStats()
+        stats.add_listener(StageProgressLogger())
+        with self.assertLogs(level="INFO") as logs:
+            with stats.stage("COMBINE"):
+                with stats.stage("write_vcf"):
+                    pass
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn("Finished stage COMBINE/write_vcf in 0:00:00", logs.output[0])
+        self.assertIn("Finished stage COMBINE in", logs.output[1])
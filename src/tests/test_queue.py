@@ -0,0 +1,81 @@
+import unittest
+import os
+import tempfile
+
+from time import sleep
+
+from svim.SVIM_queue import WorkQueue, QueueError, TaskLostError
+from svim.SVIM_shards import Shard
+
+class TestSVIMQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.queue = WorkQueue(os.path.join(self.directory.name, "queue"))
+        self.queue.create([("shard_0002", {"index": 2}), ("shard_0000", {"index": 0}), ("shard_0001", {"index": 1})], {"heartbeat_interval": 1.0})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_claim(self):
+        # Workers see the queue in the same state as the coordinator
+        worker_queue = WorkQueue(self.queue.directory)
+        self.assertEqual(worker_queue.get_settings()["tasks"], ["shard_0002", "shard_0000", "shard_0001"])
+        self.assertEqual(worker_queue.claim(), ("shard_0002", 1, {"index": 2}))
+        self.assertEqual(self.queue.claim(), ("shard_0000", 1, {"index": 0}))
+        self.assertEqual(worker_queue.claim(), ("shard_0001", 1, {"index": 1}))
+        self.assertIsNone(self.queue.claim())
+        for name in ["shard_0000", "shard_0001", "shard_0002"]:
+            self.assertFalse(self.queue.is_finished())
+            worker_queue.complete(name, 1, {"wall_time_s": 1.0})
+        self.assertTrue(self.queue.is_finished())
+        self.assertEqual(self.queue.get_results()["shard_0001"], {"wall_time_s": 1.0, "attempt": 1})
+        self.assertEqual(self.queue.list_tasks("claimed"), [])
+
+    def test_retry(self):
+        name, attempt, task = self.queue.claim()
+        self.assertEqual(self.queue.retry_tasks(3600, 3), [])
+        # A crashed worker stops its heartbeat
+        self.assertEqual(self.queue.retry_tasks(-1, 3), [("shard_0002", 2, "no heartbeat from the worker for 0 s")])
+        self.assertEqual(self.queue.claim(), ("shard_0002", 2, {"index": 2}))
+        self.queue.fail("shard_0002", 2, "RuntimeError: test")
+        self.assertEqual(self.queue.retry_tasks(3600, 3), [("shard_0002", 3, "RuntimeError: test")])
+        self.queue.claim()
+        self.queue.fail("shard_0002", 3, "RuntimeError: test")
+        with self.assertRaises(QueueError):
+            self.queue.retry_tasks(3600, 3)
+
+    def test_finished_after_retry(self):
+        self.queue.claim()
+        self.queue.retry_tasks(-1, 3)
+        # The previous worker finishes the task before the retry is claimed
+        self.queue.complete("shard_0002", 1, {"wall_time_s": 1.0})
+        self.assertEqual(self.queue.claim(), ("shard_0000", 1, {"index": 0}))
+        self.assertEqual(self.queue.list_tasks("pending"), [("shard_0001", 1, "shard_0001.1.task")])
+        self.queue.close()
+        self.assertTrue(self.queue.is_finished())
+
+    def test_overlapping_attempts(self):
+        self.queue.settings["heartbeat_interval"] = 0.01
+        name, attempt, task = self.queue.claim()
+        with self.queue.heartbeat(name, attempt) as first_heartbeat:
+            # The first attempt is considered crashed while it is still running
+            self.queue.retry_tasks(-1, 3)
+            self.assertEqual(self.queue.claim(), ("shard_0002", 2, {"index": 2}))
+            with self.queue.heartbeat(name, 2) as second_heartbeat:
+                for i in range(100):
+                    if first_heartbeat.lost.is_set():
+                        break
+                    sleep(0.01)
+                with self.assertRaises(TaskLostError):
+                    first_heartbeat.check()
+                second_heartbeat.check()
+            self.queue.complete(name, 2, {"wall_time_s": 1.0})
+        self.assertEqual(self.queue.get_results()[name]["attempt"], 2)
+        # Both attempts write into their own working directory
+        shard = Shard(2, [("chr1", 0, 1000, 1000)])
+        working_dirs = set()
+        for shard.attempt in [1, 2]:
+            working_dirs.add(shard.get_working_dir(self.directory.name))
+        self.assertEqual(working_dirs, set([os.path.join(self.directory.name, "shards", "shard_0002", "attempt_1"),
+                                            os.path.join(self.directory.name, "shards", "shard_0002", "attempt_2")]))
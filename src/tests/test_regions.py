@@ -0,0 +1,85 @@
+import unittest
+import os
+import tempfile
+import pysam
+
+from svim.SVIM_regions import parse_region, read_regions, GenomeRegions, ShardRegions
+from svim.SVIM_shards import Shard
+from svim.SVIM_COLLECT import analyze_alignment_file
+from svim.SVIM_input_parsing import parse_arguments
+
+class TestSVIMRegions(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.regions = GenomeRegions(["chr1", "chr2", "chr3"], [100000, 50000, 20000],
+                                     include=[("chr1", 10000, 40000), ("chr1", 30000, 60000), ("chr2", 0, None), ("chrX", 0, 100)],
+                                     exclude=[("chr1", 20000, 25000), ("chr2", 45000, 60000)], read_margin=1000)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_bam(self, name, sort_order):
+        """Write a read with a deletion in its primary alignment on chr1 that continues on chr2 and a read on chr3."""
+        header = {"HD": {"VN": "1.0", "SO": sort_order}, "SQ": [{"SN": "chr1", "LN": 100000}, {"SN": "chr2", "LN": 100000}, {"SN": "chr3", "LN": 100000}]}
+        alignments = [("read1", 0, 0, 10000, "2000M500D1000M3000S", "chr2,50001,+,3000S3000M,60,0;"),
+                      ("read1", 2048, 1, 50000, "3000S3000M", "chr1,10001,+,2000M500D1000M3000S,60,0;"),
+                      ("read2", 0, 2, 20000, "1000M200D1000M", None)]
+        if sort_order == "coordinate":
+            alignments.sort(key=lambda alignment: (alignment[2], alignment[3]))
+        path = os.path.join(self.directory.name, name)
+        with pysam.AlignmentFile(path, "wb", header=header) as bam:
+            for read_name, flag, reference_id, start, cigar, sa_tag in alignments:
+                alignment = pysam.AlignedSegment()
+                alignment.query_name = read_name
+                alignment.flag = flag
+                alignment.reference_id = reference_id
+                alignment.reference_start = start
+                alignment.mapping_quality = 60
+                alignment.cigarstring = cigar
+                if sa_tag != None:
+                    alignment.set_tag("SA", sa_tag)
+                bam.write(alignment)
+        if sort_order == "coordinate":
+            pysam.index(path)
+        return path
+
+    def test_parse_region(self):
+        self.assertEqual(parse_region("chr1"), ("chr1", 0, None))
+        self.assertEqual(parse_region("chr1:1001-2000"), ("chr1", 1000, 2000))
+        self.assertEqual(parse_region(" chr1:1001 "), ("chr1", 1000, None))
+        self.assertEqual(read_regions("chr1:1001-2000,chr2,"), [("chr1", 1000, 2000), ("chr2", 0, None)])
+        path = os.path.join(self.directory.name, "regions.bed")
+        with open(path, "w") as bed_file:
+            bed_file.write("track name=test\n# comment\nchr1\t1000\t2000\tname\nchr2\t0\t50\n")
+        self.assertEqual(read_regions(path), [("chr1", 1000, 2000), ("chr2", 0, 50)])
+
+    def test_genome_regions(self):
+        self.assertEqual(self.regions.intervals, {"chr1": [(10000, 20000), (25000, 60000)], "chr2": [(0, 45000)]})
+        self.assertEqual(self.regions.get_length(), 90000)
+        self.assertTrue(self.regions.contains("chr1", 10000))
+        self.assertFalse(self.regions.contains("chr1", 20000))
+        self.assertFalse(self.regions.contains("chr1", 9999))
+        self.assertFalse(self.regions.contains("chr3", 100))
+        # Alignments within read_margin of an analyzed region
+        self.assertTrue(self.regions.overlaps("chr1", 60500, 70000))
+        self.assertTrue(self.regions.overlaps("chr1", 20500, 24000))
+        self.assertFalse(self.regions.overlaps("chr1", 61000, 70000))
+        self.assertFalse(self.regions.overlaps("chr1", 0, 9000))
+        self.assertEqual(self.regions.get_read_regions(), [("chr1", 9000, 21000), ("chr1", 24000, 61000), ("chr2", 0, 46000)])
+        shard_regions = ShardRegions(Shard(0, [("chr1", 50000, 100000, 100000)], margin=100, read_margin=1000), self.regions)
+        self.assertEqual(shard_regions.get_read_regions(), [("chr1", 48900, 61000)])
+        self.assertFalse(shard_regions.overlaps("chr1", 0, 9000))
+        self.assertFalse(shard_regions.overlaps("chr1", 62000, 70000))
+
+    def test_collect_regions(self):
+        for sort_order in ["queryname", "coordinate"]:
+            path = self.write_bam(sort_order + ".bam", sort_order)
+            for arguments, expected in [([], ["del:chr1", "del:chr3", "tra:chr1"]),
+                                        (["--regions", "chr1:1-20000"], ["del:chr1", "tra:chr1"]),
+                                        (["--regions", "chr3", "--exclude", "chr3:21001-21200"], []),
+                                        (["--exclude", "chr1:12001-13000"], ["del:chr3", "tra:chr1"])]:
+                options = parse_arguments('0.4.3', ["alignment", self.directory.name, path, "--progress_interval", "0"] + arguments)
+                with pysam.AlignmentFile(path) as bam:
+                    signatures = analyze_alignment_file(bam, options)
+                self.assertEqual(sorted(signature.type + ":" + signature.get_source()[0] for signature in signatures), expected)
@@ -0,0 +1,119 @@
+import unittest
+import os
+import tempfile
+import pysam
+
+from random import Random
+
+from svim.SVIM_shards import Shard, get_shards, partition_window, reconcile_pending_signatures
+from svim.SVIM_clustering import form_partitions
+from svim.SVIM_COLLECT import analyze_alignment_file_querysorted, analyze_alignment_file_coordsorted
+from svim.SVIM_input_parsing import parse_arguments
+from svim.SVSignature import SignatureDeletion, SignatureInsertionFrom, SignatureTranslocation
+
+class TestSVIMShards(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.options = parse_arguments('0.4.3', ["alignment", self.directory.name, "input.bam", "--progress_interval", "0"])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_bam(self, name, sort_order):
+        """Write a read with a deletion in its primary alignment on chr1 that continues on chr2 and a read on chr3."""
+        header = {"HD": {"VN": "1.0", "SO": sort_order}, "SQ": [{"SN": "chr1", "LN": 100000}, {"SN": "chr2", "LN": 100000}, {"SN": "chr3", "LN": 100000}]}
+        alignments = [("read1", 0, 0, 10000, "2000M500D1000M3000S", "chr2,50001,+,3000S3000M,60,0;"),
+                      ("read1", 2048, 1, 50000, "3000S3000M", "chr1,10001,+,2000M500D1000M3000S,60,0;"),
+                      ("read2", 0, 2, 20000, "1000M200D1000M", None)]
+        if sort_order == "coordinate":
+            alignments.sort(key=lambda alignment: (alignment[2], alignment[3]))
+        path = os.path.join(self.directory.name, name)
+        with pysam.AlignmentFile(path, "wb", header=header) as bam:
+            for read_name, flag, reference_id, start, cigar, sa_tag in alignments:
+                alignment = pysam.AlignedSegment()
+                alignment.query_name = read_name
+                alignment.flag = flag
+                alignment.reference_id = reference_id
+                alignment.reference_start = start
+                alignment.mapping_quality = 60
+                alignment.cigarstring = cigar
+                if sa_tag != None:
+                    alignment.set_tag("SA", sa_tag)
+                bam.write(alignment)
+        if sort_order == "coordinate":
+            pysam.index(path)
+        return path
+
+    def collect(self, path, analyze, shard=None):
+        with pysam.AlignmentFile(path) as bam:
+            return sorted(signature.type + ":" + signature.get_source()[0] for signature in analyze(bam, self.options, shard=shard))
+
+    def test_get_shards(self):
+        shards = get_shards(["chr1", "chr2", "chrUn1", "chrUn2", "chrUn3", "chrM"], [1000, 800, 300, 400, 200, 50], 500)
+        self.assertEqual([shard.contigs for shard in shards], [["chr1"], ["chr2"], ["chrUn1", "chrUn2"], ["chrUn3", "chrM"]])
+        self.assertEqual(shards[2].name, "shard_0002")
+        self.assertFalse(shards[2].windowed)
+        self.assertEqual(shards[2].describe(), "chrUn1, chrUn2")
+
+    def test_get_shards_windows(self):
+        shards = get_shards(["chr1", "chr2"], [1000, 300], 500, window_size=400, margin=100)
+        self.assertEqual([shard.regions for shard in shards], [[("chr1", 0, 333)], [("chr1", 333, 666)], [("chr1", 666, 1000)], [("chr2", 0, 300)]])
+        self.assertEqual(shards[1].describe(), "chr1:333-666")
+        self.assertEqual(shards[1].views["chr1"], (233, 766))
+        # Windows are at least as long as the margin
+        self.assertEqual(len(get_shards(["chr1"], [1000], 500, window_size=100, margin=300)), 3)
+
+    def test_owns_signature(self):
+        shard = Shard(0, [("chr1", 0, 100000, 100000)])
+        self.assertTrue(shard.owns_signature(SignatureDeletion("chr1", 100, 200, "cigar", "read1")))
+        self.assertFalse(shard.owns_signature(SignatureDeletion("chr2", 100, 200, "cigar", "read1")))
+        # Interspersed duplications belong to the shard of their insertion, translocations to the shard of their first breakpoint
+        self.assertTrue(shard.owns_signature(SignatureInsertionFrom("chr2", 100, 200, "chr1", 500, "suppl", "read1")))
+        self.assertFalse(shard.owns_signature(SignatureInsertionFrom("chr1", 100, 200, "chr2", 500, "suppl", "read1")))
+        self.assertFalse(shard.owns_signature(SignatureTranslocation("chr2", 100, "fwd", "chr1", 500, "fwd", "suppl", "read1")))
+        self.assertTrue(shard.covers_signature(SignatureTranslocation("chr2", 100, "fwd", "chr1", 500, "fwd", "suppl", "read1")))
+        # Signatures in the margin of a window are kept but owned by the neighboring window
+        window = Shard(1, [("chr1", 1000, 2000, 100000)], margin=300)
+        self.assertTrue(window.covers_signature(SignatureDeletion("chr1", 800, 1000, "cigar", "read1")))
+        self.assertFalse(window.owns_signature(SignatureDeletion("chr1", 800, 1000, "cigar", "read1")))
+        self.assertFalse(window.covers_signature(SignatureDeletion("chr1", 500, 700, "cigar", "read1")))
+
+    def test_window_partitions(self):
+        rng = Random(5)
+        signatures = []
+        position = 0
+        for i in range(2000):
+            # Dense stretches without gaps of more than max_delta and a few gaps in between
+            position += rng.randint(1000, 8000) if rng.random() < 0.05 else rng.randint(0, 300)
+            signatures.append(SignatureDeletion("chr1", position, position + rng.randint(50, 500), "cigar", "read{0}".format(i)))
+        contig_length = position + 1000
+        max_delta = 1000
+        expected = form_partitions(signatures, max_delta)
+        shards = get_shards(["chr1"], [contig_length], contig_length, window_size=contig_length // 20, margin=max_delta + 200)
+        partitions = []
+        windows = []
+        for shard in shards:
+            window_partitions, pending, last_start = partition_window(shard.select_signatures(signatures), shard, "chr1", max_delta)
+            partitions.extend(window_partitions)
+            windows.append((pending, last_start))
+        reconciled = reconcile_pending_signatures(windows, max_delta)
+        self.assertTrue(len(reconciled) > 0)
+        partitions.extend(reconciled)
+        partitions.sort(key=lambda partition: partition[0].get_sort_key())
+        self.assertEqual([[signature.read for signature in partition] for partition in partitions],
+                         [[signature.read for signature in partition] for partition in expected])
+
+    def test_collect_shards(self):
+        for sort_order, analyze in [("queryname", analyze_alignment_file_querysorted), ("coordinate", analyze_alignment_file_coordsorted)]:
+            path = self.write_bam(sort_order + ".bam", sort_order)
+            unsharded = self.collect(path, analyze)
+            self.assertEqual(unsharded, ["del:chr1", "del:chr3", "tra:chr1"])
+            self.assertEqual(self.collect(path, analyze, Shard(0, [("chr1", 0, 100000, 100000)])), ["del:chr1", "tra:chr1"])
+            # The read is analyzed on chr2 from its supplementary alignment
+            self.assertEqual(self.collect(path, analyze, Shard(1, [("chr2", 0, 100000, 100000)])), ["tra:chr1"])
+            self.assertEqual(self.collect(path, analyze, Shard(2, [("chr3", 0, 100000, 100000)])), ["del:chr3"])
+            self.assertEqual(self.collect(path, analyze, Shard(3, [("chr1", 0, 100000, 100000), ("chr2", 0, 100000, 100000), ("chr3", 0, 100000, 100000)])), unsharded)
+            # Windows keep the signatures in their view and analyze the reads with an alignment near it
+            self.assertEqual(self.collect(path, analyze, Shard(4, [("chr1", 30000, 60000, 100000)], margin=1000, read_margin=5000)), [])
+            self.assertEqual(self.collect(path, analyze, Shard(5, [("chr1", 0, 10000, 100000)], margin=3000)), ["del:chr1"])
@@ -0,0 +1,68 @@
+import unittest
+import os
+import json
+import tempfile
+
+from svim.SVIM_stats import RunStats, summarize_sizes, get_run_stats, reset_run_stats, get_current_rss
+
+class TestSVIMStats(unittest.TestCase):
+
+    def test_stages(self):
+        stats = RunStats()
+        stats.count("ignored")
+        with stats.stage("CLUSTER"):
+            stats.count("partitions", 2)
+            with stats.stage("del"):
+                self.assertEqual(stats.get_current_stage(), "CLUSTER/del")
+                stats.count("partitions", 3)
+                stats.count("partitions")
+            stats.set("clusters", 5)
+        self.assertEqual(stats.get_current_stage(), None)
+        self.assertEqual([stage["name"] for stage in stats.stages], ["CLUSTER", "CLUSTER/del"])
+        self.assertEqual(stats.stages[0]["counters"], {"partitions": 2, "clusters": 5})
+        self.assertEqual(stats.stages[1]["counters"], {"partitions": 4})
+        self.assertGreaterEqual(stats.stages[0]["wall_time_s"], stats.stages[1]["wall_time_s"])
+
+    def test_stage_exception(self):
+        stats = RunStats()
+        with self.assertRaises(ValueError):
+            with stats.stage("COLLECT"):
+                raise ValueError()
+        self.assertEqual(stats.get_current_stage(), None)
+        self.assertIn("wall_time_s", stats.stages[0])
+
+    @unittest.skipIf(get_current_rss() == None, "resident set size not available")
+    def test_stage_peak_rss(self):
+        stats = RunStats()
+        with stats.stage("CLUSTER"):
+            with stats.stage("del"):
+                data = b"x" * (256 * 1024 * 1024)
+            del data
+        with stats.stage("COMBINE"):
+            pass
+        # The peak of a stage is not the peak of the process so far
+        self.assertEqual(stats.stages[0]["peak_rss_bytes"], stats.stages[1]["peak_rss_bytes"])
+        self.assertGreater(stats.stages[0]["peak_rss_bytes"], stats.stages[2]["peak_rss_bytes"] + 128 * 1024 * 1024)
+
+    def test_summarize_sizes(self):
+        self.assertEqual(summarize_sizes([]), {"count": 0})
+        summary = summarize_sizes([5, 1, 3, 2, 4])
+        self.assertEqual((summary["min"], summary["median"], summary["max"], summary["total"], summary["mean"]), (1, 3, 5, 15, 3.0))
+
+    def test_write(self):
+        stats = reset_run_stats()
+        self.assertIs(get_run_stats(), stats)
+        with stats.stage("COMBINE"):
+            stats.set("candidates", 7)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run_report.json")
+            stats.write(path, version="test")
+            with open(path) as report_file:
+                report = json.load(report_file)
+        self.assertEqual(report["version"], "test")
+        self.assertEqual(report["stages"][0]["counters"]["candidates"], 7)
+        self.assertIn("peak_rss_bytes", report)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import os
+import tempfile
+import pysam
+
+from svim.SVIM_input_parsing import parse_arguments
+from svim.SVIM_sweep import get_configurations, run_sweep
+
+class TestSVIMSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.bam_path = os.path.join(self.directory.name, "input.bam")
+        header = {"HD": {"VN": "1.0", "SO": "queryname"}, "SQ": [{"SN": "chr1", "LN": 100000}]}
+        with pysam.AlignmentFile(self.bam_path, "wb", header=header) as bam:
+            for index in range(5):
+                alignment = pysam.AlignedSegment()
+                alignment.query_name = "read{0}".format(index)
+                alignment.reference_id = 0
+                alignment.reference_start = 10000 + 10 * index
+                alignment.mapping_quality = 60
+                alignment.cigarstring = "2000M500D1000M"
+                bam.write(alignment)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_configurations(self):
+        options = parse_arguments('0.4.3', ["sweep", self.directory.name, self.bam_path, "--cluster_max_distance", "0.3,0.5", "--trans_sv_max_distance", "300,500,700"])
+        configurations = get_configurations(options)
+        self.assertEqual(len(configurations), 6)
+        self.assertEqual(configurations[0][0], "config_0001")
+        self.assertEqual(configurations[0][1]["partition_max_distance"], 5000)
+        # Configurations with the same CLUSTER parameters are consecutive
+        self.assertEqual([parameters["cluster_max_distance"] for name, parameters in configurations], [0.3, 0.3, 0.3, 0.5, 0.5, 0.5])
+        self.assertEqual([parameters["trans_sv_max_distance"] for name, parameters in configurations[:3]], [300, 500, 700])
+
+    def test_run_sweep(self):
+        options = parse_arguments('0.4.3', ["sweep", self.directory.name, self.bam_path, "--cluster_max_distance", "0.3,0.7", "--progress_interval", "0"])
+        run_sweep(options, '0.4.3')
+        with open(os.path.join(self.directory.name, "sweep", "sweep_report.tsv")) as report_file:
+            rows = [line.rstrip("\n").split("\t") for line in report_file]
+        self.assertEqual([row[0] for row in rows], ["configuration", "config_0001", "config_0002"])
+        self.assertEqual(rows[1][rows[0].index("del")], "1")
+        for name in ["config_0001", "config_0002"]:
+            self.assertTrue(os.path.exists(os.path.join(self.directory.name, "sweep", name, "final_results.vcf")))
+        # The signatures are saved for later sweeps on the same input
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, "checkpoints", "collect.json")))
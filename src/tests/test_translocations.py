@@ -0,0 +1,53 @@
+import unittest
+import pickle
+
+from svim.SVSignature import SignatureTranslocation
+from svim.SVIM_translocations import CompletedTranslocations, TranslocationBreakpointIndex
+
+class TestSVIMTranslocations(unittest.TestCase):
+
+    def setUp(self):
+        self.translocations = [SignatureTranslocation("chr1", 1000, "fwd", "chr2", 5000, "fwd", "suppl", "read1"),
+                               SignatureTranslocation("chr1", 1100, "fwd", "chr2", 5010, "fwd", "suppl", "read2"),
+                               SignatureTranslocation("chr1", 1050, "fwd", "chr2", 5020, "fwd", "suppl", "read3"),
+                               SignatureTranslocation("chr1", 9000, "fwd", "chr2", 100, "fwd", "suppl", "read4"),
+                               SignatureTranslocation("chr1", 9100, "fwd", "chr3", 100, "fwd", "suppl", "read5"),
+                               SignatureTranslocation("chr1", 3000, "rev", "chr2", 100, "rev", "suppl", "read6"),
+                               SignatureTranslocation("chr1", 3000, "fwd", "chr2", 100, "rev", "suppl", "read7")]
+        self.index = TranslocationBreakpointIndex(self.translocations, "fwd", 200, 1000)
+
+    def test_partitions(self):
+        self.assertEqual([translocation.read for translocation in self.index.get_members("chr1", 0)], ["read1", "read3", "read2"])
+        self.assertEqual([translocation.read for translocation in self.index.get_members("chr1", 1)], ["read4", "read5"])
+        self.assertEqual(self.index.get_mean("chr1", 0), 1050)
+        self.assertEqual(self.index.get_std("chr1", 0), 41)
+        self.assertEqual(self.index.get_mean("chr1", 1), 9050)
+
+    def test_get_closest_partition(self):
+        self.assertEqual(self.index.get_closest_partition("chr1", 0), 0)
+        self.assertEqual(self.index.get_closest_partition("chr1", 6000), 1)
+        self.assertEqual(self.index.get_closest_partition("chr2", 6000), None)
+
+    def test_get_destination(self):
+        self.assertEqual(self.index.get_destination("chr1", 0), ("chr2", 5010, 8))
+        self.assertEqual(self.index.get_destination("chr1", 1), None)
+
+    def test_completed_translocations(self):
+        completed = CompletedTranslocations(self.translocations[:2])
+        self.assertEqual(len(completed), 4)
+        self.assertIs(completed[0], self.translocations[0])
+        reversed_translocation = completed[3]
+        self.assertEqual((reversed_translocation.contig1, reversed_translocation.pos1, reversed_translocation.direction1), ("chr2", 5010, "rev"))
+        self.assertEqual((reversed_translocation.contig2, reversed_translocation.pos2, reversed_translocation.direction2), ("chr1", 1100, "rev"))
+        self.assertEqual(reversed_translocation.as_string(), "chr2:5010-5011\tchr1:1100-1101\ttra;suppl\tread2")
+        self.assertEqual(reversed_translocation.get_key(), ("tra", "chr2", 5010))
+        self.assertEqual([translocation.read for translocation in completed], ["read1", "read2", "read1", "read2"])
+        self.assertEqual(completed[-1].read, "read2")
+        with self.assertRaises(IndexError):
+            completed[4]
+        unpickled = pickle.loads(pickle.dumps(completed))
+        self.assertEqual(unpickled[3].as_string(), reversed_translocation.as_string())
+
+
+if __name__ == '__main__':
+    unittest.main()